@@ -134,6 +134,23 @@ PycCollectionAttr = enum(
     is_pyc_collection_enabled = _pyc_collection_attr_is_pyc_collection_enabled,
 )
 
+def _coverage_branch_attr_is_enabled(ctx):
+    coverage_branch = ctx.attr.coverage_branch
+    if coverage_branch == CoverageBranchAttr.INHERIT:
+        return ctx.attr._coverage_branch_flag[BuildSettingInfo].value
+    return coverage_branch == CoverageBranchAttr.ENABLED
+
+# buildifier: disable=name-conventions
+CoverageBranchAttr = enum(
+    # Determine the effective value from --coverage_branch
+    INHERIT = "inherit",
+    # Measure branch coverage in addition to line coverage.
+    ENABLED = "enabled",
+    # Only measure line coverage.
+    DISABLED = "disabled",
+    is_enabled = _coverage_branch_attr_is_enabled,
+)
+
 def copy_common_binary_kwargs(kwargs):
     return {
         key: kwargs[key]
@@ -344,6 +361,10 @@ files that may be needed at run time belong in `data`.
         "srcs_version": lambda: attrb.String(
             doc = "Defunct, unused, does nothing.",
         ),
+        "_precompile_batch_size_flag": lambda: attrb.Label(
+            default = labels.PRECOMPILE_BATCH_SIZE,
+            providers = [BuildSettingInfo],
+        ),
         "_precompile_flag": lambda: attrb.Label(
             default = labels.PRECOMPILE,
             providers = [BuildSettingInfo],
@@ -10,17 +10,21 @@ labels = struct(
     BUILD_PYTHON_ZIP = str(Label("//python/config_settings:build_python_zip")),
     # NOTE: Special target; see definition for details.
     BUILD_RUNFILE_LINKS = str(Label("//command_line_option:build_runfile_links")),
+    COVERAGE_BRANCH = str(Label("//python/config_settings:coverage_branch")),
+    COVERAGE_CORE = str(Label("//python/config_settings:coverage_core")),
     DEBUGGER = str(Label("//python/config_settings:debugger")),
     # NOTE: Special target; see definition for details.
     ENABLE_RUNFILES = str(Label("//command_line_option:enable_runfiles")),
     EXEC_TOOLS_TOOLCHAIN = str(Label("//python/config_settings:exec_tools_toolchain")),
     EXTRA_TOOLCHAINS = str(Label("//command_line_option:extra_toolchains")),
+    IMPORT_INDEX = str(Label("//python/config_settings:experimental_import_index")),
     NONE = str(Label("//python:none")),
     PIP_ENV_MARKER_CONFIG = str(Label("//python/config_settings:pip_env_marker_config")),
     PIP_WHL_OSX_VERSION = str(Label("//python/config_settings:pip_whl_osx_version")),
     PLATFORMS_OS_MACOS = str(Label("@platforms//os:macos")),
     PLATFORMS_OS_WINDOWS = str(Label("@platforms//os:windows")),
     PRECOMPILE = str(Label("//python/config_settings:precompile")),
+    PRECOMPILE_BATCH_SIZE = str(Label("//python/config_settings:precompile_batch_size")),
     PRECOMPILE_SOURCE_RETENTION = str(Label("//python/config_settings:precompile_source_retention")),
     PYC_COLLECTION = str(Label("//python/config_settings:pyc_collection")),
     PYTHON_IMPORT_ALL_REPOSITORIES = str(Label("//python/config_settings:experimental_python_import_all_repositories")),
@@ -108,6 +108,25 @@ ValidateTestMainFlag = FlagEnum(
     is_enabled = _ValidateTestMainFlag_is_enabled,
 )
 
+def _CoverageCoreFlag_get_value(ctx):
+    return ctx.attr._coverage_core_flag[BuildSettingInfo].value
+
+# Determines which coverage.py core (tracing backend) collects coverage.
+# buildifier: disable=name-conventions
+CoverageCoreFlag = FlagEnum(
+    # Let coverage.py decide, e.g. from the `COVERAGE_CORE` environment
+    # variable.
+    AUTO = "auto",
+    # Use the C extension tracer (`sys.settrace`-based).
+    CTRACE = "ctrace",
+    # Use the pure-Python tracer.
+    PYTRACE = "pytrace",
+    # Use `sys.monitoring` (PEP 669) on Python 3.12+. Older Python versions
+    # behave as if `auto` was used.
+    SYSMON = "sysmon",
+    get_value = _CoverageCoreFlag_get_value,
+)
+
 def _string_flag_impl(ctx):
     if ctx.attr.override:
         value = ctx.attr.override
@@ -70,24 +70,34 @@ def maybe_precompile(ctx, srcs):
         pyc_files = [],
         py_to_pyc_map = {},
     )
+    to_compile = []
     for src in srcs:
         if should_precompile:
-            # NOTE: _precompile() may return None
-            pyc = _precompile(ctx, src, use_pycache = keep_source)
+            # NOTE: _declare_pyc() may return None
+            pyc = _declare_pyc(ctx, src, use_pycache = keep_source)
         else:
             pyc = None
 
         if pyc:
             result.pyc_files.append(pyc)
             result.py_to_pyc_map[src] = pyc
+            to_compile.append((src, pyc))
 
         if keep_source or not pyc:
             result.keep_srcs.append(src)
 
+    # Batching amortizes the per-action overhead (scheduling, sandbox setup,
+    # worker request) over many files, e.g. for the sources of a whole wheel.
+    batch_size = ctx.attr._precompile_batch_size_flag[BuildSettingInfo].value
+    if batch_size <= 0:
+        batch_size = max(len(to_compile), 1)
+    for start in range(0, len(to_compile), batch_size):
+        _precompile(ctx, to_compile[start:start + batch_size])
+
     return result
 
-def _precompile(ctx, src, *, use_pycache):
-    """Compile a py file to pyc.
+def _declare_pyc(ctx, src, *, use_pycache):
+    """Declares the pyc file a py file is compiled to.
 
     Args:
         ctx: rule context.
@@ -97,7 +107,7 @@ def _precompile(ctx, src, *, use_pycache):
             file.
 
     Returns:
-        File of the generated pyc file.
+        File of the pyc file to generate, or None if it can't be generated.
     """
 
     # Generating a file in another package is an error, so we have to skip
@@ -105,6 +115,46 @@ def _precompile(ctx, src, *, use_pycache):
     if ctx.label.package != src.owner.package:
         return None
 
+    target_toolchain = ctx.toolchains[TARGET_TOOLCHAIN_TYPE].py3_runtime
+
+    stem = src.basename[:-(len(src.extension) + 1)]
+    if use_pycache:
+        if not hasattr(target_toolchain, "pyc_tag") or not target_toolchain.pyc_tag:
+            # This is likely one of two situations:
+            # 1. The pyc_tag attribute is missing because it's the Bazel-builtin
+            #    PyRuntimeInfo object.
+            # 2. It's a "runtime toolchain", i.e. the autodetecting toolchain,
+            #    or some equivalent toolchain that can't assume to know the
+            #    runtime Python version at build time.
+            # Instead of failing, just don't generate any pyc.
+            return None
+        pyc_path = "__pycache__/{stem}.{tag}.pyc".format(
+            stem = stem,
+            tag = target_toolchain.pyc_tag,
+        )
+    else:
+        pyc_path = "{}.pyc".format(stem)
+
+    return ctx.actions.declare_file(pyc_path, sibling = src)
+
+# The number of processes the precompiler's persistent worker compiles a
+# request on by default; see _DEFAULT_WORKER_JOBS in precompiler.py.
+_PRECOMPILER_WORKER_JOBS = 4
+
+def _precompiler_worker_resource_set(_os, _inputs_size):
+    return {"cpu": _PRECOMPILER_WORKER_JOBS}
+
+def _map_short_path(file):
+    return file.short_path
+
+def _precompile(ctx, src_pycs):
+    """Compile py files to pyc files in a single action.
+
+    Args:
+        ctx: rule context.
+        src_pycs: list of (File, File) tuples of the py file to compile and
+            the pyc file to generate from it.
+    """
     exec_tools_info = ctx.toolchains[EXEC_TOOLS_TOOLCHAIN_TYPE].exec_tools
     target_toolchain = ctx.toolchains[TARGET_TOOLCHAIN_TYPE].py3_runtime
 
@@ -132,25 +182,11 @@ def _precompile(ctx, src, *, use_pycache):
             precompiler,
         ))
 
-    stem = src.basename[:-(len(src.extension) + 1)]
-    if use_pycache:
-        if not hasattr(target_toolchain, "pyc_tag") or not target_toolchain.pyc_tag:
-            # This is likely one of two situations:
-            # 1. The pyc_tag attribute is missing because it's the Bazel-builtin
-            #    PyRuntimeInfo object.
-            # 2. It's a "runtime toolchain", i.e. the autodetecting toolchain,
-            #    or some equivalent toolchain that can't assume to know the
-            #    runtime Python version at build time.
-            # Instead of failing, just don't generate any pyc.
-            return None
-        pyc_path = "__pycache__/{stem}.{tag}.pyc".format(
-            stem = stem,
-            tag = target_toolchain.pyc_tag,
-        )
-    else:
-        pyc_path = "{}.pyc".format(stem)
-
-    pyc = ctx.actions.declare_file(pyc_path, sibling = src)
+    # The precompiler's pyc cache is local and shared between builds, so it's
+    # opt-in using e.g. `--action_env=RULES_PYTHON_PRECOMPILE_CACHE_DIR=...`.
+    for key in ("RULES_PYTHON_PRECOMPILE_CACHE_DIR", "RULES_PYTHON_PRECOMPILE_CACHE_MAX_BYTES"):
+        if key in ctx.configuration.default_shell_env:
+            env[key] = ctx.configuration.default_shell_env[key]
 
     invalidation_mode = ctx.attr.precompile_invalidation_mode
     if invalidation_mode == PrecompileInvalidationModeAttr.AUTO:
@@ -173,28 +209,47 @@ def _precompile(ctx, src, *, use_pycache):
     precompile_request_args.use_param_file("@%s", use_always = True)
     precompile_request_args.set_param_file_format("multiline")
 
+    srcs = [src for src, _ in src_pycs]
+    pycs = [pyc for _, pyc in src_pycs]
     precompile_request_args.add("--invalidation_mode", invalidation_mode)
-    precompile_request_args.add("--src", src)
+
+    # NOTE: The --src, --src_name, and --pyc values are matched up by their
+    # position.
+    precompile_request_args.add_all(srcs, before_each = "--src")
 
     # NOTE: src.short_path is used because src.path contains the platform and
     # build-specific hash portions of the path, which we don't want in the
     # pyc data. Note, however, for remote-remote files, short_path will
     # have the repo name, which is likely to contain extraneous info.
-    precompile_request_args.add("--src_name", src.short_path)
-    precompile_request_args.add("--pyc", pyc)
+    precompile_request_args.add_all(srcs, before_each = "--src_name", map_each = _map_short_path)
+    precompile_request_args.add_all(pycs, before_each = "--pyc")
     precompile_request_args.add("--optimize", str(ctx.attr.precompile_optimize_level))
 
     version_info = target_toolchain.interpreter_version_info
     python_version = "{}.{}".format(version_info.major, version_info.minor)
     precompile_request_args.add("--python_version", python_version)
 
+    if len(src_pycs) == 1:
+        progress_message = "Python precompiling %{input} into %{output}"
+    else:
+        progress_message = "Python precompiling {} files for %{{label}}".format(len(src_pycs))
+
+    # A worker compiles a request with several files on its process pool. A
+    # single file is compiled in the worker process itself.
+    resource_set = None
+    if len(src_pycs) > 1 and (
+        execution_requirements.get("supports-workers") == "1" or
+        execution_requirements.get("supports-multiplex-workers") == "1"
+    ):
+        resource_set = _precompiler_worker_resource_set
+
     ctx.actions.run(
         executable = precompiler_executable,
         arguments = [precompiler_startup_args, precompile_request_args],
-        inputs = [src],
-        outputs = [pyc],
+        inputs = srcs,
+        outputs = pycs,
         mnemonic = "PyCompile",
-        progress_message = "Python precompiling %{input} into %{output}",
+        progress_message = progress_message,
         tools = tools,
         env = env | {
             "PYTHONHASHSEED": "0",  # Helps avoid non-deterministic behavior
@@ -202,6 +257,6 @@ def _precompile(ctx, src, *, use_pycache):
             "PYTHONSAFEPATH": "1",  # Helps avoid incorrect import issues
         },
         execution_requirements = execution_requirements,
+        resource_set = resource_set,
         toolchain = EXEC_TOOLS_TOOLCHAIN_TYPE,
     )
-    return pyc
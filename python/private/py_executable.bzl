@@ -25,6 +25,7 @@ load(
     "AGNOSTIC_EXECUTABLE_ATTRS",
     "COMMON_ATTRS",
     "COVERAGE_ATTRS",
+    "CoverageBranchAttr",
     "IMPORTS_ATTRS",
     "PY_SRCS_ATTRS",
     "PrecompileAttr",
@@ -58,7 +59,7 @@ load(
     "runfiles_root_path",
 )
 load(":common_labels.bzl", "labels")
-load(":flags.bzl", "BootstrapImplFlag", "ValidateTestMainFlag", "VenvsUseDeclareSymlinkFlag", "read_possibly_native_flag")
+load(":flags.bzl", "BootstrapImplFlag", "CoverageCoreFlag", "ValidateTestMainFlag", "VenvsUseDeclareSymlinkFlag", "read_possibly_native_flag")
 load(":precompile.bzl", "maybe_precompile")
 load(":py_cc_link_params_info.bzl", "PyCcLinkParamsInfo")
 load(":py_executable_info.bzl", "PyExecutableInfo")
@@ -93,6 +94,30 @@ EXECUTABLE_ATTRS = dicts.add(
         "_python_path_flag": attr.label(default = "//python/config_settings:python_path"),
     },
     {
+        "coverage_branch": lambda: attrb.String(
+            default = CoverageBranchAttr.INHERIT,
+            values = sorted(CoverageBranchAttr.__members__.values()),
+            doc = """
+Whether branch coverage is measured when collecting coverage.
+
+Values:
+
+* `inherit`: Inherit the value from {flag}`--coverage_branch`.
+* `enabled`: Measure branch coverage in addition to line coverage.
+* `disabled`: Only measure line coverage. This makes tracing cheaper.
+
+:::{note}
+Only supported for {obj}`--bootstrap_impl=script`. Ignored otherwise.
+:::
+
+:::{seealso}
+The {flag}`--coverage_core` flag to select how coverage is traced.
+:::
+
+:::{versionadded} VERSION_NEXT_FEATURE
+:::
+""",
+        ),
         "interpreter_args": lambda: attrb.StringList(
             doc = """
 Arguments that are only applicable to the interpreter.
@@ -229,6 +254,18 @@ accepting arbitrary Python versions.
             cfg = "exec",
             default = "//tools/private/zipapp:exe_zip_maker",
         ),
+        "_coverage_branch_flag": lambda: attrb.Label(
+            default = labels.COVERAGE_BRANCH,
+            providers = [BuildSettingInfo],
+        ),
+        "_coverage_core_flag": lambda: attrb.Label(
+            default = labels.COVERAGE_CORE,
+            providers = [BuildSettingInfo],
+        ),
+        "_import_index_flag": lambda: attrb.Label(
+            default = labels.IMPORT_INDEX,
+            providers = [BuildSettingInfo],
+        ),
         "_launcher": lambda: attrb.Label(
             cfg = "target",
             # NOTE: This is an executable, but is only used for Windows. It
@@ -351,6 +388,7 @@ def _create_executable(
                 "1" if BootstrapImplFlag.get_value(ctx) == BootstrapImplFlag.SYSTEM_PYTHON else "0"
             ),
             extra_deps = extra_deps,
+            runfiles = runfiles_details.runfiles_without_exe,
         )
 
         stage2_bootstrap = _create_stage2_bootstrap(
@@ -387,12 +425,22 @@ def _create_executable(
             runtime_details = runtime_details,
         )
 
+    runfiles_with_venv = runfiles_details.runfiles_without_exe.merge(extra_runfiles)
+    if venv and venv.import_all_dirs_file:
+        _write_import_all_dirs(
+            ctx,
+            output = venv.import_all_dirs_file,
+            # Files added to the runfiles after this, e.g. the executable,
+            # are under the main repo's directory, which is always included.
+            runfiles = runfiles_with_venv,
+        )
+
     zip_file = ctx.actions.declare_file(base_executable_name + ".zip", sibling = executable)
     _create_zip_file(
         ctx,
         output = zip_file,
         zip_main = zip_main,
-        runfiles = runfiles_details.runfiles_without_exe.merge(extra_runfiles),
+        runfiles = runfiles_with_venv,
     )
 
     extra_default_outputs = []
@@ -556,7 +604,7 @@ def _create_zip_main(ctx, *, stage2_bootstrap, runtime_details, venv):
 # * https://snarky.ca/how-virtual-environments-work/
 # * https://github.com/python/cpython/blob/main/Modules/getpath.py
 # * https://github.com/python/cpython/blob/main/Lib/site.py
-def _create_venv(ctx, output_prefix, imports, runtime_details, add_runfiles_root_to_sys_path, extra_deps):
+def _create_venv(ctx, output_prefix, imports, runtime_details, add_runfiles_root_to_sys_path, extra_deps, runfiles):
     venv_ctx_rel_root = "_{}.venv".format(output_prefix.lstrip("_"))
     runtime = runtime_details.effective_runtime
     if runtime.interpreter:
@@ -588,13 +636,42 @@ def _create_venv(ctx, output_prefix, imports, runtime_details, add_runfiles_root
     site_init = ctx.actions.declare_file("{}/_bazel_site_init.py".format(site_packages))
     computed_subs = ctx.actions.template_dict()
     computed_subs.add_joined("%imports%", imports, join_with = ":", map_each = _map_each_identity)
+
+    import_all = read_possibly_native_flag(ctx, "python_import_all_repositories")
+    if import_all:
+        # Written by _write_import_all_dirs once the final runfiles are known.
+        import_all_dirs_file = ctx.actions.declare_file(
+            "{}/_bazel_import_all_dirs.txt".format(site_packages),
+        )
+        import_all_dirs_path = runfiles_root_path(ctx, import_all_dirs_file.short_path)
+    else:
+        import_all_dirs_file = None
+        import_all_dirs_path = ""
+
+    if ctx.attr._import_index_flag[BuildSettingInfo].value:
+        import_index = ctx.actions.declare_file("{}/_bazel_import_index.txt".format(site_packages))
+        _create_import_index(
+            ctx,
+            output = import_index,
+            imports = imports,
+            runfiles = runfiles,
+            import_all = import_all,
+            add_runfiles_root_to_sys_path = add_runfiles_root_to_sys_path == "1",
+        )
+        import_index_path = runfiles_root_path(ctx, import_index.short_path)
+    else:
+        import_index = None
+        import_index_path = ""
+
     ctx.actions.expand_template(
         template = runtime.site_init_template,
         output = site_init,
         substitutions = {
             "%add_runfiles_root_to_sys_path%": add_runfiles_root_to_sys_path,
             "%coverage_tool%": _get_coverage_tool_runfiles_path(ctx, runtime),
-            "%import_all%": "True" if read_possibly_native_flag(ctx, "python_import_all_repositories") else "False",
+            "%import_all%": "True" if import_all else "False",
+            "%import_all_dirs_file%": import_all_dirs_path,
+            "%import_index%": import_index_path,
             "%site_init_runfiles_path%": runfiles_root_path(ctx, site_init.short_path),
             "%workspace_name%": ctx.workspace_name,
         },
@@ -616,6 +693,10 @@ def _create_venv(ctx, output_prefix, imports, runtime_details, add_runfiles_root
     )
 
     files_without_interpreter = [pth, site_init] + venv_app_files.venv_files
+    if import_index:
+        files_without_interpreter.append(import_index)
+    if import_all_dirs_file:
+        files_without_interpreter.append(import_all_dirs_file)
     if venv_details.pyvenv_cfg:
         files_without_interpreter.append(venv_details.pyvenv_cfg)
 
@@ -634,6 +715,10 @@ def _create_venv(ctx, output_prefix, imports, runtime_details, add_runfiles_root
         # Runfiles root relative path or absolute path
         interpreter_actual_path = interpreter_actual_path,
         files_without_interpreter = files_without_interpreter,
+        # File or None; the list of directories to add to sys.path when
+        # importing all repositories. Must be written with
+        # `_write_import_all_dirs()`.
+        import_all_dirs_file = import_all_dirs_file,
         # string; venv-relative path to the site-packages directory.
         venv_site_packages = venv_details.site_packages,
         # string; runfiles-root relative path to venv root.
@@ -654,6 +739,153 @@ def _create_venv(ctx, output_prefix, imports, runtime_details, add_runfiles_root
         lib_symlinks = venv_app_files.explicit_symlinks,
     )
 
+def _write_import_all_dirs(ctx, *, output, runfiles):
+    """Writes the directories directly under the runfiles root, one per line.
+
+    They're the directories added to sys.path when importing all repositories,
+    and are computed here so that startup doesn't have to list the runfiles
+    root. The runfiles are mapped lazily when the file is written, so analysis
+    doesn't flatten them.
+
+    Args:
+        ctx: The rule context.
+        output: The file to write.
+        runfiles: The final runfiles of the binary.
+    """
+    workspace_name = ctx.workspace_name
+    legacy_external_runfiles = _py_builtins.get_legacy_external_runfiles(ctx)
+
+    def map_file(file):
+        if not file.short_path.startswith("../"):
+            return workspace_name
+        repo_dir = file.short_path[3:].split("/", 1)[0]
+        if legacy_external_runfiles:
+            # The file is also under the main repo's external/ directory.
+            return [repo_dir, workspace_name]
+        return repo_dir
+
+    def map_symlink(_entry):
+        # Symlinks are placed under the main repo's directory.
+        return workspace_name
+
+    def map_root_symlink(entry):
+        if "/" in entry.path:
+            return entry.path.split("/", 1)[0]
+
+        # A root symlink directly under the runfiles root is only a
+        # repository directory if it points to a directory.
+        return entry.path if entry.target_file.is_directory else None
+
+    args = ctx.actions.args()
+    args.set_param_file_format("multiline")
+    args.add_all(runfiles.files, map_each = map_file, uniquify = True, allow_closure = True)
+    args.add_all(runfiles.symlinks, map_each = map_symlink, uniquify = True, allow_closure = True)
+    args.add_all(runfiles.root_symlinks, map_each = map_root_symlink, uniquify = True, allow_closure = True)
+    ctx.actions.write(output, args)
+
+# Suffixes of files that `importlib`'s path based finder may import a module from.
+_IMPORTABLE_SUFFIXES = (".py", ".pyc", ".so", ".pyd")
+
+def _create_import_index(ctx, *, output, imports, runfiles, import_all, add_runfiles_root_to_sys_path):
+    """Writes the import index used by `_bazel_site_init`.
+
+    Each line is a runfiles-root relative `sys.path` entry and a top-level name
+    that may be importable from it, separated by a tab. A name of `*` means
+    the entry's contents aren't known, e.g. because it's within a directory
+    artifact. Names may be listed that aren't actually importable; they only
+    cost the finder a regular lookup. Only entries that `_bazel_site_init`
+    adds to `sys.path` are indexed.
+
+    Args:
+        ctx: {type}`ctx` current ctx.
+        output: {type}`File` the file to write.
+        imports: {type}`depset[str]` runfiles-root relative import paths.
+        runfiles: {type}`runfiles` the runfiles of the binary.
+        import_all: {type}`bool` if the runfiles root's directories are added
+            to `sys.path`.
+        add_runfiles_root_to_sys_path: {type}`bool` if the runfiles root is
+            added to `sys.path`.
+    """
+    workspace_name = ctx.workspace_name
+    legacy_external_runfiles = _py_builtins.get_legacy_external_runfiles(ctx)
+
+    # NOTE: Flattening the imports is acceptable because there are far fewer
+    # of them than files, and matching files to them needs a lookup table.
+    roots = {paths.normalize(path): None for path in imports.to_list()}
+    if add_runfiles_root_to_sys_path:
+        roots[""] = None
+    if not import_all:
+        roots[workspace_name] = None
+
+    def index_path(path, is_directory):
+        entries = []
+        parts = path.split("/")
+        last = len(parts) - 1
+        root = ""
+        for i, name in enumerate(parts):
+            if i == 1:
+                root = parts[0]
+            elif i > 1:
+                root = root + "/" + parts[i - 1]
+            if root not in roots and not (import_all and i == 1):
+                continue
+            if i == last:
+                if is_directory:
+                    entries.append(root + "\t" + name)
+                elif name.endswith(_IMPORTABLE_SUFFIXES):
+                    entries.append(root + "\t" + name.partition(".")[0])
+            elif i == last - 1 and parts[last].startswith("__init__."):
+                entries.append(root + "\t" + name)
+
+        if is_directory:
+            # Entries within a directory artifact can't be indexed.
+            for import_root in roots:
+                if import_root == path or import_root.startswith(path + "/"):
+                    entries.append(import_root + "\t*")
+        return entries
+
+    def index_workspace_path(path, is_directory):
+        if path.startswith("../"):
+            entries = index_path(path[3:], is_directory)
+            if legacy_external_runfiles:
+                # The path is also under the main repo's external/ directory.
+                entries.extend(index_path(workspace_name + "/external/" + path[3:], is_directory))
+            return entries
+        entries = index_path(workspace_name + "/" + path, is_directory)
+        if legacy_external_runfiles and path.startswith("external/"):
+            entries.extend(index_path(path[len("external/"):], is_directory))
+        return entries
+
+    def map_file(file):
+        return index_workspace_path(file.short_path, file.is_directory)
+
+    def map_empty_filenames(list_paths_cb):
+        entries = []
+        for path in list_paths_cb().to_list():
+            entries.extend(index_workspace_path(path, False))
+        return entries
+
+    def map_symlink(entry):
+        return index_workspace_path(entry.path, entry.target_file.is_directory)
+
+    def map_root_symlink(entry):
+        return index_path(entry.path, entry.target_file.is_directory)
+
+    args = ctx.actions.args()
+    args.set_param_file_format("multiline")
+    args.add_all(runfiles.files, map_each = map_file, uniquify = True, allow_closure = True)
+    args.add_all(
+        # NOTE: Accessing runfiles.empty_filenames implicitly flattens the runfiles.
+        # Smuggle a lambda in via a list to defer that flattening.
+        [lambda: runfiles.empty_filenames],
+        map_each = map_empty_filenames,
+        uniquify = True,
+        allow_closure = True,
+    )
+    args.add_all(runfiles.symlinks, map_each = map_symlink, uniquify = True, allow_closure = True)
+    args.add_all(runfiles.root_symlinks, map_each = map_root_symlink, uniquify = True, allow_closure = True)
+    ctx.actions.write(output, args)
+
 def _create_venv_unixy(ctx, *, venv_ctx_rel_root, runtime, interpreter_actual_path):
     interpreter_runfiles = builders.RunfilesBuilder()
     is_bootstrap_script = BootstrapImplFlag.get_value(ctx) == BootstrapImplFlag.SCRIPT
@@ -898,6 +1130,8 @@ def _create_stage2_bootstrap(
         output = output,
         substitutions = {
             "%build_data_file%": runfiles_root_path(ctx, build_data_file.short_path),
+            "%coverage_branch%": "True" if CoverageBranchAttr.is_enabled(ctx) else "False",
+            "%coverage_core%": CoverageCoreFlag.get_value(ctx),
             "%coverage_instrumented%": str(int(ctx.configuration.coverage_enabled and ctx.coverage_instrumented())),
             "%coverage_tool%": _get_coverage_tool_runfiles_path(ctx, runtime),
             "%import_all%": "True" if read_possibly_native_flag(ctx, "python_import_all_repositories") else "False",
@@ -1363,13 +1597,21 @@ def _maybe_add_test_main_validation(ctx, main_py, output_groups):
 
     validation_output = ctx.actions.declare_file(ctx.label.name + "_validate_test_main.txt")
 
-    args = ctx.actions.args()
-    args.add_all(program_info.interpreter_args)
-    args.add(validator_files_to_run.executable)
-    args.add("--src", main_py)
-    args.add("--src_name", main_py.short_path)
-    args.add("--label", str(ctx.label))
-    args.add("--output", validation_output)
+    startup_args = ctx.actions.args()
+    startup_args.add_all(program_info.interpreter_args)
+    startup_args.add(validator_files_to_run.executable)
+
+    # These args are passed for every validation request, e.g. as part of
+    # a request to a worker process.
+    request_args = ctx.actions.args()
+
+    # Always use param files so that it can be run as a persistent worker
+    request_args.use_param_file("@%s", use_always = True)
+    request_args.set_param_file_format("multiline")
+    request_args.add("--src", main_py)
+    request_args.add("--src_name", main_py.short_path)
+    request_args.add("--label", str(ctx.label))
+    request_args.add("--output", validation_output)
 
     execution_requirements = {}
     if testing.ExecutionInfo in validator:
@@ -1377,7 +1619,7 @@ def _maybe_add_test_main_validation(ctx, main_py, output_groups):
 
     ctx.actions.run(
         executable = interpreter,
-        arguments = [args],
+        arguments = [startup_args, request_args],
         inputs = [main_py],
         outputs = [validation_output],
         tools = [validator_files_to_run],
@@ -305,8 +305,31 @@ are (only) `"PY2"` and `"PY3"`.
 The template to use for the binary-specific site-init hook run by the
 interpreter at startup.
 
+The following substitutions are made during template expansion:
+* `%add_runfiles_root_to_sys_path%`: The string `1` if the runfiles root
+  should be added to sys.path. The string `0` otherwise.
+* `%coverage_tool%`: Runfiles-relative path to the coverage library's entry point.
+  If coverage is not enabled or available, an empty string.
+* `%import_all%`: The string `True` if all repositories in the runfiles should
+  be added to sys.path. The string `False` otherwise.
+* `%import_all_dirs_file%`: The runfiles-relative path of a file listing the
+  directories directly under the runfiles root, one per line, i.e. the
+  repositories added to sys.path when `%import_all%` is `True`. An empty
+  string when `%import_all%` is `False`.
+* `%import_index%`: The runfiles-relative path of the import index, or an
+  empty string if {flag}`--experimental_import_index` isn't enabled.
+* `%imports%`: A colon-delimited string of runfiles-relative paths to add to
+  sys.path.
+* `%site_init_runfiles_path%`: The runfiles-relative path of the expanded
+  template.
+* `%workspace_name%`: The name of the workspace the target belongs to.
+
 :::{versionadded} 1.0.0
 :::
+
+:::{versionchanged} VERSION_NEXT_FEATURE
+The `%import_all_dirs_file%` and `%import_index%` substitutions were added.
+:::
 """,
         "stage2_bootstrap_template": """
 :type: File
@@ -320,6 +343,10 @@ main code, it works properly under Bazel.
 The following substitutions are made during template expansion:
 * `%main%`: A runfiles-relative path to the program's actual main file. This
   can be a `.py` or `.pyc` file, depending on precompile settings.
+* `%coverage_branch%`: The string `True` if branch coverage should be
+  measured. The string `False` otherwise.
+* `%coverage_core%`: The coverage.py core to trace with. One of the
+  {flag}`--coverage_core` values.
 * `%coverage_tool%`: Runfiles-relative path to the coverage library's entry point.
   If coverage is not enabled or available, an empty string.
 * `%import_all%`: The string `True` if all repositories in the runfiles should
@@ -331,6 +358,10 @@ The following substitutions are made during template expansion:
 
 :::{versionadded} 0.33.0
 :::
+
+:::{versionchanged} VERSION_NEXT_FEATURE
+The `%coverage_branch%` and `%coverage_core%` substitutions were added.
+:::
 """,
         "stub_shebang": """
 :type: str
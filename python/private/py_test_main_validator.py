@@ -20,10 +20,17 @@ example, one that only imports other modules) is always allowed: it isn't the
 may legitimately rely on import side effects.
 """
 
+# NOTE: Imports specific to the persistent worker should only be imported
+# when a persistent worker is used. Avoiding the unnecessary imports
+# saves significant startup time for non-worker invocations.
 import argparse
 import ast
 import sys
 
+# Upper bound on the number of verdicts a persistent worker remembers. Each
+# entry is a digest and a bool, so this bounds the memory to a few MB.
+_VERDICT_CACHE_MAX_ENTRIES = 100_000
+
 
 def _compute_inert_node_types() -> tuple[type[ast.AST], ...]:
     # Statement node types that never run any code on their own, regardless of
@@ -169,11 +176,10 @@ def _format_error(label: str, src_name: str) -> str:
     ).format(target=target, src_name=src_name)
 
 
-def main(args) -> int:
-    parser = argparse.ArgumentParser()
+def _create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(fromfile_prefix_chars="@")
     parser.add_argument(
         "--src",
-        required=True,
         help="Path to the main .py source file to analyze.",
     )
     parser.add_argument(
@@ -188,39 +194,243 @@ def main(args) -> int:
     )
     parser.add_argument(
         "--output",
-        required=True,
         help="Path to the validation marker file to write on success.",
     )
-    options = parser.parse_args(args)
+    parser.add_argument("--persistent_worker", action="store_true")
+    parser.add_argument("--log_level", default="ERROR")
+    return parser
 
-    src_name = options.src_name or options.src
 
-    with open(options.src, "rb") as f:
-        source = f.read()
+class _VerdictCache:
+    """Remembers whether sources run tests, keyed by the source's digest.
+
+    Many py_test targets share identical main modules (e.g. generated or
+    copied runner stubs), and a persistent worker sees the same sources again
+    on incremental builds, so parsing each distinct source once is enough.
+    """
+
+    def __init__(self, max_entries: int = _VERDICT_CACHE_MAX_ENTRIES):
+        import hashlib
+
+        self._sha256 = hashlib.sha256
+        self._max_entries = max_entries
+        self._verdicts = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, source: bytes) -> "bool | None":
+        verdict = self._verdicts.get(self._sha256(source).digest())
+        if verdict is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return verdict
 
+    def put(self, source: bytes, verdict: bool) -> None:
+        if len(self._verdicts) >= self._max_entries:
+            # Dicts preserve insertion order, so this drops the oldest entry.
+            del self._verdicts[next(iter(self._verdicts))]
+        self._verdicts[self._sha256(source).digest()] = verdict
+
+
+def _compute_verdict(source: bytes, src_name: str) -> "tuple[bool | None, str]":
+    """Computes whether the source runs tests.
+
+    Returns:
+        The verdict, or None if the source can't be parsed, and a warning
+        message, which is empty unless the source can't be parsed.
+    """
     try:
         tree = ast.parse(source, filename=src_name)
     except SyntaxError as e:
         # A syntax error is surfaced by other actions (compilation/execution).
         # The validator can't analyze the file, so don't fail here; treat it as
         # passing to avoid duplicate or confusing errors.
-        sys.stderr.write(
-            "WARNING: py_test main validator could not parse {}: {}\n".format(
-                src_name, e
-            )
+        return None, "WARNING: py_test main validator could not parse {}: {}\n".format(
+            src_name, e
         )
-        with open(options.output, "w") as out:
-            out.write("")
-        return 0
+    return module_runs_tests(tree), ""
+
+
+def _validate(
+    options: argparse.Namespace, cache: "_VerdictCache | None" = None
+) -> "tuple[int, str]":
+    """Validates a single source.
+
+    Returns:
+        The exit code and the messages to report, which are empty unless
+        validation failed or the source can't be parsed.
+    """
+    src_name = options.src_name or options.src
+
+    with open(options.src, "rb") as f:
+        source = f.read()
+
+    warning = ""
+    verdict = None if cache is None else cache.get(source)
+    if verdict is None:
+        verdict, warning = _compute_verdict(source, src_name)
+        # Unparsable sources aren't cached so that their warning is repeated.
+        if cache is not None and verdict is not None:
+            cache.put(source, verdict)
 
-    if not module_runs_tests(tree):
-        sys.stderr.write(_format_error(options.label, src_name) + "\n")
-        return 1
+    if verdict is False:
+        return 1, _format_error(options.label, src_name) + "\n"
 
     # Validation actions must produce their declared outputs on success.
     with open(options.output, "w") as out:
         out.write("")
-    return 0
+    return 0, warning
+
+
+# A stub type alias for readability.
+# See the Bazel WorkRequest object definition:
+# https://github.com/bazelbuild/bazel/blob/master/src/main/protobuf/worker_protocol.proto
+JsonWorkRequest = object
+
+# A stub type alias for readability.
+# See the Bazel WorkResponse object definition:
+# https://github.com/bazelbuild/bazel/blob/master/src/main/protobuf/worker_protocol.proto
+JsonWorkResponse = object
+
+
+class _InvalidRequestArguments(Exception):
+    """A worker request's arguments couldn't be parsed."""
+
+    def __init__(self, exit_code: int, output: str):
+        super().__init__(output)
+        self.exit_code = exit_code
+        self.output = output
+
+
+class _PersistentWorker:
+    """Synchronous persistent worker that also accepts multiplexed requests.
+
+    Validating a source takes about a millisecond, so requests are simply
+    processed in the order they arrive; each response carries its request's
+    id, which is all multiplexing requires.
+    """
+
+    def __init__(
+        self,
+        instream: "typing.TextIO",  # noqa: F821
+        outstream: "typing.TextIO",  # noqa: F821
+        cache: "_VerdictCache | None" = None,
+    ):
+        self._instream = instream
+        self._outstream = outstream
+        self._cache = cache
+        self._parser = _create_parser()
+
+    def run(self) -> None:
+        try:
+            while True:
+                request = None
+                try:
+                    request = self._get_next_request()
+                    if request is None:
+                        _logger.info("Empty request: exiting")
+                        break
+                    response = self._process_request(request)
+                    if response:  # May be none for cancel request
+                        self._send_response(response)
+                except Exception:
+                    _logger.exception("Unhandled error: request=%s", request)
+                    output = (
+                        f"Unhandled error:\nRequest: {request}\n"
+                        + traceback.format_exc()
+                    )
+                    request_id = 0 if not request else request.get("requestId", 0)
+                    self._send_response(
+                        {
+                            "exitCode": 3,
+                            "output": output,
+                            "requestId": request_id,
+                        }
+                    )
+        finally:
+            if self._cache is not None:
+                _logger.info(
+                    "Worker shutting down: verdict cache hits=%s misses=%s",
+                    self._cache.hits,
+                    self._cache.misses,
+                )
+
+    def _get_next_request(self) -> "JsonWorkRequest | None":
+        line = self._instream.readline()
+        if not line:
+            return None
+        return json.loads(line)
+
+    def _process_request(self, request: "JsonWorkRequest") -> "JsonWorkResponse | None":
+        if request.get("cancel"):
+            return None
+        try:
+            options = self._options_from_request(request)
+        except _InvalidRequestArguments as e:
+            exit_code, output = e.exit_code, e.output
+        else:
+            exit_code, output = _validate(options, self._cache)
+        response = {
+            "requestId": request.get("requestId", 0),
+            "exitCode": exit_code,
+        }
+        if output:
+            response["output"] = output
+        return response
+
+    def _options_from_request(self, request: "JsonWorkRequest") -> argparse.Namespace:
+        # argparse exits on invalid arguments, which would stop the worker
+        # without answering the pending requests, and prints to stdout and
+        # stderr, which are the worker's protocol stream and log.
+        messages = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(messages):
+                with contextlib.redirect_stderr(messages):
+                    options = self._parser.parse_args(request["arguments"])
+        except SystemExit as e:
+            raise _InvalidRequestArguments(
+                e.code if isinstance(e.code, int) else 2, messages.getvalue()
+            ) from None
+        if request.get("sandboxDir"):
+            prefix = request["sandboxDir"]
+            options.src = os.path.join(prefix, options.src)
+            options.output = os.path.join(prefix, options.output)
+        return options
+
+    def _send_response(self, response: "JsonWorkResponse") -> None:
+        self._outstream.write(json.dumps(response) + "\n")
+        self._outstream.flush()
+
+
+def main(args) -> int:
+    parser = _create_parser()
+    options = parser.parse_args(args)
+
+    # Persistent workers are started with the `--persistent_worker` flag.
+    # See https://bazel.build/remote/persistent for details.
+    if options.persistent_worker:
+        global contextlib, io, json, logging, os, traceback, _logger
+        import contextlib
+        import io
+        import json
+        import logging
+        import os.path
+        import traceback
+
+        _logger = logging.getLogger("py_test_main_validator")
+        # Only configure logging for workers. This prevents non-worker
+        # invocations from spamming stderr with logging info
+        logging.basicConfig(level=getattr(logging, options.log_level))
+        _PersistentWorker(sys.stdin, sys.stdout, _VerdictCache()).run()
+        return 0
+
+    if not options.src or not options.output:
+        parser.error("--src and --output are required")
+
+    exit_code, output = _validate(options)
+    sys.stderr.write(output)
+    return exit_code
 
 
 if __name__ == "__main__":
@@ -286,6 +286,14 @@ _DESCRIPTION_FILE_EXTENSION_TO_TYPE = {
 }
 _DEFAULT_DESCRIPTION_FILE_TYPE = "text/plain"
 
+# The number of threads wheelmaker hashes and compresses on. It's bounded, and
+# declared to Bazel with _wheelmaker_resource_set, so that concurrent actions
+# don't oversubscribe the machine.
+_WHEELMAKER_JOBS = 4
+
+def _wheelmaker_resource_set(_os, _inputs_size):
+    return {"cpu": _WHEELMAKER_JOBS}
+
 def _escape_filename_distribution_name(name):
     """Escape the distribution name component of a filename.
 
@@ -536,6 +544,10 @@ def _py_wheel_impl(ctx):
     if not ctx.attr.compress:
         args.add("--no_compress")
 
+    # Hash and compress on several threads; the wheel is identical to a serial
+    # build.
+    args.add(str(_WHEELMAKER_JOBS), format = "--jobs=%s")
+
     for target, filename in ctx.attr.extra_distinfo_files.items():
         target_files = target[DefaultInfo].files.to_list()
         if len(target_files) != 1:
@@ -581,6 +593,7 @@ def _py_wheel_impl(ctx):
         outputs = [outfile, name_file],
         arguments = [args],
         executable = ctx.executable._wheelmaker,
+        resource_set = _wheelmaker_resource_set,
         # The default shell env is used to better support toolchains that look
         # up python at runtime using PATH.
         use_default_shell_env = True,
@@ -12,6 +12,8 @@ load(":urllib.bzl", "urllib")
 load(":whl_archive.bzl", "whl_archive_attrs")
 
 _CPPFLAGS = "CPPFLAGS"
+_WHEEL_BUILD_CACHE_DIR_ENV = "RULES_PYTHON_WHEEL_BUILD_CACHE_DIR"
+_WHEEL_BUILD_JOBS_ENV = "RULES_PYTHON_WHEEL_BUILD_JOBS"
 _COMMAND_LINE_TOOLS_PATH_SLUG = "commandlinetools"
 
 def _get_xcode_location_cflags(rctx, logger = None):
@@ -303,6 +305,14 @@ def _pip_archive_impl(rctx):
         rctx.attr.requirement,
     ]
     args = _parse_optional_attrs(rctx, args, extra_pip_args)
+    if sdist_filename:
+        args += ["--sdist", sdist_filename]
+    wheel_cache_dir = rctx.getenv(_WHEEL_BUILD_CACHE_DIR_ENV)
+    if wheel_cache_dir:
+        args += ["--wheel_cache_dir", wheel_cache_dir]
+    build_jobs = rctx.getenv(_WHEEL_BUILD_JOBS_ENV)
+    if build_jobs:
+        args += ["--build_jobs", build_jobs]
 
     # Manually construct the PYTHONPATH since we cannot use the toolchain here
     environment = _create_repository_execution_environment(rctx, python_interpreter, logger = logger)
@@ -371,6 +381,7 @@ _attrs = whl_archive_attrs | {
         default = [
             Label("//python/private/pypi/whl_installer:wheel_installer.py"),
             Label("//python/private/pypi/whl_installer:arguments.py"),
+            Label("//python/private/pypi/whl_installer:wheel_cache.py"),
         ] + record_files.values(),
     ),
 }
@@ -396,6 +407,8 @@ previously named {obj}`whl_library` repository became renamed to `pip_archive`.
     implementation = _pip_archive_impl,
     environ = [
         "RULES_PYTHON_PIP_ISOLATED",
+        _WHEEL_BUILD_CACHE_DIR_ENV,
+        _WHEEL_BUILD_JOBS_ENV,
         REPO_DEBUG_ENV_VAR,
     ],
 )
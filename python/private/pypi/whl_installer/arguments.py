@@ -54,6 +54,25 @@ def parser(**kwargs: Any) -> argparse.ArgumentParser:
         help="Use 'pip download' instead of 'pip wheel'. Disables building wheels from source, but allows use of "
         "--platform, --python-version, --implementation, and --abi in --extra_pip_args.",
     )
+    parser.add_argument(
+        "--sdist",
+        action="store",
+        help="The already downloaded sdist the wheel is built from, if any.",
+    )
+    parser.add_argument(
+        "--wheel_cache_dir",
+        action="store",
+        help="Directory of a local cache of wheels built from sdists, shared between "
+        "repositories. Not used if unset.",
+    )
+    parser.add_argument(
+        "--build_jobs",
+        action="store",
+        type=int,
+        default=0,
+        help="The maximum number of wheels built concurrently by all repositories. "
+        "0 means no limit.",
+    )
     return parser
 
 
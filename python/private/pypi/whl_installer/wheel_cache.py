@@ -0,0 +1,167 @@
+# Copyright 2026 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A local cache of wheels built from sdists, and a limit on concurrent builds.
+
+Each `pip_archive` repository runs its own wheel_installer process, and Bazel
+fetches repositories concurrently. The cache and the build slots live in
+directories shared by all of those processes, so they also work across
+repositories and output bases.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import sys
+import sysconfig
+import tempfile
+import time
+from pathlib import Path
+from typing import Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# How long to wait before polling the build slots again when all are taken.
+_SLOT_POLL_INTERVAL_SECONDS = 0.1
+
+
+def cache_key(
+    *,
+    requirement: str,
+    pip_args: "list[str]",
+    environment: "dict[str, str]",
+    sdist: Optional[str] = None,
+) -> str:
+    """Computes the cache key of the wheel built for a requirement.
+
+    Args:
+        requirement: The requirement line, including any `--hash` options.
+        pip_args: The pip arguments used to build the wheel.
+        environment: The environment variables that affect the build.
+        sdist: Path to the sdist the wheel is built from, if it was already
+            downloaded. Its content is part of the key.
+
+    Returns:
+        The hex digest identifying the wheel.
+    """
+    key = {
+        "requirement": requirement,
+        "pip_args": pip_args,
+        "environment": sorted(environment.items()),
+        "python": sys.version,
+        "implementation": sys.implementation.cache_tag,
+        "platform": sysconfig.get_platform(),
+    }
+    if sdist:
+        digest = hashlib.sha256()
+        with open(sdist, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        key["sdist"] = digest.hexdigest()
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+class WheelCache:
+    """A directory of built wheels, addressed by their cache key."""
+
+    def __init__(self, cache_dir: str):
+        self._cache_dir = Path(cache_dir)
+
+    def _entry_dir(self, key: str) -> Path:
+        return self._cache_dir / key[:2] / key
+
+    def get(self, key: str, dest_dir: Path) -> Optional[Path]:
+        """Copies the cached wheel of the key into dest_dir.
+
+        Returns:
+            The path of the copied wheel, or None if the key isn't cached.
+        """
+        entry_dir = self._entry_dir(key)
+        wheels = list(entry_dir.glob("*.whl"))
+        if not wheels:
+            return None
+        return Path(shutil.copy(wheels[0], dest_dir / wheels[0].name))
+
+    def put(self, key: str, whl: Path) -> None:
+        """Adds a built wheel to the cache.
+
+        Failing to add the wheel, e.g. because another process added the same
+        wheel first or the cache directory isn't writable, isn't an error.
+        """
+        entry_dir = self._entry_dir(key)
+        tmp_dir = None
+        try:
+            entry_dir.parent.mkdir(parents=True, exist_ok=True)
+            # Populate a temporary directory and rename it into place, so that
+            # concurrent readers never see a partially written wheel.
+            tmp_dir = Path(tempfile.mkdtemp(dir=entry_dir.parent, prefix=".tmp-"))
+            shutil.copy(whl, tmp_dir / whl.name)
+            os.rename(tmp_dir, entry_dir)
+        except OSError as e:
+            if not entry_dir.exists():
+                print(
+                    f"WARNING: could not add {whl.name} to the wheel cache: {e}",
+                    file=sys.stderr,
+                )
+            if tmp_dir is not None:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def build_slot(lock_dir: str, jobs: int) -> Iterator[None]:
+    """Waits until fewer than `jobs` builds using lock_dir are running.
+
+    The slots are advisory file locks, so they are released if a build
+    process dies. A non-positive `jobs`, a platform without `fcntl`, or a
+    lock_dir that can't be written means there is no limit.
+    """
+    if jobs <= 0 or fcntl is None:
+        yield
+        return
+
+    try:
+        os.makedirs(lock_dir, exist_ok=True)
+        slots = [
+            open(os.path.join(lock_dir, f"build-slot-{i}.lock"), "a")
+            for i in range(jobs)
+        ]
+    except OSError as e:
+        print(
+            f"WARNING: not limiting concurrent wheel builds, could not use {lock_dir}: {e}",
+            file=sys.stderr,
+        )
+        yield
+        return
+
+    try:
+        while True:
+            for slot in slots:
+                try:
+                    fcntl.flock(slot, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                try:
+                    yield
+                finally:
+                    fcntl.flock(slot, fcntl.LOCK_UN)
+                return
+            time.sleep(_SLOT_POLL_INTERVAL_SECONDS)
+    finally:
+        for slot in slots:
+            slot.close()
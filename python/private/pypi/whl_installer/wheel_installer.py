@@ -20,10 +20,20 @@ import json
 import os
 import subprocess
 import sys
+import tempfile
 from pathlib import Path
 from tempfile import NamedTemporaryFile
+from typing import Optional
 
-from python.private.pypi.whl_installer import arguments
+from packaging.requirements import InvalidRequirement, Requirement
+
+from python.private.pypi.whl_installer import arguments, wheel_cache
+
+# Environment variables that change the wheel built from an sdist, and are thus
+# part of the wheel cache key. CPPFLAGS isn't included because it holds the
+# include paths of the interpreter, which differ between output bases; the
+# interpreter's version and platform are part of the key instead.
+_WHEEL_BUILD_ENV_VARS = ("CFLAGS", "LDFLAGS", "SOURCE_DATE_EPOCH")
 
 
 def _configure_reproducible_wheels() -> None:
@@ -51,36 +61,41 @@ def _configure_reproducible_wheels() -> None:
         os.environ["PYTHONHASHSEED"] = "0"
 
 
-def main() -> None:
-    args = arguments.parser(description=__doc__).parse_args()
-    deserialized_args = dict(vars(args))
-    arguments.deserialize_structured_args(deserialized_args)
-
-    _configure_reproducible_wheels()
-
-    pip_args = (
-        [sys.executable, "-m", "pip"]
-        + (["--isolated"] if args.isolated else [])
-        + (["download", "--only-binary=:all:"] if args.download_only else ["wheel"])
-        + ["--no-deps"]
-        + deserialized_args["extra_pip_args"]
+def _is_pinned(requirement: str, sdist: Optional[str]) -> bool:
+    """Returns True if the requirement always resolves to the same sdist."""
+    if sdist:
+        return True
+    # Options such as `--hash` follow the requirement itself.
+    spec, *options = requirement.split(" --")
+    if any(option.startswith("hash") for option in options):
+        return True
+    try:
+        req = Requirement(spec)
+    except InvalidRequirement:
+        return False
+    specifiers = list(req.specifier)
+    return (
+        req.url is None
+        and len(specifiers) == 1
+        and specifiers[0].operator in ("==", "===")
+        and not specifiers[0].version.endswith(".*")
     )
 
+
+def _build_wheel(
+    pip_args: "list[str]", requirement: str, env: "dict[str, str]"
+) -> None:
+    # Requirement specific args like --hash can only be passed in a requirements file,
+    # so write our single requirement into a temp file in case it has any of those flags.
     requirement_file = NamedTemporaryFile(mode="wb", delete=False)
     try:
-        requirement_file.write(args.requirement.encode("utf-8"))
+        requirement_file.write(requirement.encode("utf-8"))
         requirement_file.flush()
         # Close the file so pip is allowed to read it when running on Windows.
         # For more information, see: https://bugs.python.org/issue14243
         requirement_file.close()
-        # Requirement specific args like --hash can only be passed in a requirements file,
-        # so write our single requirement into a temp file in case it has any of those flags.
-        pip_args.extend(["-r", requirement_file.name])
-
-        env = os.environ.copy()
-        env.update(deserialized_args["environment"])
         # Assumes any errors are logged by pip so do nothing. This command will fail if pip fails
-        subprocess.run(pip_args, check=True, env=env)
+        subprocess.run(pip_args + ["-r", requirement_file.name], check=True, env=env)
     finally:
         try:
             os.unlink(requirement_file.name)
@@ -88,7 +103,62 @@ def main() -> None:
             if e.errno != errno.ENOENT:
                 raise
 
-    whl = Path(next(iter(glob.glob("*.whl"))))
+
+def main() -> None:
+    args = arguments.parser(description=__doc__).parse_args()
+    deserialized_args = dict(vars(args))
+    arguments.deserialize_structured_args(deserialized_args)
+
+    _configure_reproducible_wheels()
+
+    pip_args = (
+        [sys.executable, "-m", "pip"]
+        + (["--isolated"] if args.isolated else [])
+        + (["download", "--only-binary=:all:"] if args.download_only else ["wheel"])
+        + ["--no-deps"]
+        + deserialized_args["extra_pip_args"]
+    )
+
+    env = os.environ.copy()
+    env.update(deserialized_args["environment"])
+
+    cache = None
+    whl = None
+    if (
+        args.wheel_cache_dir
+        and not args.download_only
+        and _is_pinned(args.requirement, args.sdist)
+    ):
+        cache = wheel_cache.WheelCache(args.wheel_cache_dir)
+        key = wheel_cache.cache_key(
+            requirement=args.requirement,
+            # Skip the interpreter path, which differs between output bases.
+            pip_args=pip_args[3:],
+            environment={
+                **{name: env[name] for name in _WHEEL_BUILD_ENV_VARS if name in env},
+                **dict(deserialized_args["environment"]),
+            },
+            sdist=args.sdist,
+        )
+        whl = cache.get(key, Path.cwd())
+
+    if whl is None:
+        if args.download_only:
+            _build_wheel(pip_args, args.requirement, env)
+        else:
+            # The temporary directory is shared by all users, so each user gets
+            # their own build slots there.
+            lock_dir = args.wheel_cache_dir or os.path.join(
+                tempfile.gettempdir(),
+                "rules_python_wheel_builds-{}".format(
+                    os.getuid() if hasattr(os, "getuid") else "default"
+                ),
+            )
+            with wheel_cache.build_slot(lock_dir, args.build_jobs):
+                _build_wheel(pip_args, args.requirement, env)
+        whl = Path(next(iter(glob.glob("*.whl"))))
+        if cache is not None:
+            cache.put(key, whl)
 
     with open("whl_file.json", "w") as f:
         json.dump({"whl_file": f"{whl.resolve()}"}, f)
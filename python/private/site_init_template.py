@@ -16,12 +16,19 @@
 import os
 import os.path
 import sys
+import time
+
+_START = (time.perf_counter_ns(), len(sys.modules))
 
 # Colon-delimited string of runfiles-relative import paths to add
 _IMPORTS_STR = "%imports%"
 # Though the import all value is the correct literal, we quote it
 # so this file is parsable by tools.
 _IMPORT_ALL = "%import_all%" == "True"
+# Runfiles-relative path to the file listing the directories directly under
+# the runfiles root, computed at build time. They're added to sys.path if
+# _IMPORT_ALL is true.
+_IMPORT_ALL_DIRS_FILE = "%import_all_dirs_file%"
 _WORKSPACE_NAME = "%workspace_name%"
 # runfiles-relative path to this file
 _SELF_RUNFILES_RELATIVE_PATH = "%site_init_runfiles_path%"
@@ -29,6 +36,23 @@ _SELF_RUNFILES_RELATIVE_PATH = "%site_init_runfiles_path%"
 _COVERAGE_TOOL = "%coverage_tool%"
 # True if the runfiles root should be added to sys.path
 _ADD_RUNFILES_ROOT_TO_SYS_PATH = "%add_runfiles_root_to_sys_path%" == "1"
+# Runfiles-relative path to the import index, or empty if there isn't one.
+_IMPORT_INDEX = "%import_index%"
+
+
+_STARTUP_TRACE = bool(os.environ.get("RULES_PYTHON_STARTUP_TRACE"))
+# Startup phases as (name, start_ns, end_ns, imports) tuples, which the stage 2
+# bootstrap includes in the startup trace.
+STARTUP_TRACE_PHASES = []
+
+
+def _record_startup_phase(name, start):
+    """Records a phase that began at a `(perf_counter_ns, len(sys.modules))`."""
+    if _STARTUP_TRACE:
+        start_ns, start_modules = start
+        STARTUP_TRACE_PHASES.append(
+            (name, start_ns, time.perf_counter_ns(), len(sys.modules) - start_modules)
+        )
 
 
 def _is_verbose():
@@ -52,9 +76,15 @@ _print_verbose("import_all:", _IMPORT_ALL)
 _print_verbose("workspace_name:", _WORKSPACE_NAME)
 _print_verbose("self_runfiles_path:", _SELF_RUNFILES_RELATIVE_PATH)
 _print_verbose("coverage_tool:", _COVERAGE_TOOL)
+_print_verbose("import_index:", _IMPORT_INDEX)
 
 
 def _find_runfiles_root():
+    # Set by the stage 1 bootstrap, which already found and verified it.
+    runfiles_root = sys._xoptions.get("RULES_PYTHON_RUNFILES_ROOT")
+    if runfiles_root:
+        return runfiles_root
+
     # Give preference to the environment variables
     runfiles_dir = os.environ.get("RUNFILES_DIR", None)
     if not runfiles_dir:
@@ -71,14 +101,18 @@ def _find_runfiles_root():
     ):
         return runfiles_dir
 
-    num_dirs_to_runfiles_root = _SELF_RUNFILES_RELATIVE_PATH.count("/") + 1
+    # dirname(__file__) is already one directory below the runfiles-relative
+    # path's first component.
+    num_dirs_to_runfiles_root = _SELF_RUNFILES_RELATIVE_PATH.count("/")
     runfiles_root = os.path.dirname(__file__)
     for _ in range(num_dirs_to_runfiles_root):
         runfiles_root = os.path.dirname(runfiles_root)
     return runfiles_root
 
 
+_phase_start = (time.perf_counter_ns(), len(sys.modules))
 _RUNFILES_ROOT = _find_runfiles_root()
+_record_startup_phase("site_init: find runfiles root", _phase_start)
 
 _print_verbose("runfiles_root:", _RUNFILES_ROOT)
 
@@ -135,12 +169,62 @@ def _search_path(name):
     return None
 
 
+def _read_import_all_dirs():
+    """Returns the names listed in the import-all directories file, or None."""
+    path = os.path.join(_RUNFILES_ROOT, _IMPORT_ALL_DIRS_FILE)
+    loader = globals().get("__loader__")
+    try:
+        if getattr(loader, "archive", None) and path.startswith(
+            loader.archive + os.sep
+        ):
+            # Imported by zipimport from a zipapp that runs without being
+            # extracted, so the file only exists within the zip.
+            content = loader.get_data(path).decode("utf-8")
+        else:
+            with open(path, encoding="utf-8") as f:
+                content = f.read()
+    except OSError as e:
+        _print_verbose("unable to read import-all directories:", e)
+        return None
+    return set(content.splitlines())
+
+
+def _list_repo_dirs():
+    """Returns the sorted directories directly under the runfiles root."""
+    if _IMPORT_ALL_DIRS_FILE:
+        # Computed at build time, so that startup doesn't list the runfiles
+        # root and stat each entry.
+        names = _read_import_all_dirs()
+        if names is not None:
+            return [os.path.join(_RUNFILES_ROOT, name) for name in sorted(names)]
+
+    archive = getattr(globals().get("__loader__"), "archive", None)
+    if archive and _RUNFILES_ROOT.startswith(archive + os.sep):
+        # Imported by zipimport from a zipapp that runs without being
+        # extracted, so the directories only exist within the zip.
+        import zipfile
+
+        prefix = _RUNFILES_ROOT[len(archive) + 1 :].replace(os.sep, "/") + "/"
+        with zipfile.ZipFile(archive) as zf:
+            names = {
+                name[len(prefix) :].split("/", 1)[0]
+                for name in zf.namelist()
+                if name.startswith(prefix) and "/" in name[len(prefix) :]
+            }
+        return [os.path.join(_RUNFILES_ROOT, name) for name in sorted(names)]
+
+    repo_dirs = sorted(
+        os.path.join(_RUNFILES_ROOT, d) for d in os.listdir(_RUNFILES_ROOT)
+    )
+    return [d for d in repo_dirs if os.path.isdir(d)]
+
+
 def _setup_sys_path():
     """Perform Bazel/binary specific sys.path setup."""
     _print_verbose("site init: initial sys.path:\n", "\n".join(sys.path))
     seen = set(sys.path)
 
-    def _maybe_add_path(path, reason):
+    def _maybe_add_path(path, reason, index_root=None):
         if path in seen:
             return
         path = _get_windows_path_with_unc_prefix(path)
@@ -150,6 +234,8 @@ def _setup_sys_path():
         _print_verbose("append sys.path:", reason, ":", path)
         sys.path.append(path)
         seen.add(path)
+        if index_root is not None:
+            _IMPORT_INDEX_ROOTS[path] = index_root
 
     # Adding the runfiles root to sys.path is a legacy behavior that will be
     # removed. We don't want to add it to sys.path for two reasons:
@@ -160,21 +246,21 @@ def _setup_sys_path():
     # For temporary compatibility with the original system_python bootstrap
     # behavior, it is conditionally added for that boostrap mode.
     if _ADD_RUNFILES_ROOT_TO_SYS_PATH:
-        _maybe_add_path(_RUNFILES_ROOT, "runfiles-root")
+        _maybe_add_path(_RUNFILES_ROOT, "runfiles-root", "")
 
     for rel_path in _IMPORTS_STR.split(":"):
         abs_path = os.path.join(_RUNFILES_ROOT, rel_path)
-        _maybe_add_path(abs_path, "imports-strs")
+        _maybe_add_path(abs_path, "imports-strs", rel_path or None)
 
     if _IMPORT_ALL:
-        repo_dirs = sorted(
-            os.path.join(_RUNFILES_ROOT, d) for d in os.listdir(_RUNFILES_ROOT)
-        )
-        for d in repo_dirs:
-            if os.path.isdir(d):
-                _maybe_add_path(d, "import-all")
+        for d in _list_repo_dirs():
+            _maybe_add_path(d, "import-all", os.path.basename(d))
     else:
-        _maybe_add_path(os.path.join(_RUNFILES_ROOT, _WORKSPACE_NAME), "workspace-root")
+        _maybe_add_path(
+            os.path.join(_RUNFILES_ROOT, _WORKSPACE_NAME),
+            "workspace-root",
+            _WORKSPACE_NAME,
+        )
 
     # COVERAGE_DIR is set if coverage is enabled and instrumentation is configured
     # for something, though it could be another program executing this one or
@@ -218,6 +304,100 @@ def _setup_sys_path():
     return coverage_setup
 
 
+# Maps the sys.path entries added for the binary to their runfiles-relative
+# path, for looking them up in the import index.
+_IMPORT_INDEX_ROOTS = {}
+
+
+class _ImportIndexFinder:
+    """A sys.meta_path finder that uses the import index to skip sys.path entries.
+
+    The import index is generated at build time. It lists the top-level names
+    that may be importable from each sys.path entry added for the binary. When
+    finding a top-level module, such entries that don't list the name are
+    skipped instead of being searched. Other entries, e.g. the stdlib, are
+    searched by `PathFinder` as usual. If no module is found (including
+    when only namespace package portions are found), the regular finders
+    after this one perform the full search.
+    """
+
+    def __init__(self, index_path, roots):
+        self._index_path = index_path
+        # sys.path entry -> runfiles-relative path
+        self._roots = roots
+        # Normalized sys.path entry -> set of names. Loaded when the first
+        # module is looked up.
+        self._root_names = None
+        # sys.path entry -> set of names, or None if the entry isn't indexed.
+        self._entry_names = {}
+
+    def _load(self):
+        import posixpath
+
+        self._root_names = {}
+        names_by_root = {}
+        try:
+            with open(self._index_path, encoding="utf-8") as f:
+                for line in f:
+                    root, _, name = line.rstrip("\n").partition("\t")
+                    names_by_root.setdefault(root, set()).add(name)
+        except OSError as e:
+            _print_verbose("unable to read import index:", e)
+            return
+
+        for entry, rel_path in self._roots.items():
+            rel_path = posixpath.normpath(rel_path) if rel_path else ""
+            self._root_names[os.path.normpath(entry)] = names_by_root.get(
+                rel_path, frozenset()
+            )
+
+    def _get_names(self, entry):
+        try:
+            return self._entry_names[entry]
+        except KeyError:
+            pass
+        names = None
+        if isinstance(entry, str):
+            names = self._root_names.get(os.path.normpath(entry))
+        self._entry_names[entry] = names
+        return names
+
+    def find_spec(self, fullname, path=None, target=None):
+        # Submodules are found using their package's __path__.
+        if path is not None:
+            return None
+        if self._root_names is None:
+            self._load()
+        if not self._root_names:
+            return None
+
+        from importlib.machinery import PathFinder
+
+        for entry in sys.path:
+            names = self._get_names(entry)
+            if names is not None and fullname not in names and "*" not in names:
+                continue
+            spec = PathFinder.find_spec(fullname, [entry], target)
+            # A spec without a loader is a namespace package portion; a
+            # regular module in a later entry takes precedence over it.
+            if spec is not None and spec.loader is not None:
+                return spec
+        return None
+
+
+def _install_import_index_finder():
+    """Installs the import index finder ahead of the regular path finder."""
+    from importlib.machinery import PathFinder
+
+    if PathFinder not in sys.meta_path:
+        return
+    finder = _ImportIndexFinder(
+        os.path.join(_RUNFILES_ROOT, _IMPORT_INDEX), _IMPORT_INDEX_ROOTS
+    )
+    sys.meta_path.insert(sys.meta_path.index(PathFinder), finder)
+    _print_verbose("installed import index finder")
+
+
 def _fixup_sys_base_executable():
     """Fixup sys._base_executable to account for Bazel-specific pyvenv.cfg
 
@@ -238,7 +418,38 @@ def _fixup_sys_base_executable():
     sys._base_executable = exe
 
 
+def _start_child_coverage():
+    """Starts collecting coverage for a child process of a binary collecting it.
+
+    With RULES_PYTHON_COVERAGE_PARALLEL, the stage 2 bootstrap sets
+    COVERAGE_PROCESS_START to its coverage config file. The coverage of its
+    child processes is then written to data files that it combines with its
+    own coverage.
+
+    Returns:
+        True if coverage was started.
+    """
+    try:
+        import coverage
+    except ImportError as e:
+        _print_verbose_coverage("unable to start child process coverage:", e)
+        return False
+    coverage.process_startup()
+    return coverage.Coverage.current() is not None
+
+
 _fixup_sys_base_executable()
 
+_phase_start = (time.perf_counter_ns(), len(sys.modules))
 COVERAGE_SETUP = _setup_sys_path()
+if _IMPORT_INDEX:
+    _install_import_index_finder()
+COVERAGE_STARTED = (
+    COVERAGE_SETUP
+    and bool(os.environ.get("RULES_PYTHON_COVERAGE_PARALLEL"))
+    and bool(os.environ.get("COVERAGE_PROCESS_START"))
+    and _start_child_coverage()
+)
+_record_startup_phase("site_init: setup sys.path", _phase_start)
+_record_startup_phase("site_init", _START)
 _print_verbose("DONE")
@@ -6,6 +6,25 @@ if [[ -n "${RULES_PYTHON_BOOTSTRAP_VERBOSE:-}" ]]; then
   set -x
 fi
 
+# With RULES_PYTHON_STARTUP_TRACE set, the startup phases are recorded as
+# "<pid>;<name>,<start_us>,<end_us>;..." and passed to the stage 2 bootstrap,
+# which writes the trace. EPOCHREALTIME requires bash 5; with older versions,
+# only the Python phases are traced.
+_startup_trace=""
+if [[ -n "${RULES_PYTHON_STARTUP_TRACE:-}" && -n "${EPOCHREALTIME:-}" ]]; then
+  _startup_trace="$$"
+  _startup_phase_start="${EPOCHREALTIME//[.,]/}"
+fi
+
+# Ends the current startup phase, named $1, and starts the next one.
+function _startup_phase() {
+  if [[ -n "$_startup_trace" ]]; then
+    local now="${EPOCHREALTIME//[.,]/}"
+    _startup_trace+=";$1,$_startup_phase_start,$now"
+    _startup_phase_start="$now"
+  fi
+}
+
 # Creates a symlink. If the symlink already exists, it is tolerated to avoid
 # race conditions during startup.
 function _symlink() {
@@ -82,6 +101,7 @@ if [[ "$IS_ZIPFILE" == "1" ]]; then
     echo "Run with RULES_PYTHON_BOOTSTRAP_VERBOSE=1 to aid debugging"
     exit 1
   fi
+  _startup_phase "stage1: extract zip"
 
 else
   function find_runfiles_root() {
@@ -127,6 +147,7 @@ else
     exit 1
   }
   RUNFILES_DIR=$(find_runfiles_root $0)
+  _startup_phase "stage1: find runfiles root"
 fi
 
 if [[ -n "$RULES_PYTHON_TESTING_TELL_RUNFILES_ROOT" ]]; then
@@ -265,6 +286,8 @@ else
   use_exec=1
 fi
 
+_startup_phase "stage1: setup interpreter"
+
 # At this point, we should have a valid reference to the interpreter.
 # Check that so we can give an nicer failure if things went wrong.
 if [[ ! -x "$python_exe" ]]; then
@@ -301,6 +324,12 @@ if [[ "$IS_ZIPFILE" == "1" ]]; then
   interpreter_args+=("-XRULES_PYTHON_ZIP_DIR=$zip_dir")
 fi
 
+# The runfiles root was found and verified above, so tell stage 2 (and
+# _bazel_site_init) to use it instead of searching for it again. An -X option
+# is used instead of an environment variable because it isn't inherited by
+# other binaries that this one runs.
+interpreter_args+=("-XRULES_PYTHON_RUNFILES_ROOT=$RUNFILES_DIR")
+
 if [[ -n "${RULES_PYTHON_ADDITIONAL_INTERPRETER_ARGS}" ]]; then
   read -a additional_interpreter_args <<< "${RULES_PYTHON_ADDITIONAL_INTERPRETER_ARGS}"
   interpreter_args+=("${additional_interpreter_args[@]}")
@@ -325,6 +354,11 @@ command=(
   "$@"
 )
 
+_startup_phase "stage1: prepare command"
+if [[ -n "$_startup_trace" ]]; then
+  export RULES_PYTHON_STARTUP_TRACE_STAGE1="$_startup_trace"
+fi
+
 # We use `exec` instead of a child process so that signals sent directly (e.g.
 # using `kill`) to this process (the PID seen by the calling process) are
 # received by the Python process. Otherwise, this process receives the signal
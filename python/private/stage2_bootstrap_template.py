@@ -3,6 +3,10 @@
 # However, more setup is required to make the app's real main file runnable.
 
 import sys
+import time
+
+# Start of this bootstrap, for RULES_PYTHON_STARTUP_TRACE.
+_STAGE2_START = (time.perf_counter_ns(), len(sys.modules))
 
 # By default the Python interpreter prepends the directory containing this
 # script (following symlinks) to the import path. This is the cause of #9239,
@@ -21,13 +25,13 @@ if (
 ):
     del sys.path[0]
 
-import contextlib
-import os
-import re
-import runpy
-import types
-import uuid
-from functools import cache
+import contextlib  # noqa: E402
+import os  # noqa: E402
+import re  # noqa: E402
+import runpy  # noqa: E402
+import types  # noqa: E402
+import uuid  # noqa: E402
+from functools import cache  # noqa: E402
 
 # ===== Template substitutions start =====
 # We just put them in one place so its easy to tell which are used.
@@ -52,6 +56,12 @@ VENV_SITE_PACKAGES = "%venv_rel_site_packages%"
 # string, 1 or 0
 COVERAGE_INSTRUMENTED = "%coverage_instrumented%" == "1"
 
+# Whether branch coverage is measured in addition to line coverage.
+COVERAGE_BRANCH = "%coverage_branch%" == "True"
+
+# The coverage.py core to trace with: auto, ctrace, pytrace, or sysmon.
+COVERAGE_CORE = "%coverage_core%"
+
 # runfiles-root-relative path to a file with binary-specific build information
 # It uses forward slashes, so must be converted for proper usage on Windows.
 BUILD_DATA_FILE = "%build_data_file%"
@@ -60,6 +70,11 @@ BUILD_DATA_FILE = "%build_data_file%"
 
 IS_WINDOWS = os.name == "nt"
 IS_VERBOSE = bool(os.environ.get("RULES_PYTHON_BOOTSTRAP_VERBOSE"))
+# Path to write a trace of the startup phases to. Empty if disabled.
+STARTUP_TRACE = os.environ.get("RULES_PYTHON_STARTUP_TRACE", "")
+# Whether the coverage of child Python processes is collected and combined
+# with this process's coverage. See _maybe_collect_coverage.
+COVERAGE_PARALLEL = bool(os.environ.get("RULES_PYTHON_COVERAGE_PARALLEL"))
 
 # Windows APIs can be picky about slashes depending on the context,
 # so convert to backslashes to avoid any issues.
@@ -179,8 +194,124 @@ def is_verbose_coverage():
     return os.environ.get("VERBOSE_COVERAGE") or IS_VERBOSE
 
 
+# Startup phases as (name, start_ns, end_ns, imports) tuples, where the times
+# are from time.perf_counter_ns() and imports is the number of modules
+# imported during the phase.
+_startup_phases = []
+
+
+def record_startup_phase(name, start):
+    """Records a startup phase that began at `start`, if tracing startup.
+
+    Args:
+        name: Name of the phase.
+        start: A `(time.perf_counter_ns(), len(sys.modules))` tuple from the
+            beginning of the phase.
+    """
+    if STARTUP_TRACE:
+        start_ns, start_modules = start
+        _startup_phases.append(
+            (name, start_ns, time.perf_counter_ns(), len(sys.modules) - start_modules)
+        )
+
+
+@contextlib.contextmanager
+def startup_phase(name):
+    """Records the enclosed code as a startup phase, if tracing startup."""
+    start = (time.perf_counter_ns(), len(sys.modules))
+    yield
+    record_startup_phase(name, start)
+
+
+def write_startup_trace():
+    """Writes the startup phases to STARTUP_TRACE as a Chrome trace.
+
+    The trace combines the phases of the stage 1 bootstrap, passed in the
+    RULES_PYTHON_STARTUP_TRACE_STAGE1 environment variable, those of
+    `_bazel_site_init`, and those of this bootstrap. It can be viewed with
+    chrome://tracing or https://ui.perfetto.dev.
+    """
+    if not STARTUP_TRACE:
+        return
+    end_ns = time.perf_counter_ns()
+    num_modules = len(sys.modules)
+    import json
+
+    # The Python phases are timed with the monotonic perf_counter. They're
+    # shifted to wall clock time to line up with the stage 1 phases, which
+    # are timed with bash's EPOCHREALTIME.
+    wall_offset_ns = time.time_ns() - end_ns
+    pid = os.getpid()
+    events = []
+
+    def add_event(name, start_us, end_us, pid, args=None):
+        events.append(
+            {
+                "name": name,
+                "ph": "X",
+                "ts": start_us,
+                "dur": end_us - start_us,
+                "pid": pid,
+                "tid": 0,
+                "args": args or {},
+            }
+        )
+
+    # The stage 1 phases are "<pid>;<name>,<start_us>,<end_us>;...". The
+    # variable is removed so that child processes don't report them again.
+    stage1_pid, _, stage1_phases = os.environ.pop(
+        "RULES_PYTHON_STARTUP_TRACE_STAGE1", ""
+    ).partition(";")
+    stage1_end_us = None
+    for phase in stage1_phases.split(";"):
+        if not phase:
+            continue
+        name, start_us, end_us = phase.rsplit(",", 2)
+        stage1_end_us = int(end_us)
+        add_event(name, int(start_us), stage1_end_us, int(stage1_pid))
+
+    site_init = sys.modules.get("_bazel_site_init")
+    phases = getattr(site_init, "STARTUP_TRACE_PHASES", []) + _startup_phases
+    phases.append(("stage2", _STAGE2_START[0], end_ns, num_modules - _STAGE2_START[1]))
+    first_start_us = (min(p[1] for p in phases) + wall_offset_ns) // 1000
+    if stage1_end_us is not None and stage1_end_us < first_start_us:
+        # Between exec'ing the interpreter and running the first Python code
+        # of the bootstrap.
+        add_event("interpreter startup", stage1_end_us, first_start_us, pid)
+    for name, start_ns, phase_end_ns, imports in phases:
+        add_event(
+            name,
+            (start_ns + wall_offset_ns) // 1000,
+            (phase_end_ns + wall_offset_ns) // 1000,
+            pid,
+            {"imports": imports},
+        )
+
+    trace = {
+        "traceEvents": events,
+        "displayTimeUnit": "ms",
+        "otherData": {
+            "argv": sys.argv,
+            "python": sys.version,
+            "modules": num_modules,
+        },
+    }
+    path = STARTUP_TRACE
+    if os.path.isdir(path):
+        path = os.path.join(path, f"startup-{pid}.json")
+    with open(path, "w") as f:
+        json.dump(trace, f, indent=1)
+    print_verbose("wrote startup trace:", path)
+
+
 def find_runfiles_root(main_rel_path):
     """Finds the runfiles tree."""
+    # The stage 1 bootstrap already found and verified the runfiles root.
+    # It sets RUNFILES_DIR to it, too, so runfiles_envvar() doesn't probe.
+    runfiles_root = sys._xoptions.get("RULES_PYTHON_RUNFILES_ROOT")
+    if runfiles_root:
+        return runfiles_root
+
     # When the calling process used the runfiles manifest to resolve the
     # location of this stub script, the path may be expanded. This means
     # argv[0] may no longer point to a location inside the runfiles
@@ -295,8 +426,8 @@ def instrumented_file_paths():
                 yield (realpath, filename)
 
 
-def unresolve_symlinks(output_filename):
-    # type: (str) -> None
+def unresolve_symlinks(input_filename, output_filename, substitutions):
+    # type: (str, str, dict[str, str]) -> None
     """Replace realpath of instrumented files with the relative path in the lcov output.
 
     Though we are asking coveragepy to use relative file names, currently
@@ -307,19 +438,25 @@ def unresolve_symlinks(output_filename):
     upstream and the updated version is widely in use, this should be removed.
 
     See https://github.com/nedbat/coveragepy/issues/963.
+
+    Args:
+        input_filename: the lcov report to read.
+        output_filename: where to write the fixed up lcov report.
+        substitutions: maps the realpath of instrumented files to the
+            path to replace it with.
     """
-    substitutions = list(instrumented_file_paths())
-    if substitutions:
-        unfixed_file = output_filename + ".tmp"
-        os.rename(output_filename, unfixed_file)
-        with open(unfixed_file, "r") as unfixed:
-            with open(output_filename, "w") as output_file:
-                for line in unfixed:
-                    if line.startswith("SF:"):
-                        for realpath, filename in substitutions:
-                            line = line.replace(realpath, filename)
-                    output_file.write(line)
-        os.unlink(unfixed_file)
+
+    def fixed_lines(lines):
+        for line in lines:
+            if line.startswith("SF:"):
+                filename = substitutions.get(line[3:].rstrip("\n"))
+                if filename is not None:
+                    line = "SF:" + filename + "\n"
+            yield line
+
+    with open(input_filename, "r") as unfixed:
+        with open(output_filename, "w") as output_file:
+            output_file.writelines(fixed_lines(unfixed))
 
 
 def _run_py_path(main_filename, *, args, cwd=None):
@@ -347,14 +484,30 @@ def _run_py_module(module_name):
     runpy.run_module(module_name, alter_sys=True, run_name="__main__")
 
 
+def _get_coverage_core():
+    """Returns the coverage.py core to use, or None to let coverage.py decide."""
+    if COVERAGE_CORE in ("", "auto"):
+        return None
+    if COVERAGE_CORE == "sysmon" and sys.version_info < (3, 12):
+        # sys.monitoring (PEP 669) was added in Python 3.12.
+        return None
+    return COVERAGE_CORE
+
+
 @contextlib.contextmanager
 def _maybe_collect_coverage(enable):
     print_verbose_coverage("enabled:", enable)
     if not enable:
         yield
         return
-
-    instrumented_files = [abs_path for abs_path, _ in instrumented_file_paths()]
+    setup_start = (time.perf_counter_ns(), len(sys.modules))
+
+    # Maps the realpath of instrumented files to their path in the manifest.
+    # It's also used to fix up the lcov report afterwards.
+    path_substitutions = {}
+    for realpath, filename in instrumented_file_paths():
+        path_substitutions.setdefault(realpath, filename)
+    instrumented_files = list(path_substitutions)
     unique_dirs = {os.path.dirname(file) for file in instrumented_files}
     source = "\n\t".join(unique_dirs)
 
@@ -368,55 +521,98 @@ def _maybe_collect_coverage(enable):
     unique_id = uuid.uuid4()
 
     # We need for coveragepy to use relative paths.  This can only be configured
-    # using an rc file.
+    # using an rc file. The rc file has all the settings so that child
+    # processes started by `coverage.process_startup()` use them, too.
     rcfile_name = os.path.join(coverage_dir, ".coveragerc_{}".format(unique_id))
     disable_warnings = (
         "disable_warnings = module-not-imported, no-data-collected"
         if COVERAGE_INSTRUMENTED
         else ""
     )
+    omit = [
+        # Pipes can't be read back later, which can cause coverage to
+        # throw an error when trying to get its source code.
+        "/dev/fd/*",
+        # The mechanism for finding third-party packages in coverage-py
+        # only works for installed packages, not for runfiles. e.g:
+        #'$HOME/.local/lib/python3.10/site-packages',
+        # '/usr/lib/python',
+        # '/usr/lib/python3.10/site-packages',
+        # '/usr/local/lib/python3.10/dist-packages'
+        # see https://github.com/nedbat/coveragepy/blob/bfb0c708fdd8182b2a9f0fc403596693ef65e475/coverage/inorout.py#L153-L164
+        "*/external/*",
+    ]
+    if COVERAGE_PARALLEL:
+        # Each process writes its data to a file with a unique suffix, which
+        # are combined afterwards.
+        data_file = os.path.join(coverage_dir, ".coverage_{}".format(unique_id))
+        parallel_settings = f"""parallel = True
+data_file = {data_file}
+"""
+    else:
+        parallel_settings = ""
+    omit = "\n\t".join(omit)
     print_verbose_coverage("coveragerc file:", rcfile_name)
     with open(rcfile_name, "w") as rcfile:
         rcfile.write(
             f"""[run]
 relative_files = True
-{disable_warnings}
+branch = {COVERAGE_BRANCH}
+{parallel_settings}{disable_warnings}
 source =
 \t{source}
+omit =
+\t{omit}
 """
         )
+    orig_process_start = os.environ.get("COVERAGE_PROCESS_START")
+    orig_core = os.environ.get("COVERAGE_CORE")
+    core = _get_coverage_core()
+    if core:
+        # The environment variable is used instead of the rc file's `core`
+        # setting because older coverage.py versions understand it, too.
+        # Child processes inherit it.
+        print_verbose_coverage("core:", core)
+        os.environ["COVERAGE_CORE"] = core
     try:
         cov = coverage.Coverage(
             config_file=rcfile_name,
-            branch=True,
             # NOTE: The messages arg controls what coverage prints to stdout/stderr,
             # which can interfere with the Bazel coverage command. Enabling message
             # output is only useful for debugging coverage support.
             messages=is_verbose_coverage(),
-            omit=[
-                # Pipes can't be read back later, which can cause coverage to
-                # throw an error when trying to get its source code.
-                "/dev/fd/*",
-                # The mechanism for finding third-party packages in coverage-py
-                # only works for installed packages, not for runfiles. e.g:
-                #'$HOME/.local/lib/python3.10/site-packages',
-                # '/usr/lib/python',
-                # '/usr/lib/python3.10/site-packages',
-                # '/usr/local/lib/python3.10/dist-packages'
-                # see https://github.com/nedbat/coveragepy/blob/bfb0c708fdd8182b2a9f0fc403596693ef65e475/coverage/inorout.py#L153-L164
-                "*/external/*",
-            ],
         )
         cov.start()
+        if COVERAGE_PARALLEL:
+            # Makes `_bazel_site_init` of child Python processes start
+            # collecting coverage, too.
+            os.environ["COVERAGE_PROCESS_START"] = rcfile_name
+        record_startup_phase("stage2: coverage setup", setup_start)
         try:
             yield
         finally:
             cov.stop()
+            if COVERAGE_PARALLEL:
+                cov.save()
+                # Combine the data of this process and its child processes.
+                # Child processes that are still running are left out.
+                cov = coverage.Coverage(
+                    config_file=rcfile_name,
+                    messages=is_verbose_coverage(),
+                    data_suffix=False,
+                )
+                cov.combine()
             lcov_path = os.path.join(coverage_dir, "pylcov_{}.dat".format(unique_id))
-            print_verbose_coverage("generating lcov from:", lcov_path)
+            # If paths have to be fixed up, the report is generated elsewhere
+            # and rewritten to lcov_path in a single pass.
+            if path_substitutions:
+                report_path = lcov_path + ".unfixed"
+            else:
+                report_path = lcov_path
+            print_verbose_coverage("generating lcov from:", report_path)
             try:
                 cov.lcov_report(
-                    outfile=lcov_path,
+                    outfile=report_path,
                     # Ignore errors because sometimes instrumented files aren't
                     # readable afterwards. e.g. if they come from /dev/fd or if
                     # they were transient code-under-test in /tmp
@@ -431,9 +627,22 @@ source =
                     "no coverage data collected; skipping lcov report:", lcov_path
                 )
             else:
-                if os.path.isfile(lcov_path):
-                    unresolve_symlinks(lcov_path)
+                if report_path != lcov_path and os.path.isfile(report_path):
+                    unresolve_symlinks(report_path, lcov_path, path_substitutions)
+                    os.unlink(report_path)
+            if COVERAGE_PARALLEL:
+                # Delete the combined data file.
+                cov.erase()
     finally:
+        if orig_process_start is None:
+            os.environ.pop("COVERAGE_PROCESS_START", None)
+        else:
+            os.environ["COVERAGE_PROCESS_START"] = orig_process_start
+        if core:
+            if orig_core is None:
+                os.environ.pop("COVERAGE_CORE", None)
+            else:
+                os.environ["COVERAGE_CORE"] = orig_core
         try:
             os.unlink(rcfile_name)
         except OSError as err:
@@ -490,18 +699,21 @@ def main():
     print_verbose("initial environ:", mapping=os.environ)
     print_verbose("initial sys.path:", values=sys.path)
 
+    record_startup_phase("stage2: imports", _STAGE2_START)
+
     main_rel_path = None
     # todo: things happen to work because find_runfiles_root
     # ends up using stage2_bootstrap, and ends up computing the proper
     # runfiles root
-    if MAIN_PATH:
-        main_rel_path = MAIN_PATH
-        if IS_WINDOWS:
-            main_rel_path = main_rel_path.replace("/", os.sep)
+    with startup_phase("stage2: find runfiles root"):
+        if MAIN_PATH:
+            main_rel_path = MAIN_PATH
+            if IS_WINDOWS:
+                main_rel_path = main_rel_path.replace("/", os.sep)
 
-        runfiles_root = find_runfiles_root(main_rel_path)
-    else:
-        runfiles_root = find_runfiles_root("")
+            runfiles_root = find_runfiles_root(main_rel_path)
+        else:
+            runfiles_root = find_runfiles_root("")
 
     site_packages = os.path.join(runfiles_root, VENV_ROOT, VENV_SITE_PACKAGES)
     if site_packages not in sys.path and os.path.exists(site_packages):
@@ -518,11 +730,13 @@ def main():
         print_verbose(
             f"sys.path missing expected site-packages: adding {site_packages}"
         )
-        _add_site_packages(site_packages)
+        with startup_phase("stage2: add site-packages"):
+            _add_site_packages(site_packages)
 
     print_verbose("runfiles root:", runfiles_root)
 
-    runfiles_envkey, runfiles_envvalue = runfiles_envvar(runfiles_root)
+    with startup_phase("stage2: runfiles envvar"):
+        runfiles_envkey, runfiles_envvalue = runfiles_envvar(runfiles_root)
     if runfiles_envkey:
         os.environ[runfiles_envkey] = runfiles_envvalue
 
@@ -572,11 +786,17 @@ def main():
     if os.environ.get("COVERAGE_DIR"):
         import _bazel_site_init
 
-        coverage_enabled = _bazel_site_init.COVERAGE_SETUP
+        # A parent process collecting coverage with
+        # RULES_PYTHON_COVERAGE_PARALLEL makes `_bazel_site_init` start
+        # collecting it already.
+        coverage_enabled = _bazel_site_init.COVERAGE_SETUP and not getattr(
+            _bazel_site_init, "COVERAGE_STARTED", False
+        )
     else:
         coverage_enabled = False
 
     with _maybe_collect_coverage(enable=coverage_enabled):
+        write_startup_trace()
         if MAIN_PATH:
             # The first arg is this bootstrap, so drop that for the re-invocation.
             _run_py_path(main_filename, args=sys.argv[1:])
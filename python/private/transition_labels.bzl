@@ -10,9 +10,12 @@ load(":common_labels.bzl", "labels")
 _BASE_TRANSITION_LABELS = [
     labels.ADD_SRCS_TO_RUNFILES,
     labels.BOOTSTRAP_IMPL,
+    labels.COVERAGE_BRANCH,
+    labels.COVERAGE_CORE,
     labels.DEBUGGER,
     labels.EXEC_TOOLS_TOOLCHAIN,
     "//command_line_option:extra_toolchains",
+    labels.IMPORT_INDEX,
     labels.PIP_ENV_MARKER_CONFIG,
     labels.PIP_WHL_OSX_VERSION,
     labels.PRECOMPILE,
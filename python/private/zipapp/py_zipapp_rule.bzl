@@ -21,13 +21,24 @@ load("//python/private:py_runtime_info.bzl", "PyRuntimeInfo")
 load("//python/private:toolchain_types.bzl", "EXEC_TOOLS_TOOLCHAIN_TYPE", "LAUNCHER_MAKER_TOOLCHAIN_TYPE")
 load("//python/private:transition_labels.bzl", "TRANSITION_LABELS")
 
+# The number of threads the zipper compresses on. It's bounded, and declared
+# to Bazel with _zipper_resource_set, so that concurrent actions don't
+# oversubscribe the machine.
+_ZIPPER_JOBS = 4
+
+def _zipper_resource_set(_os, _inputs_size):
+    return {"cpu": _ZIPPER_JOBS}
+
 def _is_symlink(f):
     if hasattr(f, "is_symlink"):
         return str(int(f.is_symlink))
     else:
         return "-1"
 
-def _create_zipapp_main_py(ctx, py_runtime, py_executable, stage2_bootstrap, runfiles, explicit_symlinks):
+def _add_zip_main_args(ctx, args, py_runtime, py_executable, stage2_bootstrap):
+    # NOTE: The zipper creates __main__.py itself so that the hash of the
+    # application files it embeds is computed while the files are read into
+    # the zip, instead of reading all of them in a separate action.
     venv_python_exe = py_executable.venv_python_exe
     if venv_python_exe:
         venv_python_exe_path = runfiles_root_path(ctx, venv_python_exe.short_path)
@@ -39,43 +50,25 @@ def _create_zipapp_main_py(ctx, py_runtime, py_executable, stage2_bootstrap, run
     else:
         python_binary_actual_path = py_runtime.interpreter_path
 
-    zip_main_py = ctx.actions.declare_file(ctx.label.name + ".zip_main.py")
-
-    args = ctx.actions.args()
-    args.add(py_runtime.zip_main_template, format = "--template=%s")
-    args.add(zip_main_py, format = "--output=%s")
-
+    args.add(py_runtime.zip_main_template, format = "--main-template=%s")
     args.add(
         "%EXTRACT_DIR%=" + paths.join(
             (ctx.label.repo_name or "_main"),
             ctx.label.package,
             ctx.label.name,
         ),
-        format = "--substitution=%s",
+        format = "--main-substitution=%s",
     )
-    args.add("%python_binary%=" + venv_python_exe_path, format = "--substitution=%s")
-    args.add("%python_binary_actual%=" + python_binary_actual_path, format = "--substitution=%s")
-    args.add("%stage2_bootstrap%=" + runfiles_root_path(ctx, stage2_bootstrap.short_path), format = "--substitution=%s")
-    args.add("%workspace_name%=" + ctx.workspace_name, format = "--substitution=%s")
-
-    hash_files_manifest = ctx.actions.args()
-    hash_files_manifest.use_param_file("--hash_files_manifest=%s", use_always = True)
-    hash_files_manifest.set_param_file_format("multiline")
-
-    inputs = builders.DepsetBuilder()
-    inputs.add(py_runtime.zip_main_template)
-    _build_manifest(ctx, hash_files_manifest, runfiles, explicit_symlinks, inputs)
-
-    actions_run(
-        ctx,
-        executable = ctx.attr._zip_main_maker,
-        arguments = [args, hash_files_manifest],
-        inputs = inputs.build(),
-        outputs = [zip_main_py],
-        mnemonic = "PyZipAppCreateMainPy",
-        progress_message = "Generating zipapp __main__.py: %{label}",
-    )
-    return zip_main_py
+    args.add("%python_binary%=" + venv_python_exe_path, format = "--main-substitution=%s")
+    args.add("%python_binary_actual%=" + python_binary_actual_path, format = "--main-substitution=%s")
+    args.add("%stage2_bootstrap%=" + runfiles_root_path(ctx, stage2_bootstrap.short_path), format = "--main-substitution=%s")
+    args.add("%workspace_name%=" + ctx.workspace_name, format = "--main-substitution=%s")
+    args.add("%run_from_zip%=" + ("1" if ctx.attr.run_from_zip else "0"), format = "--main-substitution=%s")
+    if py_executable.main:
+        main_path = runfiles_root_path(ctx, py_executable.main.short_path)
+    else:
+        main_path = ""
+    args.add("%main%=" + main_path, format = "--main-substitution=%s")
 
 def _map_zip_empty_filenames(list_paths_cb):
     return ["rf-empty|" + path for path in list_paths_cb().to_list()]
@@ -148,17 +141,8 @@ def _create_zip(ctx, py_runtime, py_executable, stage2_bootstrap):
         py_executable.venv_interpreter_symlinks,
         py_executable.venv_app_symlinks,
     ])
-    zip_main = _create_zipapp_main_py(
-        ctx,
-        py_runtime,
-        py_executable,
-        stage2_bootstrap,
-        runfiles,
-        explicit_symlinks,
-    )
     inputs = builders.DepsetBuilder()
-    manifest.add("regular|0|__main__.py|{}".format(zip_main.path))
-    inputs.add(zip_main)
+    inputs.add(py_runtime.zip_main_template)
     _build_manifest(ctx, manifest, runfiles, explicit_symlinks, inputs)
 
     zipper_args = ctx.actions.args()
@@ -170,7 +154,16 @@ def _create_zip(ctx, py_runtime, py_executable, stage2_bootstrap):
     )
     if ctx.attr.compression:
         zipper_args.add(ctx.attr.compression, format = "--compression=%s")
+
+        # Compress on several threads; the output is identical to serial
+        # compression.
+        zipper_args.add(str(_ZIPPER_JOBS), format = "--jobs=%s")
+        if ctx.attr.store_compressed:
+            zipper_args.add("--store-compressed")
+    if ctx.attr.dedup != "none":
+        zipper_args.add(ctx.attr.dedup, format = "--dedup=%s")
     zipper_args.add("--runfiles-dir=runfiles")
+    _add_zip_main_args(ctx, zipper_args, py_runtime, py_executable, stage2_bootstrap)
 
     is_windows = is_windows_platform(ctx)
     zipper_args.add("\\" if is_windows else "/", format = "--target-platform-pathsep=%s")
@@ -181,6 +174,7 @@ def _create_zip(ctx, py_runtime, py_executable, stage2_bootstrap):
         arguments = [manifest, zipper_args],
         inputs = inputs.build(),
         outputs = [output],
+        resource_set = _zipper_resource_set if ctx.attr.compression else None,
         mnemonic = "PyZipAppCreateZip",
         progress_message = "Reticulating zipapp archive: %{label} into %{output}",
     )
@@ -208,6 +202,7 @@ def _create_shell_bootstrap(ctx, py_runtime, py_executable, stage2_bootstrap):
             '"{}"'.format(v)
             for v in py_executable.interpreter_args
         ]),
+        "%RUN_FROM_ZIP%": "1" if ctx.attr.run_from_zip else "0",
         "%STAGE2_BOOTSTRAP%": runfiles_root_path(ctx, stage2_bootstrap.short_path),
     }
     ctx.actions.expand_template(
@@ -317,6 +312,9 @@ A `py_binary` or `py_test` (or equivalent) target to package.
 The compression level to use.
 
 Typically 0 to 9, with higher numbers being to compress more.
+
+When compression is enabled, files are compressed in parallel. The resulting
+archive is identical to one compressed serially.
 """,
         default = "",
     ),
@@ -349,12 +347,76 @@ more information about risks and considerations.
 :::
 """,
     ),
+    "dedup": attr.string(
+        doc = """
+How to store files whose content is identical to an earlier file in the zip.
+
+This commonly occurs when the same file is part of the runfiles under
+multiple paths, e.g. because of venv symlinks.
+
+* `none`: Store each file separately.
+* `copy`: Store each file separately, but reuse the already compressed data of
+  the earlier file instead of compressing it again.
+* `symlink`: Store a relative symlink to the earlier file. Only files with the
+  same permissions are deduplicated this way. This makes the zip smaller, but
+  requires the zip to be extracted somewhere symlinks can be created.
+
+Files smaller than 4 KiB are never deduplicated.
+
+:::{versionadded} VERSION_NEXT_FEATURE
+:::
+""",
+        default = "none",
+        values = ["none", "copy", "symlink"],
+    ),
     "executable": attr.bool(
         doc = """
 Whether the output should be an executable zip file.
 """,
         default = True,
     ),
+    "run_from_zip": attr.bool(
+        doc = """
+Whether to run the program directly from the zip instead of extracting it.
+
+The program's modules are imported from the zip using `zipimport`, and
+runfiles looked up with the runfiles library are extracted on demand, as are
+extension modules when they're imported. This avoids extracting the whole zip
+before the program starts.
+
+The program falls back to extracting the zip if it can't be run from it:
+when the binary uses `main_module`, when the interpreter is within the zip,
+when coverage is enabled, when `RUN_UNDER_RUNFILES=1` is set, or when imports
+may need to follow a symlink in the zip, which `zipimport` can't do. The zip has
+such symlinks when {obj}`dedup` is `symlink` and duplicates Python files, and
+when the binary's venv site-packages has symlinks, e.g. with
+{flag}`--venvs_site_packages=yes`.
+
+:::{note}
+Code that uses `__file__` to find files next to it won't find them, because
+`__file__` refers to a path within the zip. Use the runfiles library instead.
+:::
+
+:::{versionadded} VERSION_NEXT_FEATURE
+:::
+""",
+        default = False,
+    ),
+    "store_compressed": attr.bool(
+        doc = """
+Whether to store files uncompressed if compressing them is unlikely to make
+them smaller.
+
+Files with extensions of typically already-compressed formats (e.g. `.whl`,
+`.zip`, `.gz`, `.npz`) are stored, and so are files whose first 64 KiB don't
+compress to less than 90% of their size. Only has an effect if
+{attr}`compression` is set.
+
+:::{versionadded} VERSION_NEXT_FEATURE
+:::
+""",
+        default = False,
+    ),
     # Required to opt-in to the transition feature.
     "_allowlist_function_transition": attr.label(
         default = "@bazel_tools//tools/allowlists/function_transition_allowlist",
@@ -375,10 +437,6 @@ Whether the output should be an executable zip file.
             "@platforms//os:windows",
         ],
     ),
-    "_zip_main_maker": attr.label(
-        cfg = "exec",
-        default = "//tools/private/zipapp:zip_main_maker",
-    ),
     "_zip_shell_template": attr.label(
         default = ":zip_shell_template",
         allow_single_file = True,
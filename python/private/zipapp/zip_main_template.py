@@ -25,7 +25,6 @@ del sys.path[0]
 
 import os  # noqa: E402
 import shutil  # noqa: E402
-import stat  # noqa: E402
 import subprocess  # noqa: E402
 import tempfile  # noqa: E402
 import zipfile  # noqa: E402
@@ -42,8 +41,21 @@ _WORKSPACE_NAME = "%workspace_name%"
 # relative path under EXTRACT_ROOT to extract to.
 EXTRACT_DIR = "%EXTRACT_DIR%"
 APP_HASH = "%APP_HASH%"
+# Whether to run directly from the zip, using zipimport, instead of extracting
+# it first. string, 1 or 0
+RUN_FROM_ZIP = "%run_from_zip%" == "1"
+# runfiles-root-relative path to the user's main file. Only used when running
+# directly from the zip. It uses forward slashes, like the zip member names.
+_MAIN_PATH = "%main%"
 
 EXTRACT_ROOT = os.environ.get("RULES_PYTHON_EXTRACT_ROOT")
+# File created in an EXTRACT_ROOT extraction once it's complete.
+_EXTRACT_COMPLETE_MARKER = ".extract_complete"
+# Minimum number of files for extracting them on multiple threads.
+_PARALLEL_EXTRACT_MIN_FILES = 32
+# Set when the zip re-runs itself with the program's interpreter to run
+# directly from the zip.
+_ZIP_RERUN_ENV = "RULES_PYTHON_ZIPAPP_RERUN"
 IS_WINDOWS = os.name == "nt"
 
 
@@ -158,6 +170,15 @@ def find_binary(runfiles_root, bin_name):
         return search_path(bin_name)
 
 
+def _extract_file(zf, info, file_path, attrs):
+    with zf.open(info) as src, open(file_path, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    # Of the st_mode bits, we set the lower 12 bits, which are the file mode
+    # bits (since the file type bits can't be set by chmod anyway).
+    if attrs != 0:  # Rumor has it these can be 0 for zips created on Windows.
+        os.chmod(file_path, attrs & 0o7777)
+
+
 def extract_zip(zip_path, dest_dir):
     """Extracts the contents of a zip file, preserving the unix file mode bits.
 
@@ -166,74 +187,424 @@ def extract_zip(zip_path, dest_dir):
     Ideally the zipfile module should set these bits, but it doesn't. See:
     https://bugs.python.org/issue15795.
 
+    Regular files are extracted on a thread pool when there are many of them;
+    decompressing and writing files mostly releases the GIL.
+
     Args:
         zip_path: The path to the zip file to extract
-        dest_dir: The path to the destination directory
+        dest_dir: The path to the destination directory. It must be empty or
+            not exist.
     """
     zip_path = get_windows_path_with_unc_prefix(zip_path)
     dest_dir = get_windows_path_with_unc_prefix(dest_dir)
     with zipfile.ZipFile(zip_path) as zf:
+        dirs = set()
+        files = []
+        symlinks = []
         for info in zf.infolist():
             file_path = os.path.abspath(join(dest_dir, info.filename))
-            # If the file exists, it might be a symlink or read-only file from a previous extraction.
-            # Unlink it first so zipfile.extract doesn't corrupt the symlink target or fail on read-only files.
-            if os.path.lexists(file_path) and not os.path.isdir(file_path):
-                try:
-                    os.unlink(file_path)
-                except OSError:
-                    # On Windows, unlinking a read-only file fails.
-                    os.chmod(file_path, stat.S_IWRITE)
-                    os.unlink(file_path)
-
-            zf.extract(info, dest_dir)
+            if info.is_dir():
+                dirs.add(file_path)
+                continue
+            dirs.add(dirname(file_path))
             # The Unix st_mode bits (see "man 7 inode") are stored in the upper 16
             # bits of external_attr.
             attrs = info.external_attr >> 16
             # Symlink bit in st_mode is 0o120000.
             if (attrs & 0o170000) == 0o120000:
-                with open(file_path, "r") as f:
-                    target = f.read()
-                os.remove(file_path)
-                if IS_WINDOWS:
-                    entry_path = normpath(join(dirname(info.filename), target))
-                    # Zip lookup uses forward slashes, target has backslashes.
-                    entry_path = entry_path.replace("\\", "/")
-                    try:
-                        target_is_directory = zf.getinfo(entry_path).is_dir()
-                    except KeyError:
-                        # Directories aren't stored in zips, so a missing
-                        # target means it points to a directory.
-                        target_is_directory = True
-                else:
-                    target_is_directory = False
-                os.symlink(target, file_path, target_is_directory=target_is_directory)
-            # Of those, we set the lower 12 bits, which are the
-            # file mode bits (since the file type bits can't be set by chmod anyway).
-            elif attrs != 0:  # Rumor has it these can be 0 for zips created on Windows.
-                os.chmod(file_path, attrs & 0o7777)
+                symlinks.append((info, file_path))
+            else:
+                files.append((info, file_path, attrs))
+
+        # Create directories upfront so that the threads don't race to
+        # create them.
+        for dir_path in sorted(dirs):
+            os.makedirs(dir_path, exist_ok=True)
+
+        if len(files) >= _PARALLEL_EXTRACT_MIN_FILES:
+            # Only imported when needed because it's slow to import.
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor() as executor:
+                # Consume the results to propagate errors.
+                for _ in executor.map(lambda args: _extract_file(zf, *args), files):
+                    pass
+        else:
+            for args in files:
+                _extract_file(zf, *args)
+
+        for info, file_path in symlinks:
+            target = zf.read(info).decode("utf-8")
+            if IS_WINDOWS:
+                entry_path = normpath(join(dirname(info.filename), target))
+                # Zip lookup uses forward slashes, target has backslashes.
+                entry_path = entry_path.replace("\\", "/")
+                try:
+                    target_is_directory = zf.getinfo(entry_path).is_dir()
+                except KeyError:
+                    # Directories aren't stored in zips, so a missing
+                    # target means it points to a directory.
+                    target_is_directory = True
+            else:
+                target_is_directory = False
+            os.symlink(target, file_path, target_is_directory=target_is_directory)
+
+
+def extract_zip_atomically(zip_path, dest_dir):
+    """Extracts a zip to `dest_dir` unless a complete extraction is already there.
+
+    The zip is extracted to a temporary sibling directory that is renamed to
+    `dest_dir` once it's complete, so concurrent launches never see a
+    partially extracted tree. If another launch wins the race to rename its
+    extraction into place, that one is used.
+
+    Args:
+        zip_path: The path to the zip file to extract
+        dest_dir: The path to the destination directory
+    """
+    if os.path.exists(join(dest_dir, _EXTRACT_COMPLETE_MARKER)):
+        print_verbose("using existing extraction:", dest_dir)
+        return
+
+    parent_dir = dirname(dest_dir)
+    os.makedirs(parent_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(".tmp", basename(dest_dir) + ".", parent_dir)
+    try:
+        extract_zip(zip_path, tmp_dir)
+        with open(join(tmp_dir, _EXTRACT_COMPLETE_MARKER), "w"):
+            pass
+        try:
+            os.rename(tmp_dir, dest_dir)
+        except OSError:
+            if os.path.exists(join(dest_dir, _EXTRACT_COMPLETE_MARKER)):
+                print_verbose("using concurrently created extraction:", dest_dir)
+                return
+            # An incomplete extraction, e.g. from a launch that was killed
+            # or from an older launcher that extracted in place. Replace it,
+            # serialized with the other launches doing the same.
+            _replace_incomplete_extraction(tmp_dir, dest_dir)
+        else:
+            print_verbose("extracted to:", dest_dir)
+    finally:
+        shutil.rmtree(tmp_dir, True)
+
+
+def _replace_incomplete_extraction(tmp_dir, dest_dir):
+    """Replaces an incomplete extraction at `dest_dir` with `tmp_dir`.
+
+    Launches replacing the same directory hold a lock while doing so, and
+    re-check the marker under it. Otherwise, a launch that saw the old
+    incomplete directory could move aside the complete tree another launch
+    just renamed into place, while that launch runs from it.
+    """
+    parent_dir = dirname(dest_dir)
+    try:
+        import fcntl
+    except ImportError:
+        # Windows can't rename a directory that is in use, so the race
+        # doesn't delete a running program's files there.
+        fcntl = None
+
+    with open(dest_dir + ".lock", "a") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        if os.path.exists(join(dest_dir, _EXTRACT_COMPLETE_MARKER)):
+            print_verbose("using concurrently created extraction:", dest_dir)
+            return
+        stale_dir = tempfile.mkdtemp(".stale", basename(dest_dir) + ".", parent_dir)
+        try:
+            os.rename(dest_dir, join(stale_dir, "old"))
+        except OSError:
+            pass
+        shutil.rmtree(stale_dir, True)
+        try:
+            os.rename(tmp_dir, dest_dir)
+        except OSError:
+            if not os.path.exists(join(dest_dir, _EXTRACT_COMPLETE_MARKER)):
+                raise
+        print_verbose("replaced incomplete extraction:", dest_dir)
+
+
+def get_persistent_extract_root(on_demand=False):
+    """Returns the directory under EXTRACT_ROOT that is unique to this zip.
+
+    Args:
+        on_demand: Whether the directory is for extracting members on demand
+            when running from the zip. Full and on-demand extraction use
+            separate directories, so that replacing an incomplete full
+            extraction never removes files a running program uses.
+    """
+    suffix = ".ondemand" if on_demand else ""
+    # Shorten the path for Windows in case long path support is disabled
+    if IS_WINDOWS:
+        hash_dir = APP_HASH[0:32] + suffix
+        extract_dir = basename(EXTRACT_DIR)
+        return join(EXTRACT_ROOT, extract_dir, hash_dir)
+    else:
+        extract_root = join(EXTRACT_ROOT, EXTRACT_DIR, APP_HASH + suffix)
+        return get_windows_path_with_unc_prefix(extract_root)
 
 
 # Create the runfiles tree by extracting the zip file
 def create_runfiles_root():
     if EXTRACT_ROOT:
-        # Shorten the path for Windows in case long path support is disabled
-        if IS_WINDOWS:
-            hash_dir = APP_HASH[0:32]
-            extract_dir = basename(EXTRACT_DIR)
-            extract_root = join(EXTRACT_ROOT, extract_dir, hash_dir)
-        else:
-            extract_root = join(EXTRACT_ROOT, EXTRACT_DIR, APP_HASH)
-            extract_root = get_windows_path_with_unc_prefix(extract_root)
+        extract_root = get_persistent_extract_root()
+        # The directory is unique to the zip's content, so an extraction that
+        # was completed by an earlier launch can be reused as-is.
+        extract_zip_atomically(dirname(__file__), extract_root)
     else:
         extract_root = tempfile.mkdtemp("", "Bazel.runfiles_")
+        extract_zip(dirname(__file__), extract_root)
+        print_verbose("extracted to:", extract_root)
 
-    extract_zip(dirname(__file__), extract_root)
-    print_verbose("extracted to:", extract_root)
     # IMPORTANT: Later code does `rm -fr` on dirname(runfiles_root) -- it's
     # important that deletion code be in sync with this directory structure
     return join(extract_root, "runfiles")
 
 
+def extract_member(zf, info, dest_dir):
+    """Extracts a single zip member, unless an earlier run already did.
+
+    The file is written to a temporary name first, so runs sharing `dest_dir`
+    never see a partially written file.
+
+    Returns:
+        The path of the extracted file.
+    """
+    file_path = join(dest_dir, *info.filename.split("/"))
+    if os.path.exists(file_path):
+        return file_path
+    os.makedirs(dirname(file_path), exist_ok=True)
+    tmp_path = "{}.{}.tmp".format(file_path, os.getpid())
+    with zf.open(info) as src, open(tmp_path, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    attrs = info.external_attr >> 16
+    if attrs & 0o7777:
+        os.chmod(tmp_path, attrs & 0o7777)
+    os.replace(tmp_path, file_path)
+    return file_path
+
+
+class ZipExtensionFinder:
+    """Finds extension modules in the zip, extracting them on first import.
+
+    zipimport only imports Python source and bytecode, so extension modules
+    on sys.path entries (or package paths) within the zip are extracted to
+    disk when they're imported.
+    """
+
+    def __init__(self, zf, extract_dir):
+        self._zf = zf
+        self._prefix = zf.filename + os.sep
+        self._members = {info.filename: info for info in zf.infolist()}
+        self._extract_dir = extract_dir
+
+    def find_spec(self, fullname, path=None, target=None):
+        from importlib.machinery import EXTENSION_SUFFIXES, ExtensionFileLoader
+        from importlib.util import spec_from_file_location
+
+        tail = fullname.rpartition(".")[2]
+        for entry in sys.path if path is None else path:
+            if not isinstance(entry, str) or not entry.startswith(self._prefix):
+                continue
+            entry_dir = entry[len(self._prefix) :].replace(os.sep, "/")
+            for suffix in EXTENSION_SUFFIXES:
+                info = self._members.get(entry_dir + "/" + tail + suffix)
+                if info is None:
+                    continue
+                print_verbose("extracting extension module:", info.filename)
+                file_path = extract_member(self._zf, info, self._extract_dir)
+                return spec_from_file_location(
+                    fullname, file_path, loader=ExtensionFileLoader(fullname, file_path)
+                )
+        return None
+
+
+def find_zip_site_packages(member_names):
+    """Finds the zip member directory of the binary's venv site-packages."""
+    if _PYTHON_BINARY_VENV:
+        venv_bin = _PYTHON_BINARY_VENV.replace("\\", "/")
+        prefix = "runfiles/" + dirname(dirname(venv_bin)) + "/"
+    else:
+        # The venv is a sibling of the stage2 bootstrap.
+        prefix = "runfiles/" + dirname(_STAGE2_BOOTSTRAP.replace("\\", "/")) + "/"
+    suffix = "/site-packages/_bazel_site_init.py"
+    candidates = [
+        name[: -len("/_bazel_site_init.py")]
+        for name in member_names
+        if name.startswith(prefix) and name.endswith(suffix)
+    ]
+    if len(candidates) != 1:
+        return None
+    return candidates[0]
+
+
+def find_importable_symlink(zf, site_packages):
+    """Finds a symlink member that imports from the zip may need to follow.
+
+    zipimport can't follow symlink members, so the program can't run from the
+    zip if one is a module, a directory, or within the venv's site-packages.
+    Symlinks to other files are fine; the runfiles library extracts them.
+
+    Returns:
+        The name of such a member, or None.
+    """
+    from importlib.machinery import EXTENSION_SUFFIXES
+
+    module_suffixes = (".py", ".pyc") + tuple(EXTENSION_SUFFIXES)
+    members = {info.filename: info for info in zf.infolist()}
+    site_packages_prefix = site_packages + "/"
+    for name, info in members.items():
+        # Symlink bit in st_mode is 0o120000.
+        if ((info.external_attr >> 16) & 0o170000) != 0o120000:
+            continue
+        if name.startswith(site_packages_prefix) or name.endswith(module_suffixes):
+            return name
+        target = normpath(join(dirname(name), zf.read(info).decode("utf-8")))
+        # Directories aren't stored in zips, so a target that isn't a member
+        # is a directory.
+        if target.replace("\\", "/") not in members:
+            return name
+    return None
+
+
+def add_zip_site_packages(zf, site_packages):
+    """Adds a site-packages directory within the zip to sys.path.
+
+    This is the zipimport equivalent of `site.addsitedir()`, which can't list
+    directories within a zip: `.pth` files in it are processed, which runs
+    the binary's `_bazel_site_init` to add its import paths.
+    """
+    import posixpath
+
+    prev_len = len(sys.path)
+    sys.path.append(join(zf.filename, *site_packages.split("/")))
+    prefix = site_packages + "/"
+    pth_names = sorted(
+        name
+        for name in zf.namelist()
+        if name.startswith(prefix)
+        and name.endswith(".pth")
+        and "/" not in name[len(prefix) :]
+    )
+    for name in pth_names:
+        for line in zf.read(name).decode("utf-8").splitlines():
+            if not line.strip() or line.startswith("#"):
+                continue
+            if line.startswith(("import ", "import\t")):
+                exec(line)
+                continue
+            dir_name = posixpath.normpath(posixpath.join(site_packages, line.rstrip()))
+            path = join(zf.filename, *dir_name.split("/"))
+            if path not in sys.path:
+                sys.path.append(path)
+
+    # Put the binary specific paths before the runtime's site-packages, like
+    # a venv's site-packages would be.
+    added = sys.path[prev_len:]
+    del sys.path[prev_len:]
+    offset = len(sys.path)
+    for i, path in enumerate(sys.path):
+        if path.endswith("-packages"):
+            offset = i
+            break
+    sys.path[offset:offset] = added
+    print_verbose("sys.path for running from zip:", values=sys.path)
+
+
+def run_from_zip(args):
+    """Runs the program directly from the zip, without extracting it.
+
+    Returns:
+        False if the program can't be run from the zip; otherwise this
+        function doesn't return.
+    """
+    if not _MAIN_PATH:
+        print_verbose("can't run from zip: only main files are supported")
+        return False
+    if os.environ.get("COVERAGE_DIR"):
+        print_verbose("can't run from zip: coverage requires extraction")
+        return False
+    if os.environ.get("RUN_UNDER_RUNFILES") == "1":
+        print_verbose("can't run from zip: RUN_UNDER_RUNFILES requires extraction")
+        return False
+    if not os.path.isabs(_PYTHON_BINARY_ACTUAL) and os.sep in normpath(
+        _PYTHON_BINARY_ACTUAL
+    ):
+        print_verbose("can't run from zip: the interpreter is within the zip")
+        return False
+    python_program = find_binary("", _PYTHON_BINARY_ACTUAL)
+    if python_program is None:
+        raise AssertionError("Could not find python binary: " + _PYTHON_BINARY_ACTUAL)
+
+    zip_path = os.path.abspath(dirname(__file__))
+    zf = zipfile.ZipFile(zip_path)
+    site_packages = find_zip_site_packages(zf.namelist())
+    if site_packages is None:
+        print_verbose("can't run from zip: site-packages not found in the zip")
+        return False
+    symlink = find_importable_symlink(zf, site_packages)
+    if symlink is not None:
+        print_verbose("can't run from zip: imports may need the symlink:", symlink)
+        return False
+
+    if os.path.realpath(python_program) != os.path.realpath(
+        sys.executable
+    ) and not os.environ.get(_ZIP_RERUN_ENV):
+        # Run the zip again with the program's interpreter, which then takes
+        # this code path again and runs the program in-process.
+        env = dict(os.environ)
+        env[_ZIP_RERUN_ENV] = "1"
+        argv = [python_program, zip_path] + args
+        print_verbose("rerunning with the program's interpreter:", values=argv)
+        sys.stdout.flush()
+        if IS_WINDOWS:
+            sys.exit(subprocess.call(argv, env=env))
+        # The rerun cleans up after itself, so this process can be replaced.
+        os.execve(python_program, argv, env)
+    os.environ.pop(_ZIP_RERUN_ENV, None)
+
+    if EXTRACT_ROOT:
+        extract_dir = get_persistent_extract_root(on_demand=True)
+    else:
+        import atexit
+
+        extract_dir = tempfile.mkdtemp("", "Bazel.runfiles_")
+        atexit.register(shutil.rmtree, extract_dir, True)
+    print_verbose("running from zip; extracting on demand to:", extract_dir)
+
+    # Runfiles are looked up in the zip by the runfiles library, and
+    # _bazel_site_init must find the runfiles root from its own location.
+    os.environ.pop("RUNFILES_DIR", None)
+    os.environ.pop("RUNFILES_MANIFEST_FILE", None)
+    os.environ["RUNFILES_ZIP_FILE"] = zip_path
+    os.environ["RUNFILES_ZIP_EXTRACT_DIR"] = extract_dir
+
+    sys.meta_path.append(ZipExtensionFinder(zf, extract_dir))
+    add_zip_site_packages(zf, site_packages)
+
+    main_name = "runfiles/" + _MAIN_PATH
+    main_filename = join(zip_path, *main_name.split("/"))
+    source = zf.read(main_name)
+    if main_name.endswith(".pyc"):
+        import marshal
+
+        # Skip the pyc header: magic, flags, and two 4 byte fields.
+        code = marshal.loads(source[16:])
+    else:
+        code = compile(source, main_filename, "exec", dont_inherit=True)
+
+    import types
+
+    main_module = types.ModuleType("__main__")
+    main_module.__file__ = main_filename
+    sys.modules["__main__"] = main_module
+    sys.argv = [main_filename] + args
+    sys.stdout.flush()
+    exec(code, main_module.__dict__)
+    sys.exit(0)
+
+
 def execute_file(
     python_program,
     main_filename,
@@ -245,8 +616,9 @@ def execute_file(
     # type: (str, str, list[str], dict[str, str], str, str|None, str|None) -> ...
     """Executes the given Python file using the various environment settings.
 
-    This will not return, and acts much like os.execv, except is much
-    more restricted, and handles Bazel-related edge cases.
+    This will not return. When there's nothing to clean up afterwards, this
+    process is replaced using os.execve, so signals sent to it reach the
+    program directly. Otherwise the program is run as a subprocess.
 
     Args:
       python_program: (str) Path to the Python binary to use for execution
@@ -267,6 +639,19 @@ def execute_file(
     #   subprocess.call.
     # - When running in a zip file, we need to clean up the
     #   workspace after the process finishes so control must return here.
+    #   With EXTRACT_ROOT, the extraction is kept for later runs, so there's
+    #   nothing to clean up.
+    if EXTRACT_ROOT and not IS_WINDOWS:
+        exec_argv = [python_program, main_filename] + args
+        print_verbose("execve env:", mapping=env)
+        print_verbose("execve cwd:", workspace)
+        print_verbose("execve argv:", values=exec_argv)
+        if workspace:
+            os.chdir(workspace)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.execve(python_program, exec_argv, env)
+
     try:
         subprocess_argv = [python_program]
         if not EXTRACT_ROOT:
@@ -304,9 +689,15 @@ def finish_venv_setup(runfiles_root):
         symlink_to = find_binary(runfiles_root, _PYTHON_BINARY_ACTUAL)
         os.makedirs(dirname(python_program), exist_ok=True)
         if os.path.lexists(python_program):
-            os.remove(python_program)
+            try:
+                os.remove(python_program)
+            except FileNotFoundError:
+                pass
         try:
             os.symlink(symlink_to, python_program)
+        except FileExistsError:
+            # Created by a concurrent launch using the same extraction.
+            pass
         except OSError as e:
             raise Exception(
                 f"Unable to create venv python interpreter symlink: {python_program} -> {symlink_to}"
@@ -317,11 +708,15 @@ def finish_venv_setup(runfiles_root):
         print_verbose("finish_venv_setup: create pyvenv.cfg:", pyvenv_cfg)
         python_home = join(runfiles_root, dirname(_PYTHON_BINARY_ACTUAL))
         print_verbose("finish_venv_setup: pyvenv.cfg home:", python_home)
-        with open(pyvenv_cfg, "w") as fp:
+        # Write to a temporary file first so that concurrent launches using
+        # the same extraction never read a partially written file.
+        tmp_pyvenv_cfg = "{}.{}.tmp".format(pyvenv_cfg, os.getpid())
+        with open(tmp_pyvenv_cfg, "w") as fp:
             # Until Windows supports a build-time generated venv using symlinks
             # to directories, we have to write the full, absolute, path to PYTHONHOME
             # so that support directories (e.g. DLLs, libs) can be found.
             fp.write("home = {}\n".format(python_home))
+        os.replace(tmp_pyvenv_cfg, pyvenv_cfg)
 
     return python_program
 
@@ -339,6 +734,9 @@ def main():
 
     args = sys.argv[1:]
 
+    if RUN_FROM_ZIP:
+        run_from_zip(args)
+
     new_env = {}
 
     # The main Python source file.
@@ -14,6 +14,8 @@ EXTERNAL_PYEXE_PATH="%EXTERNAL_PYEXE_PATH%"
 STAGE2_BOOTSTRAP="%STAGE2_BOOTSTRAP%"
 EXTRACT_DIR="%EXTRACT_DIR%"
 ZIP_HASH="%ZIP_HASH%"
+# 1 if the program runs directly from the zip, without extracting it first.
+RUN_FROM_ZIP="%RUN_FROM_ZIP%"
 declare -a INTERPRETER_ARGS_FROM_TARGET=(
 %INTERPRETER_ARGS%
 )
@@ -34,6 +36,12 @@ if [[ -n "${RULES_PYTHON_ADDITIONAL_INTERPRETER_ARGS}" ]]; then
   unset RULES_PYTHON_ADDITIONAL_INTERPRETER_ARGS
 fi
 
+if [[ "$RUN_FROM_ZIP" == "1" && -n "$EXTERNAL_PYEXE_PATH" ]]; then
+  # The zip's __main__.py runs the program from the zip itself, or extracts
+  # the zip if the program can't be run from it.
+  exec env "${interpreter_env[@]}" "$EXTERNAL_PYEXE_PATH" \
+    "${interpreter_args[@]}" "${INTERPRETER_ARGS_FROM_TARGET[@]}" "$0" "$@"
+fi
 
 if [[ -n "$RULES_PYTHON_EXTRACT_ROOT" ]]; then
   zip_dir="$RULES_PYTHON_EXTRACT_ROOT/$EXTRACT_DIR/$ZIP_HASH"
@@ -77,6 +85,13 @@ command=(
   "$@"
 )
 
+# With an extract root, the extracted files are kept for later runs, so
+# there's nothing to clean up and `exec` can be used. This lets signals sent
+# directly to this process (e.g. using `kill`) reach the Python process.
+if [[ -n "$RULES_PYTHON_EXTRACT_ROOT" ]]; then
+  exec "${command[@]}"
+fi
+
 # NOTE: because exec isn't used, signals don't propagate to the child
 # TODO: Use exec and let the program handle cleanup. Without exec,
 # signals don't propagate to the child nicely.
@@ -25,13 +25,19 @@ dependency graphs under bzlmod.
 
 from __future__ import annotations
 
+import array
+import bisect
 import inspect
+import mmap
 import os
 import pathlib
 import posixpath
+import shutil
+import struct
 import sys
-from collections import defaultdict
-from collections.abc import Generator
+import threading
+import zipfile
+from collections.abc import Generator, Iterable
 from typing import cast
 
 if sys.version_info >= (3, 11):
@@ -49,6 +55,9 @@ class _RepositoryMapping:
 
     Handles both exact mappings and prefix-based mappings introduced by the
     --incompatible_compact_repo_mapping_manifest flag.
+
+    When created from a file, the file is only parsed when the first lookup is
+    performed, and resolved (source, target) pairs are memoized.
     """
 
     def __init__(
@@ -62,17 +71,38 @@ class _RepositoryMapping:
             exact_mappings: Dict mapping (source_canonical, target_apparent) -> target_canonical
             prefixed_mappings: Dict mapping (source_prefix, target_apparent) -> target_canonical
         """
-        self._exact_mappings = exact_mappings
+        # Path of the repository mapping file that still has to be parsed, if any.
+        self._path: str | None = None
+        self._load_lock = threading.Lock()
+        self._resolved: dict[tuple[str, str], str | None] = {}
+        self._set_mappings(exact_mappings, prefixed_mappings)
 
-        # Group prefixed mappings by target_apparent for faster lookups
-        self._grouped_prefixed_mappings = defaultdict(list)
-        for (
-            prefix_source,
-            target_app,
-        ), target_canonical in prefixed_mappings.items():
-            self._grouped_prefixed_mappings[target_app].append(
-                (prefix_source, target_canonical)
-            )
+    def _set_mappings(
+        self,
+        exact_mappings: dict[tuple[str, str], str],
+        prefixed_mappings: dict[tuple[str, str], str],
+    ) -> None:
+        # Compile prefixed mappings into a table per target_apparent that maps
+        # each prefix to its position and target_canonical, plus the distinct
+        # prefix lengths to probe. As order matters for prefixed mappings, the
+        # position is used to pick the first matching prefix.
+        prefix_tables: dict[str, tuple[dict[str, tuple[int, str]], list[int]]] = {}
+        for position, ((prefix_source, target_app), target_canonical) in enumerate(
+            prefixed_mappings.items()
+        ):
+            table = prefix_tables.get(target_app)
+            if table is None:
+                table = ({}, [])
+                prefix_tables[target_app] = table
+            prefixes, lengths = table
+            prefixes[prefix_source] = (position, target_canonical)
+            if len(prefix_source) not in lengths:
+                lengths.append(len(prefix_source))
+
+        # The tables are only published once complete, so that concurrent
+        # lookups never see them partially built.
+        self._prefix_tables = prefix_tables
+        self._exact_mappings = exact_mappings
 
     @staticmethod
     def create_from_file(repo_mapping_path: str | None) -> _RepositoryMapping:
@@ -82,7 +112,7 @@ class _RepositoryMapping:
             repo_mapping_path: Path to the repository mapping file, or None if not available
 
         Returns:
-            RepositoryMapping instance with parsed mappings
+            RepositoryMapping instance that parses the file on first lookup
         """
         # If the repository mapping file can't be found, that is not an error: We
         # might be running without Bzlmod enabled or there may not be any runfiles.
@@ -91,11 +121,31 @@ class _RepositoryMapping:
             return _RepositoryMapping({}, {})
 
         try:
-            with open(repo_mapping_path, "r", encoding="utf-8", newline="\n") as f:
-                content = f.read()
+            size = os.stat(repo_mapping_path).st_size
         except FileNotFoundError:
             return _RepositoryMapping({}, {})
 
+        repo_mapping = _RepositoryMapping({}, {})
+        # Every line of the file is a mapping, so only a non-empty file has to
+        # be parsed.
+        if size:
+            repo_mapping._path = repo_mapping_path
+        return repo_mapping
+
+    def _load(self) -> None:
+        """Parses the repository mapping file passed to `create_from_file`."""
+        with self._load_lock:
+            # Another thread may have parsed the file while this one waited.
+            if self._path is not None:
+                self._load_locked(self._path)
+
+    def _load_locked(self, path: str) -> None:
+        try:
+            with open(path, "r", encoding="utf-8", newline="\n") as f:
+                content = f.read()
+        except FileNotFoundError:
+            content = ""
+
         exact_mappings = {}
         prefixed_mappings = {}
         for line in content.splitlines():
@@ -108,7 +158,8 @@ class _RepositoryMapping:
                 # This is an exact mapping
                 exact_mappings[(source_canonical, target_apparent)] = target_canonical
 
-        return _RepositoryMapping(exact_mappings, prefixed_mappings)
+        self._set_mappings(exact_mappings, prefixed_mappings)
+        self._path = None
 
     def lookup(self, source_repo: str | None, target_apparent: str) -> str | None:
         """Look up repository mapping for the given source and target.
@@ -128,21 +179,34 @@ class _RepositoryMapping:
             return None
 
         key = (source_repo, target_apparent)
+        try:
+            return self._resolved[key]
+        except KeyError:
+            pass
+
+        if self._path is not None:
+            self._load()
+
+        # Try exact mapping first, then prefixed mapping if no exact match found
+        result = self._exact_mappings.get(key)
+        if result is None:
+            result = self._lookup_prefixed(source_repo, target_apparent)
+        self._resolved[key] = result
+        return result
 
-        # Try exact mapping first
-        if key in self._exact_mappings:
-            return self._exact_mappings[key]
-
-        # Try prefixed mapping if no exact match found
-        if target_apparent in self._grouped_prefixed_mappings:
-            for prefix_source, target_canonical in self._grouped_prefixed_mappings[
-                target_apparent
-            ]:
-                if source_repo.startswith(prefix_source):
-                    return target_canonical
-
-        # No mapping found
-        return None
+    def _lookup_prefixed(self, source_repo: str, target_apparent: str) -> str | None:
+        table = self._prefix_tables.get(target_apparent)
+        if table is None:
+            return None
+        prefixes, lengths = table
+        best = None
+        for length in lengths:
+            match = prefixes.get(source_repo[:length])
+            if match is not None and (best is None or match[0] < best[0]):
+                best = match
+        if best is None:
+            return None
+        return best[1]
 
     def is_empty(self) -> bool:
         """Check if this repository mapping is empty (no exact or prefixed mappings).
@@ -151,7 +215,9 @@ class _RepositoryMapping:
             True if there are no mappings, False otherwise
         """
         return (
-            len(self._exact_mappings) == 0 and len(self._grouped_prefixed_mappings) == 0
+            self._path is None
+            and len(self._exact_mappings) == 0
+            and len(self._prefix_tables) == 0
         )
 
 
@@ -395,6 +461,164 @@ class Path(pathlib.Path):
         return self._runfiles.root(source_repo=self._source_repo)
 
 
+def _UnescapeManifestLink(escaped_link: bytes) -> bytes:
+    return (
+        escaped_link.replace(rb"\s", b" ").replace(rb"\n", b"\n").replace(rb"\b", b"\\")
+    )
+
+
+def _UnescapeManifestTarget(escaped_target: bytes) -> bytes:
+    return escaped_target.replace(rb"\n", b"\n").replace(rb"\b", b"\\")
+
+
+class _ManifestIndex:
+    """Read-only mapping of a runfiles manifest backed by a sorted offset index.
+
+    The manifest is memory-mapped and never parsed as a whole. Instead, an
+    array holding the byte offset of every manifest line, ordered by the
+    line's (unescaped, UTF-8 encoded) link path, is used to binary search for
+    entries. Building the index requires a single scan over the manifest; the
+    result is cached in a `<manifest>.index` file next to the manifest, so
+    subsequent processes only have to map it.
+
+    Writing the cache file is best-effort: if the manifest's directory isn't
+    writable, the index is kept in memory only.
+    """
+
+    # Bumped whenever the layout of the index file changes. The byte order is
+    # part of the magic because offsets are stored in native byte order.
+    _MAGIC = b"RFIDX1" + (b"LE" if sys.byteorder == "little" else b"BE")
+
+    # magic, manifest size, manifest mtime in ns, number of offsets
+    _HEADER = struct.Struct("=8sQQQ")
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            if st.st_size == 0:
+                # mmap refuses to map empty files.
+                self._manifest: bytes | mmap.mmap = b""
+            else:
+                self._manifest = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._offsets = self._LoadIndex(st)
+        if self._offsets is None:
+            self._offsets = self._BuildIndex()
+            self._WriteIndex(st, self._offsets)
+
+    @staticmethod
+    def IndexPath(path: str) -> str:
+        """Returns the path of the index cache file for the given manifest."""
+        return path + ".index"
+
+    def _LoadIndex(self, st: os.stat_result) -> memoryview | None:
+        try:
+            with open(_ManifestIndex.IndexPath(self._path), "rb") as f:
+                header = f.read(self._HEADER.size)
+                if len(header) != self._HEADER.size:
+                    return None
+                magic, size, mtime_ns, count = self._HEADER.unpack(header)
+                if (
+                    magic != self._MAGIC
+                    or size != st.st_size
+                    or mtime_ns != st.st_mtime_ns
+                ):
+                    return None
+                if count == 0:
+                    return memoryview(array.array("Q"))
+                index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        offsets_end = self._HEADER.size + count * 8
+        if len(index) != offsets_end:
+            return None
+        return memoryview(index)[self._HEADER.size : offsets_end].cast("Q")
+
+    def _WriteIndex(self, st: os.stat_result, offsets: memoryview) -> None:
+        index_path = _ManifestIndex.IndexPath(self._path)
+        # Write to a process-specific temporary file and rename it into place,
+        # so that concurrently starting processes never observe a partially
+        # written index.
+        tmp_path = "{}.{}.tmp".format(index_path, os.getpid())
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(
+                    self._HEADER.pack(
+                        self._MAGIC, st.st_size, st.st_mtime_ns, len(offsets)
+                    )
+                )
+                f.write(offsets)
+            os.replace(tmp_path, index_path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def _BuildIndex(self) -> memoryview:
+        manifest = self._manifest
+        keys = []
+        starts = []
+        start = 0
+        end = len(manifest)
+        while start < end:
+            line_end = manifest.find(b"\n", start)
+            if line_end == -1:
+                line_end = end
+            keys.append(self._ParseLine(manifest[start:line_end])[0])
+            starts.append(start)
+            start = line_end + 1
+
+        # Sorting is stable, so for duplicate links the last line in the
+        # manifest wins, which matches the behavior of the dict-based
+        # manifest parsing.
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        offsets = array.array("Q")
+        for i, line in enumerate(order):
+            if i + 1 < len(order) and keys[order[i + 1]] == keys[line]:
+                continue
+            offsets.append(starts[line])
+        return memoryview(offsets)
+
+    @staticmethod
+    def _ParseLine(line: bytes) -> tuple[bytes, bytes]:
+        if line.startswith(b" "):
+            # See _ManifestBased._LoadRunfiles for the escaping rules.
+            escaped_link, escaped_target = line[1:].split(b" ", maxsplit=1)
+            return (
+                _UnescapeManifestLink(escaped_link),
+                _UnescapeManifestTarget(escaped_target),
+            )
+        link, target = line.split(b" ", maxsplit=1)
+        return link, target
+
+    def _LineAt(self, i: int) -> bytes:
+        start = self._offsets[i]
+        end = self._manifest.find(b"\n", start)
+        if end == -1:
+            end = len(self._manifest)
+        return self._manifest[start:end]
+
+    def get(self, link: str) -> str | None:
+        """Returns the target of `link`, or None if it isn't in the manifest."""
+        key = link.encode("utf-8")
+        lo = 0
+        hi = len(self._offsets)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_key, target = self._ParseLine(self._LineAt(mid))
+            if mid_key < key:
+                lo = mid + 1
+            elif mid_key > key:
+                hi = mid
+            else:
+                return target.decode("utf-8") if target else link
+        return None
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+
 class _ManifestBased:
     """`Runfiles` strategy that parses a runfiles-manifest to look up runfiles."""
 
@@ -404,7 +628,7 @@ class _ManifestBased:
         if not isinstance(path, str):
             raise TypeError()
         self._path = path
-        self._runfiles = _ManifestBased._LoadRunfiles(path)
+        self._runfiles: dict[str, str] | _ManifestIndex = self._LoadRunfiles(path)
 
     def RlocationChecked(self, path: str) -> str | None:
         """Returns the runtime path of a runfile."""
@@ -468,6 +692,20 @@ class _ManifestBased:
         }
 
 
+class _IndexedManifestBased(_ManifestBased):
+    """`Runfiles` strategy that looks up runfiles in an indexed, memory-mapped manifest.
+
+    Unlike `_ManifestBased`, the manifest isn't read into memory upfront, which
+    makes creating a `Runfiles` object cheap for large manifests when only a
+    few runfiles are looked up. See `_ManifestIndex` for details.
+    """
+
+    @staticmethod
+    def _LoadRunfiles(path: str) -> _ManifestIndex:  # pyrefly: ignore[bad-override]
+        """Maps the runfiles manifest and loads or builds its index."""
+        return _ManifestIndex(path)
+
+
 class _DirectoryBased:
     """`Runfiles` strategy that appends runfiles paths to the runfiles root."""
 
@@ -496,18 +734,156 @@ class _DirectoryBased:
         }
 
 
+class _ZipBased:
+    """`Runfiles` strategy that extracts runfiles from a zipapp when looked up.
+
+    This is used by zipapps that run directly from the archive instead of
+    extracting it upfront. The runfiles are stored under `runfiles/` in the
+    zip. A runfile is extracted below `extract_dir` the first time it's looked
+    up; looking up a directory extracts everything below it.
+    """
+
+    _PREFIX = "runfiles/"
+
+    def __init__(self, zip_path: str, extract_dir: str) -> None:
+        if not zip_path or not extract_dir:
+            raise ValueError()
+        if not isinstance(zip_path, str) or not isinstance(extract_dir, str):
+            raise TypeError()
+        self._zip_path = zip_path
+        self._extract_dir = extract_dir
+        self._lock = threading.Lock()
+        # Read from the zip's central directory on first lookup.
+        self._zip: zipfile.ZipFile | None = None
+        self._members: dict[str, zipfile.ZipInfo] = {}
+        self._names: list[str] = []
+        self._extracted: set[str] = set()
+
+    def _Zip(self) -> zipfile.ZipFile:
+        if self._zip is None:
+            self._zip = zipfile.ZipFile(self._zip_path)
+            self._members = {info.filename: info for info in self._zip.infolist()}
+            self._names = sorted(self._members)
+        return self._zip
+
+    def RlocationChecked(self, path: str) -> str:
+        """Returns the runtime path of a runfile, extracting it if necessary."""
+        name = self._PREFIX + path
+        with self._lock:
+            self._ExtractTree(name)
+        return os.path.join(self._extract_dir, *name.split("/"))
+
+    def _Extract(self, name: str) -> None:
+        if name in self._extracted:
+            return
+        self._extracted.add(name)
+        info = self._members[name]
+        dest = os.path.join(self._extract_dir, *name.split("/"))
+        if info.is_dir() or os.path.lexists(dest):
+            # The extraction directory is specific to the zip's content, so
+            # an existing file was extracted by an earlier run.
+            return
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        zf = self._Zip()
+        # The Unix st_mode bits are stored in the upper 16 bits of
+        # external_attr.
+        mode = info.external_attr >> 16
+        # Write to a temporary file first so that concurrent runs sharing the
+        # extraction directory never see a partially written file.
+        tmp = "{}.{}.{}.tmp".format(dest, os.getpid(), threading.get_ident())
+        if (mode & 0o170000) == 0o120000:
+            target = zf.read(info).decode("utf-8")
+            # Symlinks point to other runfiles, so make sure the target exists.
+            target_name = posixpath.normpath(
+                posixpath.join(posixpath.dirname(name), target.replace("\\", "/"))
+            )
+            if target_name.startswith(self._PREFIX):
+                self._ExtractTree(target_name)
+            os.symlink(
+                target, tmp, target_is_directory=target_name not in self._members
+            )
+        else:
+            with zf.open(info) as src, open(tmp, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            if mode & 0o7777:
+                os.chmod(tmp, mode & 0o7777)
+        os.replace(tmp, dest)
+
+    def _ExtractTree(self, name: str) -> None:
+        """Extracts a file, or all files below a directory."""
+        self._Zip()
+        if name in self._members:
+            self._Extract(name)
+            return
+        dir_prefix = name + "/"
+        start = bisect.bisect_left(self._names, dir_prefix)
+        for member in self._names[start:]:
+            if not member.startswith(dir_prefix):
+                break
+            self._Extract(member)
+
+    def _GetRunfilesDir(self) -> str:
+        return os.path.join(self._extract_dir, "runfiles")
+
+    def _GetCodeRunfilesDir(self) -> str:
+        """Returns the runfiles root that code is imported from with zipimport."""
+        return os.path.join(self._zip_path, "runfiles")
+
+    def EnvVars(self) -> dict[str, str]:
+        return {
+            "RUNFILES_ZIP_FILE": self._zip_path,
+            "RUNFILES_ZIP_EXTRACT_DIR": self._extract_dir,
+        }
+
+
+def _CheckRlocationPath(path: str) -> None:
+    """Raises if `path` isn't a valid argument for `Runfiles.Rlocation`."""
+    if not path:
+        raise ValueError()
+    if not isinstance(path, str):
+        raise TypeError()
+    if (
+        path.startswith("../")
+        or "/.." in path
+        or path.startswith("./")
+        or "/./" in path
+        or path.endswith("/.")
+        or "//" in path
+    ):
+        raise ValueError('path is not normalized: "%s"' % path)
+    if path[0] == "\\":
+        raise ValueError('path is absolute without a drive letter: "%s"' % path)
+
+
 class Runfiles:
     """Returns the runtime location of runfiles.
 
     Runfiles are data-dependencies of Bazel-built binaries and tests.
     """
 
-    def __init__(self, strategy: _ManifestBased | _DirectoryBased) -> None:
+    # Maximum number of `Rlocation` results remembered per instance.
+    _RLOCATION_CACHE_SIZE = 4096
+
+    def __init__(
+        self,
+        strategy: _ManifestBased | _IndexedManifestBased | _DirectoryBased | _ZipBased,
+    ) -> None:
         self._strategy = strategy
         self._python_runfiles_root = strategy._GetRunfilesDir()
+        # The runfiles root that Python code is imported from. It only differs
+        # for zipapps that import code directly from the archive.
+        self._code_runfiles_root = (
+            strategy._GetCodeRunfilesDir()
+            if isinstance(strategy, _ZipBased)
+            else self._python_runfiles_root
+        )
         self._repo_mapping = _RepositoryMapping.create_from_file(
             strategy.RlocationChecked("_repo_mapping")
         )
+        # Rlocation results keyed by (source_repo, path).
+        self._rlocation_cache: dict[tuple[str | None, str], str | None] = {}
+        # Repository names keyed by the filename of a caller's code object.
+        self._caller_repo_cache: dict[str, str] = {}
 
     def root(self, source_repo: str | None = None) -> Path:
         """Returns a Path object representing the runfiles root.
@@ -530,6 +906,10 @@ class Runfiles:
         The function may return None. In that case the caller can be sure that the
         rule does not know about this data-dependency.
 
+        Results are memoized per `Runfiles` instance, keyed by the source
+        repository and `path`. To look up many runfiles at once, prefer
+        `RlocationMany`.
+
         Args:
           path: string; runfiles-root-relative path of the runfile
           source_repo: string; optional; the canonical name of the repository
@@ -546,29 +926,77 @@ class Runfiles:
           TypeError: if `path` is not a string
           ValueError: if `path` is None or empty, or it's absolute or not normalized
         """
-        if not path:
-            raise ValueError()
-        if not isinstance(path, str):
-            raise TypeError()
-        if (
-            path.startswith("../")
-            or "/.." in path
-            or path.startswith("./")
-            or "/./" in path
-            or path.endswith("/.")
-            or "//" in path
-        ):
-            raise ValueError('path is not normalized: "%s"' % path)
-        if path[0] == "\\":
-            raise ValueError('path is absolute without a drive letter: "%s"' % path)
-        if os.path.isabs(path):
-            return path
-
         if source_repo is None and not self._repo_mapping.is_empty():
             # Look up runfiles using the repository mapping of the caller of the
             # current method. If the repo mapping is empty, determining this
             # name is not necessary.
-            source_repo = self.CurrentRepository(frame=2)
+            # pylint: disable-next=protected-access
+            caller = sys._getframe(1)
+            try:
+                source_repo = self._CallerRepository(caller.f_code.co_filename)
+            except ValueError:
+                # Invalid and absolute paths don't need the caller's
+                # repository, so report (or return) them first.
+                _CheckRlocationPath(path)
+                if os.path.isabs(path):
+                    return path
+                raise
+        return self._RlocationCached(path, source_repo)
+
+    def RlocationMany(
+        self, paths: Iterable[str], source_repo: str | None = None
+    ) -> list[str | None]:
+        """Returns the runtime paths of several runfiles.
+
+        This is equivalent to calling `Rlocation` for each of `paths`, but
+        determines the repository of the caller only once for the whole batch.
+
+        Args:
+          paths: iterable of strings; runfiles-root-relative paths of the
+            runfiles
+          source_repo: string; optional; see `Rlocation`.
+        Returns:
+          list of the paths to the runfiles, in the order of `paths`. An
+          element is None if the method doesn't know about that runfile.
+        Raises:
+          TypeError: if an element of `paths` is not a string
+          ValueError: if an element of `paths` is None or empty, or it's
+            absolute or not normalized
+
+        :::{versionadded} VERSION_NEXT_FEATURE
+        :::
+        """
+        if source_repo is None and not self._repo_mapping.is_empty():
+            # pylint: disable-next=protected-access
+            source_repo = self._CallerRepository(sys._getframe(1).f_code.co_filename)
+        return [self._RlocationCached(path, source_repo) for path in paths]
+
+    def _RlocationCached(self, path: str, source_repo: str | None) -> str | None:
+        key = (source_repo, path)
+        try:
+            return self._rlocation_cache[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # `path` isn't hashable, let _RlocationUncached report it.
+            return self._RlocationUncached(path, source_repo)
+
+        result = self._RlocationUncached(path, source_repo)
+        if len(self._rlocation_cache) >= self._RLOCATION_CACHE_SIZE:
+            # Evict the oldest entry; dicts preserve insertion order. Another
+            # thread may change the cache concurrently, in which case the entry
+            # may already be gone or the dict may change during iteration.
+            try:
+                self._rlocation_cache.pop(next(iter(self._rlocation_cache)), None)
+            except (RuntimeError, StopIteration):
+                pass
+        self._rlocation_cache[key] = result
+        return result
+
+    def _RlocationUncached(self, path: str, source_repo: str | None) -> str | None:
+        _CheckRlocationPath(path)
+        if os.path.isabs(path):
+            return path
 
         # Split off the first path component, which contains the repository
         # name (apparent or canonical).
@@ -589,12 +1017,7 @@ class Runfiles:
         )
 
         # Look up the target repository using the repository mapping
-        if target_canonical is not None:
-            return self._strategy.RlocationChecked(target_canonical + "/" + remainder)
-
-        # No mapping found - assume target_repo is already canonical or
-        # we're not using Bzlmod
-        return self._strategy.RlocationChecked(path)
+        return self._strategy.RlocationChecked(target_canonical + "/" + remainder)
 
     def EnvVars(self) -> dict[str, str]:
         """Returns environment variables for subprocesses.
@@ -644,7 +1067,22 @@ class Runfiles:
             caller_path = inspect.getfile(sys._getframe(frame))
         except (TypeError, ValueError) as exc:
             raise ValueError("failed to determine caller's file path") from exc
-        caller_runfiles_path = os.path.relpath(caller_path, self._python_runfiles_root)
+        return self._CallerRepository(caller_path)
+
+    def _CallerRepository(self, caller_path: str) -> str:
+        """Returns the canonical name of the repository containing `caller_path`.
+
+        The result is cached per path, as determining it requires filesystem
+        path manipulation that is comparatively expensive for hot loops.
+        """
+        repo = self._caller_repo_cache.get(caller_path)
+        if repo is None:
+            repo = self._RepositoryForPath(caller_path)
+            self._caller_repo_cache[caller_path] = repo
+        return repo
+
+    def _RepositoryForPath(self, caller_path: str) -> str:
+        caller_runfiles_path = os.path.relpath(caller_path, self._code_runfiles_root)
         if caller_runfiles_path.startswith(".." + os.path.sep):
             # With Python 3.10 and earlier, sys.path contains the directory
             # of the script, which can result in a module being loaded from
@@ -661,11 +1099,11 @@ class Runfiles:
             #       by parsing the script's path.
             if (sys.version_info.minor <= 10 or sys.platform == "win32") and sys.path[
                 0
-            ] != self._python_runfiles_root:
+            ] != self._code_runfiles_root:
                 return ""
             raise ValueError(
                 "{} does not lie under the runfiles root {}".format(
-                    caller_path, self._python_runfiles_root
+                    caller_path, self._code_runfiles_root
                 )
             )
 
@@ -686,7 +1124,21 @@ class Runfiles:
     # TODO: Update return type to Self when 3.11 is the min version
     # https://peps.python.org/pep-0673/
     @staticmethod
-    def CreateManifestBased(manifest_path: str) -> "Runfiles":
+    def CreateManifestBased(manifest_path: str, indexed: bool = False) -> "Runfiles":
+        """Returns a new manifest-based `Runfiles` instance.
+
+        Args:
+          manifest_path: string; path to the runfiles manifest.
+          indexed: bool; if True, the manifest is memory-mapped and looked up
+            through a sorted index that is cached next to the manifest instead
+            of being read into memory upfront.
+
+        :::{versionchanged} VERSION_NEXT_FEATURE
+        The `indexed` argument was added.
+        :::
+        """
+        if indexed:
+            return Runfiles(_IndexedManifestBased(manifest_path))
         return Runfiles(_ManifestBased(manifest_path))
 
     # TODO: Update return type to Self when 3.11 is the min version
@@ -695,6 +1147,24 @@ class Runfiles:
     def CreateDirectoryBased(runfiles_dir_path: str) -> "Runfiles":
         return Runfiles(_DirectoryBased(runfiles_dir_path))
 
+    # TODO: Update return type to Self when 3.11 is the min version
+    # https://peps.python.org/pep-0673/
+    @staticmethod
+    def CreateZipBased(zip_path: str, extract_dir: str) -> "Runfiles":
+        """Returns a new `Runfiles` instance that looks up runfiles in a zipapp.
+
+        Runfiles are looked up in the zip's central directory and extracted
+        below `extract_dir` when they're first looked up.
+
+        Args:
+          zip_path: string; path to a zip created by `py_zipapp_binary`.
+          extract_dir: string; directory to extract runfiles to.
+
+        :::{versionadded} VERSION_NEXT_FEATURE
+        :::
+        """
+        return Runfiles(_ZipBased(zip_path, extract_dir))
+
     # TODO: Update return type to Self when 3.11 is the min version
     # https://peps.python.org/pep-0673/
     @staticmethod
@@ -709,12 +1179,20 @@ class Runfiles:
         If `env` contains "RUNFILES_MANIFEST_FILE" with non-empty value, this method
         returns a manifest-based implementation. The object eagerly reads and caches
         the whole manifest file upon instantiation; this may be relevant for
-        performance consideration.
+        performance consideration. If `env` also contains
+        "RUNFILES_MANIFEST_INDEXED" set to "1", the manifest is instead
+        memory-mapped and looked up through a sorted index, see
+        `CreateManifestBased`.
 
         Otherwise, if `env` contains "RUNFILES_DIR" with non-empty value (checked in
         this priority order), this method returns a directory-based implementation.
 
-        If neither cases apply, this method returns null.
+        Otherwise, if `env` contains "RUNFILES_ZIP_FILE" and
+        "RUNFILES_ZIP_EXTRACT_DIR" with non-empty values, which zipapps that run
+        directly from the archive set, this method returns a zip-based
+        implementation, see `CreateZipBased`.
+
+        If none of the cases apply, this method returns null.
 
         Args:
         env: {string: string}; optional; the map of environment variables. If None,
@@ -725,12 +1203,19 @@ class Runfiles:
         env_map = os.environ if env is None else env
         manifest = env_map.get("RUNFILES_MANIFEST_FILE")
         if manifest:
-            return CreateManifestBased(manifest)
+            return CreateManifestBased(
+                manifest, indexed=env_map.get("RUNFILES_MANIFEST_INDEXED") == "1"
+            )
 
         directory = env_map.get("RUNFILES_DIR")
         if directory:
             return CreateDirectoryBased(directory)
 
+        zip_path = env_map.get("RUNFILES_ZIP_FILE")
+        extract_dir = env_map.get("RUNFILES_ZIP_EXTRACT_DIR")
+        if zip_path and extract_dir:
+            return CreateZipBased(zip_path, extract_dir)
+
         return None
 
     # TODO: Update return type to Self when 3.11 is the min version
@@ -741,20 +1226,17 @@ class Runfiles:
 
         The returned object is either:
         - manifest-based, meaning it looks up runfile paths from a manifest
-          file, or
+          file,
         - directory-based, meaning it looks up runfile paths under a given
-          directory path
-
-        If `env` contains "RUNFILES_MANIFEST_FILE" with non-empty value, this
-        method returns a manifest-based implementation. The object eagerly
-        reads and caches the whole manifest file upon instantiation; this may
-        be relevant for performance consideration.
+          directory path, or
+        - zip-based, meaning it looks up runfile paths in a zipapp that runs
+          directly from the archive
 
-        Otherwise, if `env` contains "RUNFILES_DIR" with non-empty value
-        (checked in this priority order), this method returns a directory-based
-        implementation.
+        The implementation is chosen from `env` the same way as by `Create`:
+        "RUNFILES_MANIFEST_FILE" is checked first, then "RUNFILES_DIR", then
+        "RUNFILES_ZIP_FILE" together with "RUNFILES_ZIP_EXTRACT_DIR".
 
-        If neither cases apply, this method raises a `RuntimeError`.
+        If none of the cases apply, this method raises a `RuntimeError`.
 
         Args:
           env: {string: string}; optional; the map of environment variables. If
@@ -769,7 +1251,9 @@ class Runfiles:
         runfiles = Runfiles.Create(env=env)
         if runfiles is None:
             raise RuntimeError(
-                "Cannot create Runfiles: $RUNFILES_MANIFEST_FILE and $RUNFILES_DIR are both unset or empty"
+                "Cannot create Runfiles: $RUNFILES_MANIFEST_FILE and $RUNFILES_DIR "
+                "are both unset or empty, and $RUNFILES_ZIP_FILE and "
+                "$RUNFILES_ZIP_EXTRACT_DIR aren't both set"
             )
         return runfiles
 
@@ -778,14 +1262,18 @@ class Runfiles:
 _Runfiles = Runfiles
 
 
-def CreateManifestBased(manifest_path: str) -> Runfiles:
-    return Runfiles.CreateManifestBased(manifest_path)
+def CreateManifestBased(manifest_path: str, indexed: bool = False) -> Runfiles:
+    return Runfiles.CreateManifestBased(manifest_path, indexed=indexed)
 
 
 def CreateDirectoryBased(runfiles_dir_path: str) -> Runfiles:
     return Runfiles.CreateDirectoryBased(runfiles_dir_path)
 
 
+def CreateZipBased(zip_path: str, extract_dir: str) -> Runfiles:
+    return Runfiles.CreateZipBased(zip_path, extract_dir)
+
+
 def Create(env: dict[str, str] | None = None) -> Runfiles | None:
     return Runfiles.Create(env)
 
@@ -253,6 +253,40 @@ def _test_precompiler_action_impl(env, target):
         "PYTHONSAFEPATH": "1",
     })
 
+def _test_precompile_batch_size(name):
+    rt_util.helper_target(
+        py_library,
+        name = name + "_subject",
+        srcs = ["lib1.py", "lib2.py", "lib3.py"],
+        precompile = "enabled",
+    )
+    analysis_test(
+        name = name,
+        impl = _test_precompile_batch_size_impl,
+        target = name + "_subject",
+        config_settings = _COMMON_CONFIG_SETTINGS | {
+            labels.PRECOMPILE_BATCH_SIZE: 0,
+        },
+    )
+
+_tests.append(_test_precompile_batch_size)
+
+def _test_precompile_batch_size_impl(env, target):
+    target = env.expect.that_target(target)
+    action = target.action_named("PyCompile")
+    action.inputs().contains_at_least_predicates([
+        matching.file_basename_equals("lib1.py"),
+        matching.file_basename_equals("lib2.py"),
+        matching.file_basename_equals("lib3.py"),
+    ])
+    action.has_flags_specified(["--src", "--pyc", "--src_name"])
+    py_info = target.provider(PyInfo, factory = py_info_subject)
+    py_info.direct_pyc_files().contains_exactly([
+        "{package}/__pycache__/lib1.fakepy-45.pyc",
+        "{package}/__pycache__/lib2.fakepy-45.pyc",
+        "{package}/__pycache__/lib3.fakepy-45.pyc",
+    ])
+
 def _setup_precompile_flag_pyc_collection_attr_interaction(
         *,
         name,
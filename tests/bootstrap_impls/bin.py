@@ -19,6 +19,11 @@ print("Hello")
 print(
     "RULES_PYTHON_ZIP_DIR:{}".format(sys._xoptions.get("RULES_PYTHON_ZIP_DIR", "UNSET"))
 )
+print(
+    "RULES_PYTHON_RUNFILES_ROOT:{}".format(
+        sys._xoptions.get("RULES_PYTHON_RUNFILES_ROOT", "UNSET")
+    )
+)
 print("PYTHONSAFEPATH:", os.environ.get("PYTHONSAFEPATH", "UNSET") or "EMPTY")
 print("sys.flags.safe_path:", sys.flags.safe_path)
 print("file:", __file__)
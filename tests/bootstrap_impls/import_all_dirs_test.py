@@ -0,0 +1,43 @@
+# Copyright 2026 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import unittest
+
+
+class ImportAllDirsTest(unittest.TestCase):
+    def test_repo_dirs_added_to_sys_path(self):
+        # The directories under the runfiles root are computed at build time,
+        # so check them against what's actually there.
+        runfiles_root = os.path.normpath(os.environ["RUNFILES_DIR"])
+        repo_dirs = [
+            os.path.join(runfiles_root, name)
+            for name in os.listdir(runfiles_root)
+            if os.path.isdir(os.path.join(runfiles_root, name))
+        ]
+        sys_path_repo_dirs = [
+            path
+            for path in sys.path
+            if os.path.dirname(os.path.normpath(path)) == runfiles_root
+        ]
+        self.assertEqual(
+            sorted(map(os.path.normpath, sys_path_repo_dirs)),
+            sorted(repo_dirs),
+            "sys.path:\n" + "\n".join(sys.path),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
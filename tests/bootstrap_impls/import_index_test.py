@@ -0,0 +1,74 @@
+# Copyright 2026 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import unittest
+from importlib.machinery import PathFinder
+
+
+class ImportIndexTest(unittest.TestCase):
+    def setUp(self):
+        finders = [
+            finder
+            for finder in sys.meta_path
+            if type(finder).__name__ == "_ImportIndexFinder"
+        ]
+        self.assertEqual(len(finders), 1, f"sys.meta_path: {sys.meta_path}")
+        self.finder = finders[0]
+
+    def test_installed_before_path_finder(self):
+        self.assertLess(
+            sys.meta_path.index(self.finder), sys.meta_path.index(PathFinder)
+        )
+
+    def test_finds_same_modules_as_path_finder(self):
+        for name in [
+            "import_index_pkg",
+            "import_index_test",
+            # Stdlib modules that are shadowed by files in the runfiles
+            "shutil",
+            "types",
+            "json",
+        ]:
+            with self.subTest(name=name):
+                expected = PathFinder.find_spec(name)
+                self.assertIsNotNone(expected)
+                actual = self.finder.find_spec(name)
+                self.assertIsNotNone(actual)
+                self.assertEqual(actual.origin, expected.origin)
+                self.assertEqual(
+                    actual.submodule_search_locations,
+                    expected.submodule_search_locations,
+                )
+
+    def test_missing_module(self):
+        self.assertIsNone(self.finder.find_spec("import_index_does_not_exist"))
+
+    def test_submodules_use_regular_finders(self):
+        self.assertIsNone(self.finder.find_spec("json.decoder", ["unused"]))
+
+    def test_import(self):
+        import import_index_pkg
+
+        self.assertTrue(
+            import_index_pkg.__file__.endswith(
+                os.path.join("import_index_pkg", "__init__.py")
+            ),
+            import_index_pkg.__file__,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
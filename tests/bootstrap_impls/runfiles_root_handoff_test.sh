@@ -0,0 +1,54 @@
+# Copyright 2026 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# --- begin runfiles.bash initialization v3 ---
+# Copy-pasted from the Bazel Bash runfiles library v3.
+set -uo pipefail; set +e; f=bazel_tools/tools/bash/runfiles/runfiles.bash
+source "${RUNFILES_DIR:-/dev/null}/$f" 2>/dev/null || \
+  source "$(grep -sm1 "^$f " "${RUNFILES_MANIFEST_FILE:-/dev/null}" | cut -f2- -d' ')" 2>/dev/null || \
+  source "$0.runfiles/$f" 2>/dev/null || \
+  source "$(grep -sm1 "^$f " "$0.runfiles_manifest" | cut -f2- -d' ')" 2>/dev/null || \
+  source "$(grep -sm1 "^$f " "$0.exe.runfiles_manifest" | cut -f2- -d' ')" 2>/dev/null || \
+  { echo>&2 "ERROR: cannot find $f"; exit 1; }; f=; set -e
+# --- end runfiles.bash initialization v3 ---
+set +e
+
+bin=$(rlocation $BIN_RLOCATION)
+if [[ -z "$bin" ]]; then
+  echo "Unable to locate test binary: $BIN_RLOCATION"
+  exit 1
+fi
+
+function assert_output_contains() {
+  if ! (echo "$actual" | grep -q "$2"); then
+    echo "Test case failed: $1"
+    echo "expected output to contain: $2"
+    echo "but got:"
+    echo "$actual"
+    exit 1
+  fi
+}
+
+# Stage 1 passes the runfiles root it found to stage 2.
+actual=$(RUNFILES_DIR='' RUNFILES_MANIFEST_FILE='' $bin)
+assert_output_contains "runfiles root handoff" 'RULES_PYTHON_RUNFILES_ROOT:/.*\.runfiles$'
+assert_output_contains "runfiles root handoff" "Hello"
+
+# Stage 2 finds the runfiles itself when there's no handoff.
+actual=$(RUNFILES_DIR='' RUNFILES_MANIFEST_FILE='' \
+  RULES_PYTHON_ADDITIONAL_INTERPRETER_ARGS='-XRULES_PYTHON_RUNFILES_ROOT=' $bin)
+assert_output_contains "no runfiles root handoff" 'RULES_PYTHON_RUNFILES_ROOT:$'
+assert_output_contains "no runfiles root handoff" "Hello"
+
+exit 0
@@ -0,0 +1,60 @@
+# Copyright 2026 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# --- begin runfiles.bash initialization v3 ---
+# Copy-pasted from the Bazel Bash runfiles library v3.
+set -uo pipefail; set +e; f=bazel_tools/tools/bash/runfiles/runfiles.bash
+source "${RUNFILES_DIR:-/dev/null}/$f" 2>/dev/null || \
+  source "$(grep -sm1 "^$f " "${RUNFILES_MANIFEST_FILE:-/dev/null}" | cut -f2- -d' ')" 2>/dev/null || \
+  source "$0.runfiles/$f" 2>/dev/null || \
+  source "$(grep -sm1 "^$f " "$0.runfiles_manifest" | cut -f2- -d' ')" 2>/dev/null || \
+  source "$(grep -sm1 "^$f " "$0.exe.runfiles_manifest" | cut -f2- -d' ')" 2>/dev/null || \
+  { echo>&2 "ERROR: cannot find $f"; exit 1; }; f=; set -e
+# --- end runfiles.bash initialization v3 ---
+set +e
+
+bin=$(rlocation $BIN_RLOCATION)
+if [[ -z "$bin" ]]; then
+  echo "Unable to locate test binary: $BIN_RLOCATION"
+  exit 1
+fi
+
+trace=$TEST_TMPDIR/startup_trace.json
+RULES_PYTHON_STARTUP_TRACE=$trace $bin >/dev/null
+if [[ $? -ne 0 ]]; then
+  echo "Running the binary with RULES_PYTHON_STARTUP_TRACE failed"
+  exit 1
+fi
+
+function assert_trace_contains() {
+  if ! grep -q "$1" "$trace"; then
+    echo "Test case failed"
+    echo "expected startup trace to contain: $1"
+    echo "but got:"
+    cat "$trace"
+    exit 1
+  fi
+}
+
+assert_trace_contains '"traceEvents"'
+assert_trace_contains '"name": "site_init: setup sys.path"'
+assert_trace_contains '"name": "stage2: find runfiles root"'
+assert_trace_contains '"imports": '
+# EPOCHREALTIME, which stage 1 is timed with, requires bash 5.
+if [[ -n "${EPOCHREALTIME:-}" ]]; then
+  assert_trace_contains '"name": "stage1: find runfiles root"'
+  assert_trace_contains '"name": "interpreter startup"'
+fi
+
+exit 0
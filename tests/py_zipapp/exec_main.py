@@ -0,0 +1,21 @@
+"A zipapp that reports its PID and waits to be signaled"
+
+import os
+import signal
+import sys
+import time
+
+
+def main():
+    def on_sigint(signum, frame):
+        print("got SIGINT", flush=True)
+        sys.exit(3)
+
+    signal.signal(signal.SIGINT, on_sigint)
+    print(f"pid: {os.getpid()}", flush=True)
+    time.sleep(60)
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
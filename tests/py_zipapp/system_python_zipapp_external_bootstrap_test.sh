@@ -52,3 +52,26 @@ echo "====================================================================="
 echo "Running zipapp with extract root set a second time..."
 echo "====================================================================="
 "$PYTHON" "$ZIPAPP"
+
+# A completed extraction is marked so that later runs reuse it as-is.
+if [ -e "$RULES_PYTHON_EXTRACT_ROOT/_main/tests/py_zipapp/system_python_zipapp"/*/.extract_complete ]; then
+  echo "Found the extraction complete marker"
+elif [ -e "$RULES_PYTHON_EXTRACT_ROOT/system_python_zipapp"/*/.extract_complete ]; then
+  echo "Found the extraction complete marker"
+else
+  echo "Error: Could not find the extraction complete marker"
+  exit 1
+fi
+
+echo "====================================================================="
+echo "Running zipapp concurrently with a fresh extract root..."
+echo "====================================================================="
+export RULES_PYTHON_EXTRACT_ROOT="${TEST_TMPDIR:-/tmp}/concurrent_extract_root_test"
+pids=()
+for _ in 1 2 3 4; do
+  "$PYTHON" "$ZIPAPP" &
+  pids+=("$!")
+done
+for pid in "${pids[@]}"; do
+  wait "$pid"
+done
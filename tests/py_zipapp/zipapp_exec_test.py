@@ -0,0 +1,58 @@
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import unittest
+
+
+@unittest.skipIf(os.name == "nt", "exec is only used on POSIX")
+class ZipAppExecTest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.env = dict(os.environ)
+        self.env["RULES_PYTHON_EXTRACT_ROOT"] = tempfile.mkdtemp(
+            dir=os.environ.get("TEST_TMPDIR")
+        )
+
+    def _start_zipapp(self):
+        # The zip is passed to python directly to run its `__main__.py`.
+        proc = subprocess.Popen(
+            [sys.executable, os.environ["TEST_ZIPAPP"]],
+            env=self.env,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        self.addCleanup(proc.stdout.close)
+        self.addCleanup(proc.kill)
+        line = proc.stdout.readline().strip()
+        self.assertTrue(line.startswith("pid: "), line)
+        return proc, int(line[len("pid: ") :])
+
+    def test_program_replaces_launcher(self):
+        proc, pid = self._start_zipapp()
+        self.assertEqual(pid, proc.pid)
+
+    def test_sigterm_reaches_program(self):
+        proc, _ = self._start_zipapp()
+        proc.send_signal(signal.SIGTERM)
+        self.assertEqual(proc.wait(timeout=30), -signal.SIGTERM)
+
+    def test_sigint_reaches_program(self):
+        proc, _ = self._start_zipapp()
+        proc.send_signal(signal.SIGINT)
+        self.assertEqual(proc.wait(timeout=30), 3)
+        self.assertEqual(proc.stdout.read().strip(), "got SIGINT")
+
+    def test_reuses_extraction(self):
+        proc, _ = self._start_zipapp()
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=30)
+
+        # The second run uses the existing extraction and is exec'd as well.
+        proc, pid = self._start_zipapp()
+        self.assertEqual(pid, proc.pid)
+
+
+if __name__ == "__main__":
+    unittest.main()
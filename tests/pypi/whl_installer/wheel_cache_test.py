@@ -0,0 +1,125 @@
+# Copyright 2026 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from python.private.pypi.whl_installer import wheel_cache
+
+
+def _key(**kwargs) -> str:
+    args = {
+        "requirement": "foo==1.0 --hash=sha256:deadbeef",
+        "pip_args": ["wheel", "--no-deps"],
+        "environment": {"CFLAGS": "-g0"},
+    }
+    args.update(kwargs)
+    return wheel_cache.cache_key(**args)
+
+
+class CacheKeyTest(unittest.TestCase):
+    def test_key_is_stable(self) -> None:
+        self.assertEqual(_key(), _key())
+
+    def test_key_depends_on_inputs(self) -> None:
+        keys = {
+            _key(),
+            _key(requirement="foo==2.0"),
+            _key(pip_args=["wheel", "--no-deps", "--no-build-isolation"]),
+            _key(environment={"CFLAGS": "-O3"}),
+        }
+        self.assertEqual(len(keys), 4)
+
+    def test_key_depends_on_sdist_content(self) -> None:
+        tmp_dir = Path(tempfile.mkdtemp())
+        sdist = tmp_dir / "foo-1.0.tar.gz"
+        sdist.write_bytes(b"one")
+        first = _key(sdist=str(sdist))
+        sdist.write_bytes(b"two")
+        self.assertNotEqual(first, _key(sdist=str(sdist)))
+
+
+class WheelCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.cache = wheel_cache.WheelCache(str(self.tmp_dir / "cache"))
+
+    def test_miss(self) -> None:
+        self.assertIsNone(self.cache.get(_key(), self.tmp_dir))
+
+    def test_put_then_get(self) -> None:
+        build_dir = self.tmp_dir / "build"
+        build_dir.mkdir()
+        whl = build_dir / "foo-1.0-py3-none-any.whl"
+        whl.write_bytes(b"wheel")
+        self.cache.put(_key(), whl)
+        # A second put of the same key, e.g. by a concurrent build, is ignored.
+        self.cache.put(_key(), whl)
+
+        dest_dir = self.tmp_dir / "dest"
+        dest_dir.mkdir()
+        cached = self.cache.get(_key(), dest_dir)
+
+        self.assertEqual(cached, dest_dir / whl.name)
+        self.assertEqual(cached.read_bytes(), b"wheel")
+
+    def test_put_to_unwritable_cache_is_ignored(self) -> None:
+        whl = self.tmp_dir / "foo-1.0-py3-none-any.whl"
+        whl.write_bytes(b"wheel")
+        # A file where the cache directory should be makes creating it fail.
+        (self.tmp_dir / "cache").write_bytes(b"")
+
+        self.cache.put(_key(), whl)
+
+        self.assertIsNone(self.cache.get(_key(), self.tmp_dir))
+
+
+@unittest.skipIf(wheel_cache.fcntl is None, "build slots require fcntl")
+class BuildSlotTest(unittest.TestCase):
+    def test_limits_concurrent_builds(self) -> None:
+        lock_dir = tempfile.mkdtemp()
+        acquired = threading.Event()
+
+        def build() -> None:
+            with wheel_cache.build_slot(lock_dir, 1):
+                acquired.set()
+
+        with wheel_cache.build_slot(lock_dir, 1):
+            thread = threading.Thread(target=build)
+            thread.start()
+            self.assertFalse(acquired.wait(0.5))
+        self.assertTrue(acquired.wait(5))
+        thread.join()
+        self.assertEqual(os.listdir(lock_dir), ["build-slot-0.lock"])
+
+    def test_no_limit(self) -> None:
+        lock_dir = os.path.join(tempfile.mkdtemp(), "slots")
+        with wheel_cache.build_slot(lock_dir, 0):
+            pass
+        self.assertFalse(os.path.exists(lock_dir))
+
+    def test_unusable_lock_dir_means_no_limit(self) -> None:
+        lock_dir = os.path.join(tempfile.mkdtemp(), "slots")
+        # A file where the lock directory should be makes creating it fail.
+        Path(lock_dir).write_bytes(b"")
+        with wheel_cache.build_slot(lock_dir, 1):
+            with wheel_cache.build_slot(lock_dir, 1):
+                pass
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+# Copyright 2026 The Bazel Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from python.private.pypi.whl_installer import wheel_installer
+
+
+class IsPinnedTest(unittest.TestCase):
+    def test_pinned(self) -> None:
+        for requirement in [
+            "foo==1.0",
+            "foo===1.0",
+            "foo[bar]==1.0; python_version >= '3.9'",
+            "foo>=1.0 --hash=sha256:deadbeef",
+        ]:
+            with self.subTest(requirement=requirement):
+                self.assertTrue(wheel_installer._is_pinned(requirement, None))
+
+    def test_not_pinned(self) -> None:
+        for requirement in [
+            "foo",
+            "foo==1.*",
+            "foo!=1.0",
+            "foo>=1.0,!=1.5",
+            "foo>=1.0,==1.5",
+            "foo @ https://example.com/foo-1.0.tar.gz",
+        ]:
+            with self.subTest(requirement=requirement):
+                self.assertFalse(wheel_installer._is_pinned(requirement, None))
+
+    def test_sdist_is_pinned(self) -> None:
+        self.assertTrue(wheel_installer._is_pinned("foo", "foo-1.0.tar.gz"))
+
+
+if __name__ == "__main__":
+    unittest.main()
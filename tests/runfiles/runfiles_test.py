@@ -14,11 +14,14 @@
 
 from __future__ import annotations
 
+import concurrent.futures
 import json
 import os
 import pathlib
+import shutil
 import tempfile
 import unittest
+import zipfile
 from typing import Any
 
 from python.runfiles import runfiles
@@ -246,6 +249,8 @@ class RunfilesTest(unittest.TestCase):
             runfiles.CreateOrRaise({"TEST_SRCDIR": "always ignored"})
         with self.assertRaises(RuntimeError):
             runfiles.CreateOrRaise({"FOO": "bar"})
+        with self.assertRaisesRegex(RuntimeError, r"\$RUNFILES_ZIP_EXTRACT_DIR"):
+            runfiles.CreateOrRaise({"RUNFILES_ZIP_FILE": "app.zip"})
         with self.assertRaises(RuntimeError):
             runfiles.CreateOrRaise({})
         with self.assertRaises(RuntimeError):
@@ -288,6 +293,87 @@ class RunfilesTest(unittest.TestCase):
             else:
                 self.assertEqual(r.Rlocation("/foo"), "/foo")
 
+    def testIndexedManifestBasedRlocation(self) -> None:
+        with _MockFile(
+            contents=[
+                "Foo/runfile1 ",
+                "Foo/runfile2 C:/Actual Path\\runfile2",
+                "Foo/Bar/runfile3 D:\\the path\\run file 3.txt",
+                "Foo/Bar/Dir E:\\Actual Path\\Directory",
+                " Foo\\sBar\\bDir\\nNewline/runfile5 F:\\bActual Path\\bwith\\nnewline/runfile5",
+                "Dup/file first",
+                "Dup/file second",
+                "Unicode/\u00e4\u00f6\u00fc /tmp/\u00e4\u00f6\u00fc",
+            ]
+        ) as mf:
+            r = runfiles.Create(
+                {
+                    "RUNFILES_MANIFEST_FILE": mf.Path(),
+                    "RUNFILES_MANIFEST_INDEXED": "1",
+                }
+            )
+            assert r is not None  # type assert
+            self.assertEqual(r.Rlocation("Foo/runfile1"), "Foo/runfile1")
+            self.assertEqual(r.Rlocation("Foo/runfile2"), "C:/Actual Path\\runfile2")
+            self.assertEqual(
+                r.Rlocation("Foo/Bar/runfile3"), "D:\\the path\\run file 3.txt"
+            )
+            self.assertEqual(
+                r.Rlocation("Foo/Bar/Dir/Deeply/Nested/runfile4"),
+                "E:\\Actual Path\\Directory/Deeply/Nested/runfile4",
+            )
+            self.assertEqual(
+                r.Rlocation("Foo Bar\\Dir\nNewline/runfile5"),
+                "F:\\Actual Path\\with\nnewline/runfile5",
+            )
+            # The last entry wins, as with the non-indexed manifest.
+            self.assertEqual(r.Rlocation("Dup/file"), "second")
+            self.assertEqual(
+                r.Rlocation("Unicode/\u00e4\u00f6\u00fc"), "/tmp/\u00e4\u00f6\u00fc"
+            )
+            self.assertIsNone(r.Rlocation("unknown"))
+            self.assertIsNone(r.Rlocation("Foo"))
+            self.assertIsNone(r.Rlocation("Zzz/last"))
+
+    def testIndexedManifestBasedRlocationUsesIndexCache(self) -> None:
+        with _MockFile(contents=["b/c /b/c", "a/b /a/b"]) as mf:
+            index_path = runfiles._ManifestIndex.IndexPath(mf.Path())
+            self.assertFalse(os.path.exists(index_path))
+
+            r = runfiles.CreateManifestBased(mf.Path(), indexed=True)
+            self.assertEqual(r.Rlocation("a/b"), "/a/b")
+            self.assertTrue(os.path.exists(index_path))
+
+            # A valid index is reused as is.
+            index_mtime_ns = os.stat(index_path).st_mtime_ns
+            r = runfiles.CreateManifestBased(mf.Path(), indexed=True)
+            self.assertEqual(r.Rlocation("b/c"), "/b/c")
+            self.assertEqual(os.stat(index_path).st_mtime_ns, index_mtime_ns)
+
+            # A stale index is rebuilt.
+            with open(mf.Path(), "a", encoding="utf-8", newline="\n") as f:
+                f.write("0/new /0/new\n")
+            r = runfiles.CreateManifestBased(mf.Path(), indexed=True)
+            self.assertEqual(r.Rlocation("0/new"), "/0/new")
+            self.assertEqual(r.Rlocation("a/b"), "/a/b")
+            self.assertEqual(r.Rlocation("b/c"), "/b/c")
+
+    def testIndexedManifestBasedRlocationWithCorruptIndexCache(self) -> None:
+        with _MockFile(contents=["a/b /a/b"]) as mf:
+            index_path = runfiles._ManifestIndex.IndexPath(mf.Path())
+            with open(index_path, "wb") as f:
+                f.write(b"garbage")
+            r = runfiles.CreateManifestBased(mf.Path(), indexed=True)
+            self.assertEqual(r.Rlocation("a/b"), "/a/b")
+
+    def testIndexedManifestBasedRlocationWithEmptyManifest(self) -> None:
+        with _MockFile() as mf:
+            r = runfiles.CreateManifestBased(mf.Path(), indexed=True)
+            self.assertIsNone(r.Rlocation("a/b"))
+            # The cached index of an empty manifest is valid, too.
+            r = runfiles.CreateManifestBased(mf.Path(), indexed=True)
+            self.assertIsNone(r.Rlocation("a/b"))
+
     def testManifestBasedRlocationWithRepoMappingFromMain(self) -> None:
         with _MockFile(
             contents=[
@@ -707,6 +793,154 @@ class RunfilesTest(unittest.TestCase):
                 dir + "/lib~general/foo/file",
             )
 
+    def testZipBasedRlocation(self) -> None:
+        tmpdir = tempfile.mkdtemp(dir=os.environ.get("TEST_TMPDIR"))
+        self.addCleanup(shutil.rmtree, tmpdir)
+        zip_path = os.path.join(tmpdir, "app.zip")
+        with zipfile.ZipFile(zip_path, "w") as zf:
+            zf.writestr("__main__.py", "")
+            zf.writestr("runfiles/_repo_mapping", ",my_module,_main\n")
+            zf.writestr("runfiles/_main/data/a.txt", "a")
+            exe = zipfile.ZipInfo("runfiles/_main/bin/tool.sh")
+            exe.external_attr = 0o100755 << 16
+            zf.writestr(exe, "#!/bin/sh\n")
+            zf.writestr("runfiles/_main/dir/x.txt", "x")
+            zf.writestr("runfiles/_main/dir/sub/y.txt", "y")
+            link = zipfile.ZipInfo("runfiles/_main/link.txt")
+            link.external_attr = 0o120777 << 16
+            zf.writestr(link, "data/a.txt")
+        extract_dir = os.path.join(tmpdir, "extract")
+
+        r = runfiles.Create(
+            {
+                "RUNFILES_ZIP_FILE": zip_path,
+                "RUNFILES_ZIP_EXTRACT_DIR": extract_dir,
+            }
+        )
+        assert r is not None  # type assert
+        root = os.path.join(extract_dir, "runfiles")
+
+        a_path = r.Rlocation("my_module/data/a.txt", "")
+        self.assertEqual(a_path, os.path.join(root, "_main", "data", "a.txt"))
+        with open(a_path) as f:
+            self.assertEqual(f.read(), "a")
+        # Only looked up runfiles are extracted.
+        self.assertFalse(os.path.exists(os.path.join(root, "_main", "dir")))
+
+        tool_path = r.Rlocation("_main/bin/tool.sh", "")
+        if not RunfilesTest.IsWindows():
+            self.assertTrue(os.access(tool_path, os.X_OK))
+
+        dir_path = r.Rlocation("_main/dir", "")
+        with open(os.path.join(dir_path, "sub", "y.txt")) as f:
+            self.assertEqual(f.read(), "y")
+
+        if not RunfilesTest.IsWindows():
+            link_path = r.Rlocation("_main/link.txt", "")
+            self.assertTrue(os.path.islink(link_path))
+            with open(link_path) as f:
+                self.assertEqual(f.read(), "a")
+
+        missing = r.Rlocation("_main/missing.txt", "")
+        self.assertFalse(os.path.exists(missing))
+
+        # Code is imported from the zip itself.
+        self.assertEqual(
+            r._RepositoryForPath(
+                os.path.join(zip_path, "runfiles", "other_repo", "mod.py")
+            ),
+            "other_repo",
+        )
+
+        self.assertDictEqual(
+            r.EnvVars(),
+            {
+                "RUNFILES_ZIP_FILE": zip_path,
+                "RUNFILES_ZIP_EXTRACT_DIR": extract_dir,
+            },
+        )
+
+    def testRlocationMany(self) -> None:
+        with _MockFile(
+            name="_repo_mapping",
+            contents=[
+                ",my_module,_main",
+                ",my_protobuf,protobuf~3.19.2",
+                "protobuf~3.19.2,protobuf,protobuf~3.19.2",
+            ],
+        ) as rm:
+            dir = os.path.dirname(rm.Path())
+            r = runfiles.CreateDirectoryBased(dir)
+
+            self.assertEqual(
+                r.RlocationMany(
+                    ["my_module/bar/runfile", "my_protobuf/foo/runfile", "config.json"],
+                    "",
+                ),
+                [
+                    dir + "/_main/bar/runfile",
+                    dir + "/protobuf~3.19.2/foo/runfile",
+                    dir + "/config.json",
+                ],
+            )
+            self.assertEqual(
+                r.RlocationMany(
+                    ["protobuf/foo/runfile", "my_protobuf/foo/runfile"],
+                    "protobuf~3.19.2",
+                ),
+                [
+                    dir + "/protobuf~3.19.2/foo/runfile",
+                    dir + "/my_protobuf/foo/runfile",
+                ],
+            )
+            self.assertEqual(r.RlocationMany([], ""), [])
+            self.assertRaisesRegex(
+                ValueError,
+                "is not normalized",
+                lambda: r.RlocationMany(["a/b", "../foo"], ""),
+            )
+
+    def testRlocationCachesResultsPerSourceRepo(self) -> None:
+        with _MockFile(
+            name="_repo_mapping",
+            contents=[
+                ",my_protobuf,protobuf~3.19.2",
+                "protobuf~3.19.2,my_protobuf,other_protobuf",
+            ],
+        ) as rm:
+            dir = os.path.dirname(rm.Path())
+            r = runfiles.CreateDirectoryBased(dir)
+            r._RLOCATION_CACHE_SIZE = 2
+
+            for _ in range(2):
+                self.assertEqual(
+                    r.Rlocation("my_protobuf/foo", ""), dir + "/protobuf~3.19.2/foo"
+                )
+                self.assertEqual(
+                    r.Rlocation("my_protobuf/foo", "protobuf~3.19.2"),
+                    dir + "/other_protobuf/foo",
+                )
+            self.assertEqual(
+                r.Rlocation("my_protobuf/bar", ""), dir + "/protobuf~3.19.2/bar"
+            )
+            self.assertEqual(len(r._rlocation_cache), 2)
+
+            # Arguments are still validated for cached (source_repo, path) pairs.
+            self.assertRaises(TypeError, lambda: r.Rlocation([1], ""))  # pyrefly: ignore[bad-argument-type]
+            self.assertRaises(ValueError, lambda: r.Rlocation(None, ""))  # pyrefly: ignore[bad-argument-type]
+
+    def testRlocationWithUndeterminableCaller(self) -> None:
+        with _MockFile(name="_repo_mapping", contents=[",my_module,_main"]) as rm:
+            r = runfiles.CreateDirectoryBased(os.path.dirname(rm.Path()))
+            # The caller (this test) doesn't lie under the mock runfiles root.
+            self.assertRaisesRegex(
+                ValueError, "is not normalized", lambda: r.Rlocation("../foo")
+            )
+            if RunfilesTest.IsWindows():
+                self.assertEqual(r.Rlocation("c:/foo"), "c:/foo")
+            else:
+                self.assertEqual(r.Rlocation("/foo"), "/foo")
+
     def testRepositoryMappingLookup(self) -> None:
         """Test _RepositoryMapping.lookup() method for both exact and prefix-based mappings."""
         exact_mappings = {
@@ -755,6 +989,75 @@ class RunfilesTest(unittest.TestCase):
         self.assertFalse(repo_mapping.is_empty())  # Should have mappings
         self.assertTrue(empty_mapping.is_empty())  # Should be empty
 
+    def testRepositoryMappingPrefixOrder(self) -> None:
+        """Test that the first matching prefix wins, not the longest one."""
+        repo_mapping = _RepositoryMapping(
+            {},
+            {
+                ("deps+", "lib"): "lib~general",
+                ("deps+specific+", "lib"): "lib~specific",
+                ("deps+specific+", "other"): "other~specific",
+                ("", "other"): "other~any",
+            },
+        )
+        self.assertEqual(
+            repo_mapping.lookup("deps+specific+repo", "lib"), "lib~general"
+        )
+        self.assertEqual(repo_mapping.lookup("deps+", "lib"), "lib~general")
+        self.assertIsNone(repo_mapping.lookup("deps", "lib"))
+        self.assertEqual(
+            repo_mapping.lookup("deps+specific+repo", "other"), "other~specific"
+        )
+        self.assertEqual(repo_mapping.lookup("unrelated", "other"), "other~any")
+
+    def testRepositoryMappingFromFileIsParsedLazily(self) -> None:
+        with _MockFile(
+            name="_repo_mapping",
+            contents=[
+                ",my_module,_main",
+                "deps+*,lib,lib~prefix",
+            ],
+        ) as rm:
+            repo_mapping = _RepositoryMapping.create_from_file(rm.Path())
+            self.assertFalse(repo_mapping.is_empty())
+            self.assertEqual(repo_mapping._exact_mappings, {})
+
+            self.assertEqual(repo_mapping.lookup("", "my_module"), "_main")
+            self.assertEqual(repo_mapping.lookup("deps+foo", "lib"), "lib~prefix")
+            self.assertIsNone(repo_mapping.lookup("", "lib"))
+            self.assertFalse(repo_mapping.is_empty())
+
+        with _MockFile(name="_repo_mapping") as rm:
+            self.assertTrue(_RepositoryMapping.create_from_file(rm.Path()).is_empty())
+        self.assertTrue(
+            _RepositoryMapping.create_from_file("non-existing path").is_empty()
+        )
+
+    def testRepositoryMappingFromFileIsParsedOnceConcurrently(self) -> None:
+        with _MockFile(
+            name="_repo_mapping",
+            contents=[",my_module,_main", "deps+*,lib,lib~prefix"],
+        ) as rm:
+            repo_mapping = _RepositoryMapping.create_from_file(rm.Path())
+            loads = []
+            load_locked = repo_mapping._load_locked
+
+            def counting_load_locked(path: str) -> None:
+                loads.append(path)
+                load_locked(path)
+
+            repo_mapping._load_locked = counting_load_locked  # type: ignore[method-assign]
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(
+                    executor.map(
+                        lambda i: repo_mapping.lookup(f"deps+{i}", "lib"), range(64)
+                    )
+                )
+
+            self.assertEqual(results, ["lib~prefix"] * 64)
+            self.assertEqual(len(loads), 1)
+
     def testCurrentRepository(self) -> None:
         # Under bzlmod, the current repository name is the empty string instead
         # of the name in the workspace file.
@@ -793,8 +1096,9 @@ class _MockFile:
         traceback: Any,  # pylint: disable=unused-argument
     ) -> None:
         if self._path:
-            os.remove(self._path)
-            os.rmdir(os.path.dirname(self._path))
+            # The directory may also contain files created next to the mock
+            # file, e.g. a runfiles manifest index.
+            shutil.rmtree(os.path.dirname(self._path))
 
     def Path(self) -> str:
         assert self._path is not None  # type assert
@@ -0,0 +1,473 @@
+"""Benchmarks the Python build tools on synthetic trees of files.
+
+Run with:
+
+    bazel run //tests/tools/benchmarks:build_tools_benchmark -- --output=$PWD/results.json
+
+Each tool (wheelmaker, zipper, and the precompiler) is run as a separate
+process, like Bazel runs it, on each of these trees:
+
+* `many_small`: many small Python files.
+* `few_huge`: a few large, partly compressible files.
+* `deep_dirs`: Python files in deeply nested directories.
+* `symlink_runfiles`: a runfiles-like tree of symlinks into a smaller pool of
+  files.
+
+For every run, the wall time, throughput, peak RSS of the tool's process, and
+size of its output are reported. The results can be written as JSON with
+`--output`, and compared with an earlier run (e.g. of another commit) with
+`--compare`.
+
+The trees are generated from a fixed seed, so runs with the same `--scale` are
+comparable. Peak RSS is only measured on POSIX systems. On Linux, it is the
+tool process's `VmHWM`, read by a small launcher right before the tool exits.
+Elsewhere, it is the `ru_maxrss` of the tool process, which includes the pages
+it inherited from this process when it was forked, so it is never lower than
+the benchmark's own RSS.
+"""
+
+import argparse
+import dataclasses
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import tools.precompiler.precompiler as precompiler
+import tools.private.zipapp.zipper as zipper
+import tools.wheelmaker as wheelmaker
+
+# Version of the JSON results format.
+_RESULTS_VERSION = 1
+
+# Environment variables that enable caches shared between runs of the tools,
+# which would make repeated runs measure the cache instead of the tool.
+_CACHE_ENV_VARS = (
+    "RULES_PYTHON_PRECOMPILE_CACHE_DIR",
+    "RULES_PYTHON_WHEEL_INCREMENTAL_DIR",
+)
+
+# A template for generated Python files. `{i}` makes each file unique.
+_PY_TEMPLATE = '''\
+"""Generated module {i}."""
+
+import os
+
+
+class Thing{i}:
+    def __init__(self, value):
+        self.value = value
+
+    def describe(self):
+        return "thing {i}: " + str(self.value) + os.sep
+
+
+def make_things(count={i}):
+    return [Thing{i}(n) for n in range(count % 100)]
+'''
+
+
+# Runs the tool given by argv[2:] like `python <tool> <args>`, and writes its
+# peak RSS in KiB to argv[1] when it exits. Unlike `ru_maxrss`, `VmHWM` is reset
+# when the process execs, so it doesn't include the pages of the process that
+# forked it.
+_PEAK_RSS_LAUNCHER = """\
+import atexit, os, runpy, sys
+
+def _write_peak_rss(path=sys.argv[1]):
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                with open(path, "w") as f:
+                    f.write(line.split()[1])
+
+atexit.register(_write_peak_rss)
+sys.argv = sys.argv[2:]
+sys.path[0] = os.path.dirname(os.path.abspath(sys.argv[0]))
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+
+@dataclasses.dataclass
+class _Tree:
+    """A generated tree of files to run the tools on."""
+
+    name: str
+    # (path in the output, path on disk) pairs.
+    files: "list[tuple[str, str]]"
+    input_bytes: int
+
+
+@dataclasses.dataclass
+class _Result:
+    tool: str
+    tree: str
+    files: int
+    input_bytes: int
+    seconds: float
+    mib_per_second: float
+    files_per_second: float
+    peak_rss_bytes: "int | None"
+    output_bytes: int
+
+
+def _write(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _python_source(i: int, rng: random.Random) -> bytes:
+    # Vary the length so that files aren't all the same size.
+    padding = "".join(f"# {rng.random()}\n" for _ in range(rng.randrange(5, 60)))
+    return (_PY_TEMPLATE.format(i=i) + padding).encode("utf-8")
+
+
+def _make_many_small(root: str, scale: float, rng: random.Random) -> "list[str]":
+    paths = []
+    for i in range(max(1, int(5000 * scale))):
+        paths.append(f"pkg{i // 100}/module{i}.py")
+        _write(os.path.join(root, paths[-1]), _python_source(i, rng))
+    return paths
+
+
+def _make_few_huge(root: str, scale: float, rng: random.Random) -> "list[str]":
+    paths = []
+    for i in range(3):
+        paths.append(f"data/blob{i}.bin")
+        os.makedirs(os.path.join(root, "data"), exist_ok=True)
+        with open(os.path.join(root, paths[-1]), "wb") as f:
+            # Alternate random and repetitive data, so that the files are
+            # about half compressible.
+            for _ in range(max(1, int(32 * scale))):
+                f.write(rng.randbytes(2**19))
+                f.write(_python_source(i, rng) * (2**19 // 1024))
+    return paths
+
+
+def _make_deep_dirs(root: str, scale: float, rng: random.Random) -> "list[str]":
+    paths = []
+    for i in range(max(1, int(1000 * scale))):
+        dirs = "/".join(f"level{depth}_{(i >> (depth % 8)) % 3}" for depth in range(32))
+        paths.append(f"{dirs}/module{i}.py")
+        _write(os.path.join(root, paths[-1]), _python_source(i, rng))
+    return paths
+
+
+def _make_symlink_runfiles(root: str, scale: float, rng: random.Random) -> "list[str]":
+    pool_size = max(1, int(200 * scale))
+    for i in range(pool_size):
+        _write(os.path.join(root, "pool", f"file{i}.py"), _python_source(i, rng))
+    paths = []
+    for i in range(max(1, int(5000 * scale))):
+        paths.append(f"runfiles/repo{i % 20}/pkg/file{i}.py")
+        link = os.path.join(root, paths[-1])
+        os.makedirs(os.path.dirname(link), exist_ok=True)
+        os.symlink(os.path.join(root, "pool", f"file{i % pool_size}.py"), link)
+    return paths
+
+
+_TREES = {
+    "many_small": _make_many_small,
+    "few_huge": _make_few_huge,
+    "deep_dirs": _make_deep_dirs,
+    "symlink_runfiles": _make_symlink_runfiles,
+}
+
+
+def _make_tree(name: str, root: str, scale: float) -> _Tree:
+    paths = _TREES[name](root, scale, random.Random(name))
+    files = [(path, os.path.join(root, path)) for path in paths]
+    input_bytes = sum(os.path.getsize(path) for _, path in files)
+    return _Tree(name=name, files=files, input_bytes=input_bytes)
+
+
+def _write_lines(path: str, lines: "list[str]") -> str:
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(line + "\n" for line in lines)
+    return path
+
+
+def _runfiles_manifest(tree: _Tree, workdir: str) -> str:
+    """Writes a manifest in the format of zipper."""
+    return _write_lines(
+        os.path.join(workdir, "manifest.txt"),
+        [f"rf-file|0|{name}|{path}" for name, path in tree.files],
+    )
+
+
+def _wheelmaker_command(tree: _Tree, workdir: str) -> "tuple[list[str], str]":
+    input_file_list = _write_lines(
+        os.path.join(workdir, "input_files.txt"),
+        [f"{name};{path}" for name, path in tree.files],
+    )
+    metadata = _write_lines(
+        os.path.join(workdir, "METADATA"),
+        ["Metadata-Version: 2.1", "Name: bench", "Version: 1.0.0"],
+    )
+    output = os.path.join(workdir, "bench-1.0.0-py3-none-any.whl")
+    command = [
+        wheelmaker.__file__,
+        "--name=bench",
+        "--version=1.0.0",
+        f"--out={output}",
+        f"--name_file={os.path.join(workdir, 'name.txt')}",
+        f"--metadata_file={metadata}",
+        f"--input_file_list={input_file_list}",
+        "--jobs=0",
+    ]
+    return command, output
+
+
+def _zipper_command(tree: _Tree, workdir: str) -> "tuple[list[str], str]":
+    output = os.path.join(workdir, "app.zip")
+    command = [
+        zipper.__file__,
+        _runfiles_manifest(tree, workdir),
+        output,
+        "--compression=6",
+        "--workspace-name=_main",
+        "--jobs=0",
+    ]
+    return command, output
+
+
+def _precompiler_command(tree: _Tree, workdir: str) -> "tuple[list[str], str] | None":
+    output = os.path.join(workdir, "pycs")
+    args = []
+    for name, path in tree.files:
+        if name.endswith(".py"):
+            args += ["--src", path, "--src_name", name]
+            args += ["--pyc", os.path.join(output, name + "c")]
+    if not args:
+        return None
+    params = _write_lines(os.path.join(workdir, "precompiler.params"), args)
+    return [precompiler.__file__, f"@{params}"], output
+
+
+_TOOLS = {
+    "wheelmaker": _wheelmaker_command,
+    "zipper": _zipper_command,
+    "precompiler": _precompiler_command,
+}
+
+
+def _path_size(path: str) -> int:
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(dirpath, filename))
+        for dirpath, _, filenames in os.walk(path)
+        for filename in filenames
+    )
+
+
+def _run_command(command: "list[str]") -> "tuple[float, int | None]":
+    """Runs a tool, returning its wall time and peak RSS in bytes."""
+    env = dict(os.environ)
+    for name in _CACHE_ENV_VARS:
+        env.pop(name, None)
+    # The tools are run outside of Bazel, so they need this process's
+    # sys.path to find their dependencies.
+    env["PYTHONPATH"] = os.pathsep.join(sys.path)
+
+    if os.path.exists("/proc/self/status"):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            peak_rss_file = os.path.join(tmp_dir, "peak_rss")
+            start = time.perf_counter()
+            returncode = subprocess.call(
+                [sys.executable, "-c", _PEAK_RSS_LAUNCHER, peak_rss_file] + command,
+                env=env,
+            )
+            seconds = time.perf_counter() - start
+            try:
+                with open(peak_rss_file) as f:
+                    peak_rss = int(f.read()) * 1024
+            except (OSError, ValueError):
+                peak_rss = None
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, command)
+        return seconds, peak_rss
+
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable] + command, env=env)
+    if hasattr(os, "wait4"):
+        # ru_maxrss includes the pages inherited from this process, see the
+        # module docstring.
+        _, status, rusage = os.wait4(process.pid, 0)
+        seconds = time.perf_counter() - start
+        returncode = os.waitstatus_to_exitcode(status)
+        # ru_maxrss is in bytes on macOS, and in KiB elsewhere.
+        peak_rss = rusage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+        # Let Popen know the process was already waited for.
+        process.returncode = returncode
+    else:
+        returncode = process.wait()
+        seconds = time.perf_counter() - start
+        peak_rss = None
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command)
+    return seconds, peak_rss
+
+
+def _benchmark(tool: str, tree: _Tree, workdir: str, repeat: int) -> "_Result | None":
+    best_seconds = float("inf")
+    peak_rss = None
+    output_bytes = 0
+    for _ in range(repeat):
+        shutil.rmtree(workdir, ignore_errors=True)
+        os.makedirs(workdir)
+        command = _TOOLS[tool](tree, workdir)
+        if command is None:
+            return None
+        command, output = command
+        seconds, rss = _run_command(command)
+        best_seconds = min(best_seconds, seconds)
+        if rss is not None:
+            peak_rss = max(peak_rss or 0, rss)
+        output_bytes = _path_size(output)
+    return _Result(
+        tool=tool,
+        tree=tree.name,
+        files=len(tree.files),
+        input_bytes=tree.input_bytes,
+        seconds=best_seconds,
+        mib_per_second=tree.input_bytes / 2**20 / best_seconds,
+        files_per_second=len(tree.files) / best_seconds,
+        peak_rss_bytes=peak_rss,
+        output_bytes=output_bytes,
+    )
+
+
+def _git_commit() -> "str | None":
+    workspace = os.environ.get("BUILD_WORKSPACE_DIRECTORY", os.getcwd())
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=workspace,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_results(results: "list[_Result]", baseline: "dict | None") -> None:
+    previous = {}
+    if baseline:
+        previous = {(r["tool"], r["tree"]): r for r in baseline["results"]}
+
+    header = f"{'tool':<15} {'tree':<17} {'files':>7} {'seconds':>9} {'MiB/s':>8} {'peak RSS MiB':>13} {'output MiB':>11}"
+    if previous:
+        header += f" {'vs baseline':>12}"
+    print(header)
+    for r in results:
+        rss = "-" if r.peak_rss_bytes is None else f"{r.peak_rss_bytes / 2**20:.1f}"
+        line = (
+            f"{r.tool:<15} {r.tree:<17} {r.files:>7} {r.seconds:>9.3f} "
+            f"{r.mib_per_second:>8.1f} {rss:>13} {r.output_bytes / 2**20:>11.2f}"
+        )
+        if (r.tool, r.tree) in previous:
+            change = r.seconds / previous[r.tool, r.tree]["seconds"] - 1
+            line += f" {change:>+11.1%}"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="\n".join(__doc__.splitlines()[1:]),
+    )
+    parser.add_argument(
+        "--tools",
+        nargs="+",
+        choices=sorted(_TOOLS),
+        default=list(_TOOLS),
+        help="The tools to benchmark.",
+    )
+    parser.add_argument(
+        "--trees",
+        nargs="+",
+        choices=sorted(_TREES),
+        default=list(_TREES),
+        help="The trees of files to benchmark the tools on.",
+    )
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Multiplies the number and size of the files in the trees.",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Number of times to run each benchmark. The best time is reported.",
+    )
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument(
+        "--compare",
+        help="A JSON file from an earlier run to compare the times with.",
+    )
+    parser.add_argument(
+        "--workdir",
+        help="Directory to generate the trees in. Defaults to a temporary "
+        "directory, which is deleted afterwards.",
+    )
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="build_tools_benchmark")
+    results = []
+    try:
+        for tree_name in args.trees:
+            tree = _make_tree(
+                tree_name, os.path.join(workdir, "trees", tree_name), args.scale
+            )
+            for tool in args.tools:
+                result = _benchmark(
+                    tool, tree, os.path.join(workdir, "out", tool), args.repeat
+                )
+                if result is not None:
+                    results.append(result)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    _print_results(results, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": _RESULTS_VERSION,
+                    "commit": _git_commit(),
+                    "timestamp": datetime.datetime.now(
+                        datetime.timezone.utc
+                    ).isoformat(),
+                    "python": sys.version,
+                    "platform": platform.platform(),
+                    "cpu_count": os.cpu_count(),
+                    "scale": args.scale,
+                    "repeat": args.repeat,
+                    "results": [dataclasses.asdict(r) for r in results],
+                },
+                f,
+                indent=2,
+            )
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Benchmarks the startup of a binary that uses the script bootstrap.
+
+Run with:
+
+    bazel run //tests/tools/benchmarks:startup_benchmark
+
+The binary is run repeatedly with RULES_PYTHON_STARTUP_TRACE set, and the
+median wall time and median duration of each traced startup phase are
+reported. Runs are done both with and without the runfiles root handoff from
+the stage 1 bootstrap, which lets stage 2 and `_bazel_site_init` skip
+searching for the runfiles root. The handoff is disabled by overriding the
+`-XRULES_PYTHON_RUNFILES_ROOT` interpreter option with an empty value.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+
+# Mode name -> environment variables to run the binary with.
+_MODES = {
+    "handoff": {},
+    "no handoff": {
+        "RULES_PYTHON_ADDITIONAL_INTERPRETER_ARGS": "-XRULES_PYTHON_RUNFILES_ROOT=",
+    },
+}
+
+# Environment variables that would make the binary use another binary's
+# runfiles, e.g. those of this benchmark when run with `bazel run`.
+_REMOVED_ENV = (
+    "JAVA_RUNFILES",
+    "RULES_PYTHON_ADDITIONAL_INTERPRETER_ARGS",
+    "RUNFILES_DIR",
+    "RUNFILES_MANIFEST_FILE",
+)
+
+
+def _run(binary: str, env: dict[str, str], trace: str) -> dict[str, float]:
+    """Runs the binary once and returns the durations in microseconds.
+
+    The "wall" entry is the time to run the whole binary. The other entries
+    are the phases in the startup trace.
+    """
+    env = dict(env, RULES_PYTHON_STARTUP_TRACE=trace)
+    start = time.perf_counter()
+    subprocess.run([binary], env=env, check=True, stdout=subprocess.DEVNULL)
+    durations = {"wall": (time.perf_counter() - start) * 1e6}
+    with open(trace, encoding="utf-8") as f:
+        for event in json.load(f)["traceEvents"]:
+            durations[event["name"]] = event["dur"]
+    return durations
+
+
+def _print_results(results: dict[str, dict[str, list[float]]]) -> None:
+    modes = list(results)
+    names = sorted({name for durations in results.values() for name in durations})
+    width = max(len(name) for name in names)
+    print(f"{'phase (median us)':<{width}}" + "".join(f"{m:>14}" for m in modes))
+    for name in names:
+        line = f"{name:<{width}}"
+        for mode in modes:
+            values = results[mode].get(name)
+            line += f"{statistics.median(values):>14.0f}" if values else f"{'-':>14}"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="\n".join(__doc__.splitlines()[1:]),
+    )
+    parser.add_argument(
+        "--binary",
+        required=True,
+        help="The binary to run. It must use --bootstrap_impl=script.",
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=50,
+        help="Number of times to run the binary in each mode.",
+    )
+    args = parser.parse_args()
+
+    binary = os.path.abspath(args.binary)
+    base_env = {k: v for k, v in os.environ.items() if k not in _REMOVED_ENV}
+    results = {mode: {} for mode in _MODES}
+    with tempfile.TemporaryDirectory(prefix="startup_benchmark") as tmp:
+        trace = os.path.join(tmp, "trace.json")
+        # Alternate between the modes so that they're affected alike by
+        # e.g. the file system cache warming up.
+        for _ in range(args.runs):
+            for mode, env in _MODES.items():
+                durations = _run(binary, dict(base_env, **env), trace)
+                for name, duration in durations.items():
+                    results[mode].setdefault(name, []).append(duration)
+
+    _print_results(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""A binary that does nothing, for benchmarking startup."""
@@ -0,0 +1,81 @@
+"""Benchmarks writing the RECORD file of wheels with many files.
+
+Run with:
+
+    bazel run //tests/tools/benchmarks:wheelmaker_record_benchmark
+
+The RECORD rows are added directly, so only formatting and writing the RECORD
+file is measured, not hashing or compressing the files themselves.
+"""
+
+import argparse
+import io
+import time
+import tracemalloc
+import zipfile
+
+import tools.wheelmaker as wheelmaker
+
+_DEFAULT_SIZES = [1_000, 10_000, 50_000, 100_000, 200_000]
+_DIGEST = "sha256=47DEQpj8HBSa-_TImW-5JCeuQeRkm5NMpJWZG3hSuFU"
+
+
+def _make_whl_file(num_files: int, quote_all: bool) -> wheelmaker._WhlFile:
+    whl = wheelmaker._WhlFile(
+        io.BytesIO(),
+        mode="w",
+        distribution_prefix="bench-1.0.0",
+        compression=zipfile.ZIP_DEFLATED,
+        quote_all_filenames=quote_all,
+    )
+    for i in range(num_files):
+        # Every 100th file has a name that needs quoting.
+        sep = "," if i % 100 == 0 else "_"
+        whl._add_to_record(f"bench/pkg{i % 50}/module{sep}{i}.py", _DIGEST, i)
+    return whl
+
+
+def _run(num_files: int, quote_all: bool, repeat: int) -> tuple[float, int]:
+    """Returns the best time and the peak memory of writing the RECORD."""
+    best = float("inf")
+    peak = 0
+    for _ in range(repeat):
+        whl = _make_whl_file(num_files, quote_all)
+        tracemalloc.start()
+        start = time.perf_counter()
+        whl.add_recordfile()
+        best = min(best, time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        whl.close()
+    return best, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=_DEFAULT_SIZES,
+        help="Numbers of files in the wheels to benchmark.",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Number of times to run each benchmark. The best time is reported.",
+    )
+    args = parser.parse_args()
+
+    print(f"{'files':>8} {'quote_all':>9} {'seconds':>9} {'peak MiB':>9}")
+    for num_files in args.sizes:
+        for quote_all in (False, True):
+            seconds, peak = _run(num_files, quote_all, args.repeat)
+            print(
+                f"{num_files:>8} {str(quote_all):>9} {seconds:>9.3f} {peak / 2**20:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
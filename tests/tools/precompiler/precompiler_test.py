@@ -0,0 +1,218 @@
+import json
+import os
+import subprocess
+import sys
+
+from tools.precompiler import precompiler
+
+
+def _write_srcs(tmp_path, count):
+    args = []
+    for i in range(count):
+        src = tmp_path / f"mod{i}.py"
+        src.write_text(f"VALUE = {i}\n")
+        args += [
+            "--src",
+            str(src),
+            "--src_name",
+            f"pkg/mod{i}.py",
+            "--pyc",
+            str(tmp_path / f"mod{i}.pyc"),
+        ]
+    return args
+
+
+def _read_pycs(tmp_path, count):
+    return [(tmp_path / f"mod{i}.pyc").read_bytes() for i in range(count)]
+
+
+def test_split_batches():
+    items = list(range(10))
+    batches = precompiler._split_batches(items, 3)
+    assert len(batches) == 3
+    assert sorted(sum(batches, [])) == items
+    assert precompiler._split_batches(items[:2], 8) == [[0], [1]]
+    assert precompiler._split_batches([], 8) == [[]]
+
+
+def test_compile_with_pool_matches_serial(tmp_path):
+    serial_dir = tmp_path / "serial"
+    pool_dir = tmp_path / "pool"
+    serial_dir.mkdir()
+    pool_dir.mkdir()
+    parser = precompiler._create_parser()
+
+    precompiler._compile(parser.parse_args(_write_srcs(serial_dir, 5)))
+    pool = precompiler._CompilePool(2)
+    try:
+        precompiler._compile(parser.parse_args(_write_srcs(pool_dir, 5)), pool)
+    finally:
+        pool.shutdown()
+
+    assert _read_pycs(pool_dir, 5) == _read_pycs(serial_dir, 5)
+
+
+def test_persistent_worker_multiplexed_requests(tmp_path):
+    proc = subprocess.Popen(
+        [
+            sys.executable,
+            precompiler.__file__,
+            "--persistent_worker",
+            "--jobs=2",
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        request_dirs = []
+        for request_id in (1, 2, 3):
+            request_dir = tmp_path / str(request_id)
+            request_dir.mkdir()
+            request_dirs.append(request_dir)
+            request = {
+                "arguments": _write_srcs(request_dir, 4),
+                "requestId": request_id,
+            }
+            proc.stdin.write(json.dumps(request) + "\n")
+        proc.stdin.flush()
+
+        responses = [json.loads(proc.stdout.readline()) for _ in request_dirs]
+    finally:
+        proc.stdin.close()
+        proc.kill()
+        proc.wait()
+        proc.stdout.close()
+
+    assert sorted(r["requestId"] for r in responses) == [1, 2, 3]
+    assert all(r["exitCode"] == 0 for r in responses), responses
+    for request_dir in request_dirs:
+        for i in range(4):
+            assert os.path.exists(request_dir / f"mod{i}.pyc")
+
+
+def test_persistent_worker_survives_compile_error(tmp_path):
+    proc = subprocess.Popen(
+        [
+            sys.executable,
+            precompiler.__file__,
+            "--persistent_worker",
+            "--jobs=2",
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        responses = []
+        for request_id, invalid in ((1, True), (2, False)):
+            request_dir = tmp_path / str(request_id)
+            request_dir.mkdir()
+            args = _write_srcs(request_dir, 3)
+            if invalid:
+                (request_dir / "mod1.py").write_text("def broken(:\n")
+            request = {"arguments": args, "requestId": request_id}
+            proc.stdin.write(json.dumps(request) + "\n")
+            proc.stdin.flush()
+            responses.append(json.loads(proc.stdout.readline()))
+    finally:
+        proc.stdin.close()
+        proc.kill()
+        proc.wait()
+        proc.stdout.close()
+
+    assert responses[0]["exitCode"] != 0
+    assert "pkg/mod1.py" in responses[0]["output"]
+    assert "BrokenProcessPool" not in responses[0]["output"]
+    assert responses[1]["exitCode"] == 0, responses[1]
+    for i in range(3):
+        assert os.path.exists(tmp_path / "2" / f"mod{i}.pyc")
+
+
+def test_cache_hit_reuses_pyc(tmp_path):
+    cache = precompiler._PycCache(str(tmp_path / "cache"), 1024 * 1024)
+    parser = precompiler._create_parser()
+    first_dir = tmp_path / "first"
+    second_dir = tmp_path / "second"
+    first_dir.mkdir()
+    second_dir.mkdir()
+
+    assert precompiler._compile(
+        parser.parse_args(_write_srcs(first_dir, 3)), cache=cache
+    ) == (0, 3)
+    assert precompiler._compile(
+        parser.parse_args(_write_srcs(second_dir, 3)), cache=cache
+    ) == (3, 0)
+    assert _read_pycs(second_dir, 3) == _read_pycs(first_dir, 3)
+
+    # A different source name is embedded in the pyc, so it's a different key.
+    args = _write_srcs(second_dir, 1)
+    args[args.index("--src_name") + 1] = "other/mod0.py"
+    assert precompiler._compile(parser.parse_args(args), cache=cache) == (0, 1)
+
+
+def test_cache_not_used_for_timestamp_pycs(tmp_path):
+    cache = precompiler._PycCache(str(tmp_path / "cache"), 1024 * 1024)
+    args = ["--invalidation_mode=timestamp"] + _write_srcs(tmp_path, 2)
+    options = precompiler._create_parser().parse_args(args)
+
+    assert precompiler._compile(options, cache=cache) == (0, 0)
+    assert not (tmp_path / "cache").exists()
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache_dir = tmp_path / "cache"
+    parser = precompiler._create_parser()
+    precompiler._compile(
+        parser.parse_args(_write_srcs(tmp_path, 4)),
+        cache=precompiler._PycCache(str(cache_dir), 1024 * 1024),
+    )
+    entries = sorted(cache_dir.glob("*/*.pyc"))
+    assert len(entries) == 4
+    for i, entry in enumerate(entries):
+        os.utime(entry, (1000 + i, 1000 + i))
+    entry_size = entries[0].stat().st_size
+
+    # Room for about two entries: the next write evicts the oldest ones.
+    cache = precompiler._PycCache(str(cache_dir), entry_size * 2 + entry_size // 2)
+    cache.record_added(0)
+
+    assert sorted(cache_dir.glob("*/*.pyc")) == entries[2:]
+
+
+def test_persistent_worker_reports_cache_stats(tmp_path):
+    proc = subprocess.Popen(
+        [
+            sys.executable,
+            precompiler.__file__,
+            "--persistent_worker",
+            "--jobs=1",
+            "--cache_dir",
+            str(tmp_path / "cache"),
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        outputs = []
+        for request_id in (1, 2):
+            request_dir = tmp_path / str(request_id)
+            request_dir.mkdir()
+            request = {
+                "arguments": _write_srcs(request_dir, 2),
+                "requestId": request_id,
+            }
+            proc.stdin.write(json.dumps(request) + "\n")
+            proc.stdin.flush()
+            outputs.append(json.loads(proc.stdout.readline())["output"])
+    finally:
+        proc.stdin.close()
+        proc.kill()
+        proc.wait()
+        proc.stdout.close()
+
+    assert outputs == [
+        "pyc cache: 0 hits, 2 misses\n",
+        "pyc cache: 2 hits, 0 misses\n",
+    ]
@@ -1,6 +1,14 @@
+import base64
+import csv
+import hashlib
 import io
+import os
+import shutil
+import tempfile
 import unittest
+import zipfile
 from dataclasses import dataclass, field
+from unittest import mock
 
 import tools.wheelmaker as wheelmaker
 
@@ -41,6 +49,183 @@ class QuoteAllFilenamesTest(unittest.TestCase):
         self.assertEqual(whl._quote_filename("foo,bar/baz.py"), '"foo,bar/baz.py"')
 
 
+class RecordFileTest(unittest.TestCase):
+    def test_record_rows(self) -> None:
+        names = [
+            f"pkg/file{i}.py" for i in range(2 * wheelmaker._RECORD_ROWS_PER_BLOCK)
+        ]
+        names += ["pkg/a,b.py", 'pkg/a"b.py', "pkg/a b.py", "pkg/\u00e9.py"]
+        buf = io.BytesIO()
+        with wheelmaker._WhlFile(
+            buf, mode="w", distribution_prefix="test-1.0.0"
+        ) as whl:
+            for name in names:
+                whl.add_string(name, name)
+            whl.add_recordfile()
+
+        with zipfile.ZipFile(buf) as zf:
+            record = zf.read("test-1.0.0.dist-info/RECORD").decode("utf-8")
+        rows = list(csv.reader(io.StringIO(record)))
+        self.assertEqual([row[0] for row in rows[:-1]], names)
+        self.assertEqual(rows[-1], ["test-1.0.0.dist-info/RECORD", "", ""])
+        digest = base64.urlsafe_b64encode(hashlib.sha256(b"pkg/file0.py").digest())
+        self.assertEqual(
+            rows[0], ["pkg/file0.py", "sha256=" + digest.decode().rstrip("="), "12"]
+        )
+        self.assertIn("\npkg/file1.py,", record)
+        self.assertIn('\n"pkg/a,b.py",', record)
+
+
+class ParallelAddFilesTest(unittest.TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.files = []
+        for i, content in enumerate(
+            [
+                b"",
+                b"print('hello')\n" * 100,
+                os.urandom(3 * wheelmaker._BLOCK_SIZE + 7),
+                b"a" * (wheelmaker._SPOOL_MAX_SIZE + 1),
+            ]
+        ):
+            path = os.path.join(self.tmpdir, f"file{i}")
+            with open(path, "wb") as f:
+                f.write(content)
+            self.files.append((f"pkg/file{i}", path))
+        tree = os.path.join(self.tmpdir, "tree")
+        os.makedirs(os.path.join(tree, "sub"))
+        for name in ("b.py", "a.py", "sub/c.py"):
+            with open(os.path.join(tree, name), "w") as f:
+                f.write(name)
+        self.files.append(("pkg/tree", tree))
+
+    def _make_wheel(self, jobs: int, compression: int, previous_wheel=None) -> bytes:
+        buf = io.BytesIO()
+        with wheelmaker._WhlFile(
+            buf,
+            mode="w",
+            distribution_prefix="test-1.0.0",
+            compression=compression,
+            jobs=jobs,
+            previous_wheel=previous_wheel,
+        ) as whl:
+            whl.add_files(self.files)
+            whl.add_recordfile()
+        return buf.getvalue()
+
+    def test_parallel_output_is_identical(self) -> None:
+        for compression in (zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED):
+            with self.subTest(compression=compression):
+                serial = self._make_wheel(1, compression)
+                self.assertEqual(self._make_wheel(4, compression), serial)
+
+    def test_parallel_output_is_valid(self) -> None:
+        with zipfile.ZipFile(
+            io.BytesIO(self._make_wheel(4, zipfile.ZIP_DEFLATED))
+        ) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(
+                zf.namelist()[-4:],
+                [
+                    "pkg/tree/a.py",
+                    "pkg/tree/b.py",
+                    "pkg/tree/sub/c.py",
+                    "test-1.0.0.dist-info/RECORD",
+                ],
+            )
+
+    def test_incremental_output_is_identical(self) -> None:
+        for compression in (zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED):
+            for jobs in (1, 4):
+                with self.subTest(compression=compression, jobs=jobs):
+                    previous_wheel = os.path.join(self.tmpdir, "previous.whl")
+                    with open(previous_wheel, "wb") as f:
+                        f.write(self._make_wheel(1, compression))
+                    with open(self.files[1][1], "ab") as f:
+                        f.write(b"print('changed')\n")
+
+                    compressed = []
+                    compress_file = wheelmaker._compress_file
+
+                    def counting_compress_file(real_filename, compress_type):
+                        compressed.append(real_filename)
+                        return compress_file(real_filename, compress_type)
+
+                    with mock.patch.object(
+                        wheelmaker, "_compress_file", counting_compress_file
+                    ):
+                        incremental = self._make_wheel(
+                            jobs, compression, previous_wheel
+                        )
+
+                    self.assertEqual(compressed, [self.files[1][1]])
+                    self.assertEqual(incremental, self._make_wheel(1, compression))
+
+    def test_incremental_ignores_other_compression(self) -> None:
+        previous_wheel = os.path.join(self.tmpdir, "previous.whl")
+        with open(previous_wheel, "wb") as f:
+            f.write(self._make_wheel(1, zipfile.ZIP_STORED))
+        self.assertEqual(
+            self._make_wheel(1, zipfile.ZIP_DEFLATED, previous_wheel),
+            self._make_wheel(1, zipfile.ZIP_DEFLATED),
+        )
+
+    def test_incremental_ignores_invalid_previous_wheel(self) -> None:
+        previous_wheel = os.path.join(self.tmpdir, "previous.whl")
+        with open(previous_wheel, "wb") as f:
+            f.write(b"not a zip")
+        self.assertEqual(
+            self._make_wheel(4, zipfile.ZIP_DEFLATED, previous_wheel),
+            self._make_wheel(4, zipfile.ZIP_DEFLATED),
+        )
+
+    def test_incremental_previous_wheel_is_output(self) -> None:
+        wheel = os.path.join(self.tmpdir, "test.whl")
+        with wheelmaker._WhlFile(
+            wheel, mode="w", distribution_prefix="test-1.0.0"
+        ) as whl:
+            whl.add_files(self.files)
+            whl.add_recordfile()
+        with open(wheel, "rb") as f:
+            expected = f.read()
+
+        with wheelmaker._WhlFile(
+            wheel,
+            mode="w",
+            distribution_prefix="test-1.0.0",
+            previous_wheel=wheel,
+        ) as whl:
+            whl.add_files(self.files)
+            whl.add_recordfile()
+        with open(wheel, "rb") as f:
+            self.assertEqual(f.read(), expected)
+
+    def test_incremental_path_is_not_made_absolute(self) -> None:
+        with mock.patch.dict(
+            os.environ, {wheelmaker._INCREMENTAL_DIR_ENV: self.tmpdir}
+        ):
+            path = wheelmaker._incremental_wheel_path("bazel-out/k8/bin/test.whl")
+            # A sandboxed action runs in a different directory each build.
+            self.addCleanup(os.chdir, os.getcwd())
+            os.chdir(self.tmpdir)
+            self.assertEqual(
+                wheelmaker._incremental_wheel_path("bazel-out/k8/bin/test.whl"), path
+            )
+
+    def test_incremental_save_failure_is_ignored(self) -> None:
+        wheel = os.path.join(self.tmpdir, "test.whl")
+        with open(wheel, "wb") as f:
+            f.write(b"wheel")
+        # A directory can't be created below a regular file.
+        path = os.path.join(wheel, "incremental", "key.whl")
+        with mock.patch("sys.stderr", new_callable=io.StringIO) as stderr:
+            wheelmaker._save_incremental_wheel(wheel, path)
+        self.assertIn("could not save the wheel", stderr.getvalue())
+        self.assertFalse(os.path.exists(path))
+
+
 @dataclass
 class ArcNameTestCase:
     name: str
@@ -1,3 +1,4 @@
+import hashlib
 import os
 import shutil
 import zipfile
@@ -300,3 +301,276 @@ def test_symlink_extraction(tmp_path):
     assert link2_path.is_symlink(), f"{link2_path} should be a symlink"
     assert os.readlink(link2_path) == "same_dir_target"
     assert link2_path.read_text() == "target content"
+
+
+def test_parallel_output_is_identical_to_serial(tmp_path):
+    manifest_path = tmp_path / "manifest.txt"
+
+    small = tmp_path / "small.txt"
+    small.write_text("small content")
+    exe = tmp_path / "exe.sh"
+    exe.write_text("#!/bin/sh\necho hi\n")
+    exe.chmod(0o755)
+    # Larger than the read chunk size, and partially incompressible.
+    large = tmp_path / "large.bin"
+    large.write_bytes(os.urandom(2**20) + b"abc" * 2**20)
+    empty_file = tmp_path / "empty_file"
+    empty_file.write_bytes(b"")
+    link = tmp_path / "link"
+    link.symlink_to("small.txt")
+
+    manifest_content = [
+        f"regular|0|a/small.txt|{small}",
+        f"rf-file|0|bin/exe.sh|{exe}",
+        f"rf-file|0|data/large.bin|{large}",
+        f"rf-file|0|data/empty_file|{empty_file}",
+        f"rf-file|1|data/link|{link}",
+        "rf-empty|d_rf_empty",
+        "symlink|my_ws/data/sym|my_ws/a/small.txt",
+    ] + [f"rf-file|0|many/f{i}.txt|{small}" for i in range(20)]
+    manifest_path.write_text("\n".join(manifest_content))
+
+    for compression in (0, 1, 9):
+        serial_zip = tmp_path / f"serial{compression}.zip"
+        create_zip(manifest_path, serial_zip, compress_level=compression)
+        for jobs in (2, 0):
+            parallel_zip = tmp_path / f"parallel{compression}_{jobs}.zip"
+            create_zip(
+                manifest_path, parallel_zip, compress_level=compression, jobs=jobs
+            )
+            assert parallel_zip.read_bytes() == serial_zip.read_bytes()
+
+        with zipfile.ZipFile(serial_zip) as zf:
+            assert zf.testzip() is None
+
+
+def test_store_compressed(tmp_path):
+    manifest_path = tmp_path / "manifest.txt"
+    output_zip = tmp_path / "output.zip"
+
+    text = tmp_path / "text.txt"
+    text.write_text("compressible " * 1000)
+    wheel = tmp_path / "pkg.whl"
+    wheel.write_text("compressible " * 1000)
+    random_data = tmp_path / "random.bin"
+    random_data.write_bytes(os.urandom(100_000))
+
+    manifest_content = [
+        f"rf-file|0|text.txt|{text}",
+        f"rf-file|0|pkg.whl|{wheel}",
+        f"rf-file|0|random.bin|{random_data}",
+    ]
+    manifest_path.write_text("\n".join(manifest_content))
+
+    create_zip(manifest_path, output_zip, compress_level=6, store_compressed=True)
+
+    with zipfile.ZipFile(output_zip) as zf:
+        assert zf.testzip() is None
+        assert zf.getinfo("runfiles/my_ws/text.txt").compress_type == (
+            zipfile.ZIP_DEFLATED
+        )
+        assert zf.getinfo("runfiles/my_ws/pkg.whl").compress_type == (
+            zipfile.ZIP_STORED
+        )
+        assert zf.getinfo("runfiles/my_ws/random.bin").compress_type == (
+            zipfile.ZIP_STORED
+        )
+        assert zf.read("runfiles/my_ws/random.bin") == random_data.read_bytes()
+
+    parallel_zip = tmp_path / "parallel.zip"
+    create_zip(
+        manifest_path, parallel_zip, compress_level=6, store_compressed=True, jobs=2
+    )
+    assert parallel_zip.read_bytes() == output_zip.read_bytes()
+
+
+def _write_duplicates_manifest(tmp_path):
+    manifest_path = tmp_path / "manifest.txt"
+    content = os.urandom(5000) + b"x" * 5000
+    original = tmp_path / "original.so"
+    original.write_bytes(content)
+    copy1 = tmp_path / "copy1.so"
+    copy1.write_bytes(content)
+    exe_copy = tmp_path / "exe_copy.so"
+    exe_copy.write_bytes(content)
+    exe_copy.chmod(0o755)
+    small1 = tmp_path / "small1.py"
+    small1.write_text("small")
+    small2 = tmp_path / "small2.py"
+    small2.write_text("small")
+
+    manifest_content = [
+        f"rf-file|0|lib/a/original.so|{original}",
+        f"rf-file|0|lib/b/copy1.so|{copy1}",
+        f"rf-file|0|lib/c/exe_copy.so|{exe_copy}",
+        f"rf-file|0|small1.py|{small1}",
+        f"rf-file|0|small2.py|{small2}",
+    ]
+    manifest_path.write_text("\n".join(manifest_content))
+    return manifest_path, content
+
+
+def test_dedup_symlink(tmp_path):
+    manifest_path, content = _write_duplicates_manifest(tmp_path)
+    output_zip = tmp_path / "output.zip"
+
+    create_zip(manifest_path, output_zip, compress_level=6, dedup="symlink")
+
+    with zipfile.ZipFile(output_zip) as zf:
+        assert_zip_file_content(
+            zf,
+            "runfiles/my_ws/lib/b/copy1.so",
+            is_symlink_file=True,
+            target=symlink_target_path("../a/original.so"),
+        )
+        # Duplicates with different permissions aren't symlinked.
+        assert not is_symlink(zf.getinfo("runfiles/my_ws/lib/c/exe_copy.so"))
+        # Small files aren't deduplicated.
+        assert not is_symlink(zf.getinfo("runfiles/my_ws/small2.py"))
+
+    extract_dir = tmp_path / "extract"
+    extract_dir.mkdir()
+    extract_zip(output_zip, extract_dir)
+    assert (extract_dir / "runfiles/my_ws/lib/b/copy1.so").read_bytes() == content
+
+    parallel_zip = tmp_path / "parallel.zip"
+    create_zip(manifest_path, parallel_zip, compress_level=6, dedup="symlink", jobs=2)
+    assert parallel_zip.read_bytes() == output_zip.read_bytes()
+
+
+def test_dedup_copy(tmp_path):
+    manifest_path, content = _write_duplicates_manifest(tmp_path)
+    output_zip = tmp_path / "output.zip"
+    create_zip(manifest_path, output_zip, compress_level=6, dedup="copy")
+
+    # Reusing the compressed data produces the same archive as compressing
+    # every file.
+    plain_zip = tmp_path / "plain.zip"
+    create_zip(manifest_path, plain_zip, compress_level=6)
+    assert output_zip.read_bytes() == plain_zip.read_bytes()
+
+    with zipfile.ZipFile(output_zip) as zf:
+        assert zf.testzip() is None
+        assert zf.read("runfiles/my_ws/lib/c/exe_copy.so") == content
+
+    parallel_zip = tmp_path / "parallel.zip"
+    create_zip(manifest_path, parallel_zip, compress_level=6, dedup="copy", jobs=2)
+    assert parallel_zip.read_bytes() == output_zip.read_bytes()
+
+
+def test_dedup_copy_store_compressed(tmp_path):
+    manifest_path = tmp_path / "manifest.txt"
+    content = b"compressible " * 1000
+    # Sorted first, and stored because of its extension.
+    wheel = tmp_path / "a.whl"
+    wheel.write_bytes(content)
+    module = tmp_path / "b.py"
+    module.write_bytes(content)
+    manifest_path.write_text(
+        "\n".join(
+            [
+                f"rf-file|0|a.whl|{wheel}",
+                f"rf-file|0|b.py|{module}",
+            ]
+        )
+    )
+
+    output_zip = tmp_path / "output.zip"
+    create_zip(
+        manifest_path,
+        output_zip,
+        compress_level=6,
+        store_compressed=True,
+        dedup="copy",
+    )
+    plain_zip = tmp_path / "plain.zip"
+    create_zip(manifest_path, plain_zip, compress_level=6, store_compressed=True)
+    assert output_zip.read_bytes() == plain_zip.read_bytes()
+
+    with zipfile.ZipFile(output_zip) as zf:
+        assert zf.getinfo("runfiles/my_ws/a.whl").compress_type == (zipfile.ZIP_STORED)
+        assert zf.getinfo("runfiles/my_ws/b.py").compress_type == (zipfile.ZIP_DEFLATED)
+
+
+def test_compute_app_hash(tmp_path):
+    file1_path = str(tmp_path / "file1.txt")
+    with open(file1_path, "wb") as f:
+        f.write(b"content1")
+    file2_path = str(tmp_path / "file2.txt")
+    with open(file2_path, "wb") as f:
+        f.write(b"content2")
+    symlink_path = str(tmp_path / "symlink.txt")
+    os.symlink(file1_path, symlink_path)
+
+    lines = [
+        f"rf-file|0|file1.txt|{file1_path}",
+        f"rf-file|0|file2.txt|{file2_path}",
+        f"rf-symlink|1|symlink.txt|{symlink_path}",
+        "rf-empty|empty_file.txt",
+        # Not a runfile, so not part of the hash.
+        f"regular|0|other.txt|{file2_path}",
+    ]
+    manifest_path = tmp_path / "manifest.txt"
+    manifest_path.write_text("\n".join(lines) + "\n")
+
+    # The manifest lines are hashed in sorted order.
+    h = hashlib.sha256()
+    h.update(b"empty_file.txt")
+    h.update(f"0|file1.txt|{file1_path}".encode("utf-8"))
+    h.update(hashlib.sha256(b"content1").digest())
+    h.update(f"0|file2.txt|{file2_path}".encode("utf-8"))
+    h.update(hashlib.sha256(b"content2").digest())
+    h.update(f"1|symlink.txt|{symlink_path}".encode("utf-8"))
+    h.update(file1_path.encode("utf-8"))
+
+    assert zipper.compute_app_hash(str(manifest_path), {}) == h.hexdigest()
+
+
+def test_main_template_hash_matches_compute_app_hash(tmp_path):
+    manifest_path = tmp_path / "manifest.txt"
+    template = tmp_path / "template.py"
+    template.write_text("hash=%APP_HASH%\nfoo=%FOO%\n")
+
+    file1 = tmp_path / "file1.txt"
+    file1.write_text("content1")
+    large = tmp_path / "large.bin"
+    large.write_bytes(os.urandom(2**20) + b"abc" * 2**20)
+    link = tmp_path / "link"
+    link.symlink_to("file1.txt")
+    shadowed = tmp_path / "shadowed.txt"
+    shadowed.write_text("shadowed")
+
+    hash_manifest_lines = [
+        f"rf-file|0|file1.txt|{file1}",
+        f"rf-file|0|data/large.bin|{large}",
+        f"rf-symlink|1|link|{link}",
+        "rf-empty|empty_file.txt",
+        "symlink|my_ws/sym|my_ws/file1.txt",
+        # Shadowed by the explicit symlink, so never written to the zip.
+        f"rf-file|0|sym|{shadowed}",
+    ]
+    hash_manifest = tmp_path / "hash_manifest.txt"
+    hash_manifest.write_text("\n".join(hash_manifest_lines))
+    # The digests of the files written to the zip are reused for the hash.
+    expected_hash = zipper.compute_app_hash(str(hash_manifest), {})
+    expected_main = f"hash={expected_hash}\nfoo=bar\n"
+
+    manifest_path.write_text("\n".join(hash_manifest_lines))
+    for kwargs in (
+        {},
+        {"compress_level": 6},
+        {"compress_level": 6, "jobs": 2},
+        {"compress_level": 6, "dedup": "copy"},
+    ):
+        output_zip = tmp_path / "output.zip"
+        create_zip(
+            manifest_path,
+            output_zip,
+            main_template=template,
+            main_substitutions={"%FOO%": "bar"},
+            **kwargs,
+        )
+        with zipfile.ZipFile(output_zip) as zf:
+            assert zf.testzip() is None
+            assert_zip_file_content(zf, "__main__.py", expected_main)
+            assert_zip_file_content(zf, "runfiles/my_ws/file1.txt", "content1")
@@ -0,0 +1,177 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from python.private import py_test_main_validator
+
+_RUNS_TESTS = """\
+import unittest
+
+class MyTest(unittest.TestCase):
+    def test_foo(self):
+        pass
+
+if __name__ == "__main__":
+    unittest.main()
+"""
+
+_RUNS_NOTHING = """\
+import unittest
+
+class MyTest(unittest.TestCase):
+    def test_foo(self):
+        pass
+"""
+
+
+class PersistentWorkerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def _run_worker(self, requests):
+        proc = subprocess.Popen(
+            [
+                sys.executable,
+                py_test_main_validator.__file__,
+                "--persistent_worker",
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        try:
+            for request in requests:
+                proc.stdin.write(json.dumps(request) + "\n")
+            proc.stdin.flush()
+            return [json.loads(proc.stdout.readline()) for _ in requests]
+        finally:
+            proc.stdin.close()
+            proc.kill()
+            proc.wait()
+            proc.stdout.close()
+
+    def test_multiplexed_requests(self):
+        good = self._write("good_test.py", _RUNS_TESTS)
+        bad = self._write("bad_test.py", _RUNS_NOTHING)
+        requests = []
+        for request_id, src in ((1, good), (2, bad), (3, good)):
+            requests.append(
+                {
+                    "arguments": [
+                        "--src",
+                        src,
+                        "--label",
+                        "//pkg:test{}".format(request_id),
+                        "--output",
+                        os.path.join(self.tmp_dir, "{}.txt".format(request_id)),
+                    ],
+                    "requestId": request_id,
+                }
+            )
+
+        responses = {r["requestId"]: r for r in self._run_worker(requests)}
+
+        self.assertEqual(responses[1]["exitCode"], 0)
+        self.assertEqual(responses[3]["exitCode"], 0)
+        self.assertEqual(responses[2]["exitCode"], 1)
+        self.assertIn("//pkg:test2 will not run any tests", responses[2]["output"])
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir, "1.txt")))
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, "2.txt")))
+
+    def test_invalid_arguments_do_not_stop_worker(self):
+        good = self._write("good_test.py", _RUNS_TESTS)
+        requests = [
+            {"arguments": ["--bogus"], "requestId": 1},
+            {
+                "arguments": [
+                    "--src",
+                    good,
+                    "--output",
+                    os.path.join(self.tmp_dir, "2.txt"),
+                ],
+                "requestId": 2,
+            },
+        ]
+
+        responses = {r["requestId"]: r for r in self._run_worker(requests)}
+
+        self.assertEqual(responses[1]["exitCode"], 2)
+        self.assertIn("unrecognized arguments: --bogus", responses[1]["output"])
+        self.assertEqual(responses[2]["exitCode"], 0, responses[2])
+
+    def test_parse_warning_in_response_output(self):
+        src = self._write("broken_test.py", "def broken(:\n")
+        requests = [
+            {
+                "arguments": [
+                    "--src",
+                    src,
+                    "--output",
+                    os.path.join(self.tmp_dir, "{}.txt".format(request_id)),
+                ],
+                "requestId": request_id,
+            }
+            for request_id in (1, 2)
+        ]
+
+        responses = self._run_worker(requests)
+
+        for response in responses:
+            self.assertEqual(response["exitCode"], 0, response)
+            self.assertIn("could not parse", response["output"])
+
+    def test_sandbox_dir_request(self):
+        self._write("good_test.py", _RUNS_TESTS)
+        request = {
+            "arguments": ["--src", "good_test.py", "--output", "out.txt"],
+            "requestId": 1,
+            "sandboxDir": self.tmp_dir,
+        }
+
+        (response,) = self._run_worker([request])
+
+        self.assertEqual(response["exitCode"], 0, response)
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir, "out.txt")))
+
+
+class VerdictCacheTest(unittest.TestCase):
+    def test_identical_sources_hit(self):
+        tmp_dir = tempfile.mkdtemp()
+        cache = py_test_main_validator._VerdictCache()
+        parser = py_test_main_validator._create_parser()
+        for name in ("a_test.py", "b_test.py"):
+            src = os.path.join(tmp_dir, name)
+            with open(src, "w") as f:
+                f.write(_RUNS_NOTHING)
+            options = parser.parse_args(
+                ["--src", src, "--output", os.path.join(tmp_dir, name + ".txt")]
+            )
+            exit_code, output = py_test_main_validator._validate(options, cache)
+            self.assertEqual(exit_code, 1)
+            self.assertIn(name, output)
+
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+    def test_evicts_oldest_entry(self):
+        cache = py_test_main_validator._VerdictCache(max_entries=2)
+        cache.put(b"a = 1", True)
+        cache.put(b"b = 1", False)
+        cache.put(b"c = 1", True)
+
+        self.assertIsNone(cache.get(b"a = 1"))
+        self.assertFalse(cache.get(b"b = 1"))
+        self.assertTrue(cache.get(b"c = 1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -21,6 +21,17 @@ import argparse
 import py_compile
 import sys
 
+_CACHE_DIR_ENV = "RULES_PYTHON_PRECOMPILE_CACHE_DIR"
+_CACHE_MAX_BYTES_ENV = "RULES_PYTHON_PRECOMPILE_CACHE_MAX_BYTES"
+_DEFAULT_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+# When the cache is over its size bound, entries are evicted until it's below
+# this fraction of it, so that eviction doesn't happen on every write.
+_CACHE_EVICT_TO_FRACTION = 0.9
+# The number of processes a persistent worker compiles with by default. It's
+# bounded because Bazel runs several worker instances, and matches the CPUs the
+# PyCompile action declares.
+_DEFAULT_WORKER_JOBS = 4
+
 
 def _create_parser() -> "argparse.Namespace":
     parser = argparse.ArgumentParser(fromfile_prefix_chars="@")
@@ -35,10 +46,280 @@ def _create_parser() -> "argparse.Namespace":
     parser.add_argument("--persistent_worker", action="store_true")
     parser.add_argument("--log_level", default="ERROR")
     parser.add_argument("--worker_impl", default="async")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=0,
+        help=(
+            "Number of processes to compile with. 0 means "
+            f"{_DEFAULT_WORKER_JOBS} when run as a persistent worker, and 1 "
+            "otherwise."
+        ),
+    )
+    parser.add_argument(
+        "--cache_dir",
+        help=(
+            "Directory of a local cache of compiled pyc files, shared between "
+            f"builds. Defaults to ${_CACHE_DIR_ENV}. Not used if unset."
+        ),
+    )
+    parser.add_argument(
+        "--cache_max_bytes",
+        type=int,
+        help=(
+            "Size bound of the cache; the least recently used entries are "
+            f"evicted beyond it. Defaults to ${_CACHE_MAX_BYTES_ENV}, or "
+            f"{_DEFAULT_CACHE_MAX_BYTES}."
+        ),
+    )
     return parser
 
 
-def _compile(options: "argparse.Namespace") -> None:
+def _cache_key(
+    src: str,
+    src_name: str,
+    python_version: "str | None",
+    optimize: int,
+    invalidation_mode: str,
+) -> str:
+    """Returns the cache key of compiling src with the given settings."""
+    import hashlib
+    import importlib.util
+
+    src_hash = hashlib.sha256()
+    with open(src, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            src_hash.update(chunk)
+    h = hashlib.sha256(importlib.util.MAGIC_NUMBER)
+    for part in (src_hash.hexdigest(), python_version, optimize, invalidation_mode):
+        h.update(f"{part}\0".encode())
+    h.update(src_name.encode())
+    return h.hexdigest()
+
+
+def _cache_put(entry: str, pyc: str) -> int:
+    """Stores pyc as a cache entry. Returns the number of bytes added."""
+    import os
+    import shutil
+    import tempfile
+
+    # A failure to write to the cache must not fail the build.
+    try:
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(entry), suffix=".tmp")
+        os.close(fd)
+    except OSError:
+        return 0
+    try:
+        shutil.copyfile(pyc, tmp_path)
+        os.replace(tmp_path, entry)
+        return os.path.getsize(entry)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return 0
+
+
+def _compile_batch(
+    batch: "list[tuple[str, str, str]]",
+    optimize: int,
+    invalidation_mode: str,
+    python_version: "str | None" = None,
+    cache_dir: "str | None" = None,
+) -> "tuple[int, int, int]":
+    """Compiles (src, src_name, pyc) tuples. May run in a pool process.
+
+    Returns:
+        A tuple of the number of cache hits, cache misses, and bytes added to
+        the cache.
+    """
+    import os
+    import shutil
+
+    mode = py_compile.PycInvalidationMode[invalidation_mode]
+    # Timestamp-based pycs embed the source's mtime, so they can't be shared.
+    if mode == py_compile.PycInvalidationMode.TIMESTAMP:
+        cache_dir = None
+
+    hits = misses = added = 0
+    for src, src_name, pyc in batch:
+        if cache_dir:
+            key = _cache_key(src, src_name, python_version, optimize, mode.name)
+            entry = os.path.join(cache_dir, key[:2], key + ".pyc")
+            try:
+                # The output is copied instead of hardlinked so that Bazel
+                # changing the output's permissions doesn't affect the entry.
+                os.makedirs(os.path.dirname(pyc) or ".", exist_ok=True)
+                shutil.copyfile(entry, pyc)
+                # The mtime is the entry's last use, for LRU eviction.
+                os.utime(entry)
+                hits += 1
+                continue
+            except FileNotFoundError:
+                misses += 1
+        try:
+            py_compile.compile(
+                src,
+                pyc,
+                doraise=True,
+                dfile=src_name,
+                optimize=optimize,
+                invalidation_mode=mode,
+            )
+        except py_compile.PyCompileError as e:
+            # PyCompileError can't be unpickled, so it would break the process
+            # pool instead of reporting the error.
+            raise RuntimeError(e.msg) from None
+        if cache_dir:
+            added += _cache_put(entry, pyc)
+    return hits, misses, added
+
+
+class _PycCache:
+    """Tracks the size of the pyc cache and evicts entries beyond its bound.
+
+    Entries are read and written directly by `_compile_batch`, which may run
+    in other processes; this object only sees the bytes they added. Multiple
+    workers can share the directory, so the size is re-scanned when evicting.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        import threading
+
+        self.cache_dir = cache_dir
+        self._max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+
+    def record_added(self, num_bytes: int) -> None:
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._scan())
+            else:
+                self._size += num_bytes
+            if self._size > self._max_bytes:
+                self._evict()
+
+    def _scan(self) -> "list[tuple[float, int, str]]":
+        import os
+
+        entries = []
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if not filename.endswith(".pyc"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self) -> None:
+        import os
+
+        entries = sorted(self._scan())
+        size = sum(entry_size for _, entry_size, _ in entries)
+        target = self._max_bytes * _CACHE_EVICT_TO_FRACTION
+        for _, entry_size, path in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+        self._size = size
+
+
+def _create_cache(options: "argparse.Namespace") -> "_PycCache | None":
+    import os
+
+    cache_dir = options.cache_dir or os.environ.get(_CACHE_DIR_ENV)
+    if not cache_dir:
+        return None
+    max_bytes = options.cache_max_bytes
+    if max_bytes is None:
+        max_bytes = int(
+            os.environ.get(_CACHE_MAX_BYTES_ENV) or _DEFAULT_CACHE_MAX_BYTES
+        )
+    return _PycCache(os.path.abspath(cache_dir), max_bytes)
+
+
+def _format_cache_stats(hits: int, misses: int) -> str:
+    return f"pyc cache: {hits} hits, {misses} misses\n"
+
+
+def _split_batches(
+    items: "list[tuple[str, str, str]]", num_batches: int
+) -> "list[list[tuple[str, str, str]]]":
+    """Splits items into at most num_batches batches of similar size."""
+    num_batches = max(1, min(num_batches, len(items)))
+    return [items[i::num_batches] for i in range(num_batches)]
+
+
+class _CompilePool:
+    """The process pool that compilation is dispatched to.
+
+    Compilation is CPU bound and holds the GIL, so running it on threads
+    doesn't let multiplexed requests compile concurrently. If a pool process
+    dies, the pool is replaced, so that later requests can still compile.
+    """
+
+    def __init__(self, jobs: int):
+        import threading
+
+        self.jobs = jobs if jobs > 0 else _DEFAULT_WORKER_JOBS
+        self._lock = threading.Lock()
+        self._executor = self._create_executor()
+
+    def _create_executor(self) -> "concurrent.futures.Executor":  # noqa: F821
+        import concurrent.futures
+        import multiprocessing
+
+        # Spawn is used because forking a process that has threads (e.g. the
+        # async worker's) is unsafe.
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.jobs, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def compile_batches(
+        self, batches: "list[list[tuple[str, str, str]]]", *batch_args
+    ) -> "list[tuple[int, int, int]]":
+        """Runs `_compile_batch` on each batch in the pool."""
+        from concurrent.futures.process import BrokenProcessPool
+
+        executor = self._executor
+        try:
+            futures = [
+                executor.submit(_compile_batch, batch, *batch_args) for batch in batches
+            ]
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            with self._lock:
+                # Concurrent requests may have seen the same broken pool.
+                if self._executor is executor:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    self._executor = self._create_executor()
+            raise
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+
+def _compile(
+    options: "argparse.Namespace",
+    pool: "_CompilePool | None" = None,
+    cache: "_PycCache | None" = None,
+) -> "tuple[int, int]":
+    """Compiles the files of a request.
+
+    Returns:
+        A tuple of the number of cache hits and misses.
+    """
     try:
         invalidation_mode = py_compile.PycInvalidationMode[
             options.invalidation_mode.upper()
@@ -53,16 +334,25 @@ def _compile(options: "argparse.Namespace") -> None:
             "Mismatched number of --src, --src_name, and/or --pyc args"
         )
 
-    for src, src_name, pyc in zip(options.srcs, options.src_names, options.pycs):
-        py_compile.compile(
-            src,
-            pyc,
-            doraise=True,
-            dfile=src_name,
-            optimize=options.optimize,
-            invalidation_mode=invalidation_mode,
-        )
-    return 0
+    items = list(zip(options.srcs, options.src_names, options.pycs))
+    batch_args = (
+        options.optimize,
+        invalidation_mode.name,
+        options.python_version,
+        cache.cache_dir if cache else None,
+    )
+    # A single file isn't worth the round trip to a pool process.
+    if pool is None or len(items) <= 1:
+        results = [_compile_batch(items, *batch_args)]
+    else:
+        # Split the request's files across the pool's processes.
+        results = pool.compile_batches(_split_batches(items, pool.jobs), *batch_args)
+
+    hits = sum(result[0] for result in results)
+    misses = sum(result[1] for result in results)
+    if cache:
+        cache.record_added(sum(result[2] for result in results))
+    return hits, misses
 
 
 # A stub type alias for readability.
@@ -79,9 +369,17 @@ JsonWorkResponse = object
 class _SerialPersistentWorker:
     """Simple, synchronous, serial persistent worker."""
 
-    def __init__(self, instream: "typing.TextIO", outstream: "typing.TextIO"):  # noqa: F821
+    def __init__(
+        self,
+        instream: "typing.TextIO",  # noqa: F821
+        outstream: "typing.TextIO",  # noqa: F821
+        pool: "_CompilePool | None" = None,
+        cache: "_PycCache | None" = None,
+    ):
         self._instream = instream
         self._outstream = outstream
+        self._pool = pool
+        self._cache = cache
         self._parser = _create_parser()
 
     def run(self) -> None:
@@ -123,11 +421,13 @@ class _SerialPersistentWorker:
         if request.get("cancel"):
             return None
         options = self._options_from_request(request)
-        _compile(options)
+        hits, misses = _compile(options, self._pool, self._cache)
         response = {
             "requestId": request.get("requestId", 0),
             "exitCode": 0,
         }
+        if self._cache:
+            response["output"] = _format_cache_stats(hits, misses)
         return response
 
     def _options_from_request(
@@ -148,17 +448,31 @@ class _SerialPersistentWorker:
 class _AsyncPersistentWorker:
     """Asynchronous, concurrent, persistent worker."""
 
-    def __init__(self, reader: "typing.TextIO", writer: "typing.TextIO"):  # noqa: F821
+    def __init__(
+        self,
+        reader: "typing.TextIO",  # noqa: F821
+        writer: "typing.TextIO",  # noqa: F821
+        pool: "_CompilePool | None" = None,
+        cache: "_PycCache | None" = None,
+    ):
         self._reader = reader
         self._writer = writer
+        self._pool = pool
+        self._cache = cache
         self._parser = _create_parser()
         self._request_id_to_task = {}
         self._task_to_request_id = {}
 
     @classmethod
-    async def main(cls, instream: "typing.TextIO", outstream: "typing.TextIO") -> None:  # noqa: F821
+    async def main(
+        cls,
+        instream: "typing.TextIO",  # noqa: F821
+        outstream: "typing.TextIO",  # noqa: F821
+        pool: "_CompilePool | None" = None,
+        cache: "_PycCache | None" = None,
+    ) -> None:
         reader, writer = await cls._connect_streams(instream, outstream)
-        await cls(reader, writer).run()
+        await cls(reader, writer, pool, cache).run()
 
     @classmethod
     async def _connect_streams(
@@ -239,14 +553,18 @@ class _AsyncPersistentWorker:
 
     async def _process_compile_request(self, request: "JsonWorkRequest") -> None:
         options = self._options_from_request(request)
-        # _compile performs a varity of blocking IO calls, so run it separately
-        await asyncio.to_thread(_compile, options)
-        self._send_response(
-            {
-                "requestId": request.get("requestId", 0),
-                "exitCode": 0,
-            }
+        # _compile performs a varity of blocking IO calls and waits for the
+        # process pool, so run it separately
+        hits, misses = await asyncio.to_thread(
+            _compile, options, self._pool, self._cache
         )
+        response = {
+            "requestId": request.get("requestId", 0),
+            "exitCode": 0,
+        }
+        if self._cache:
+            response["output"] = _format_cache_stats(hits, misses)
+        self._send_response(response)
 
     def _options_from_request(self, request: "JsonWorkRequest") -> "argparse.Namespace":
         options = self._parser.parse_args(request["arguments"])
@@ -282,15 +600,33 @@ def main(args: "list[str]") -> int:
         # Only configure logging for workers. This prevents non-worker
         # invocations from spamming stderr with logging info
         logging.basicConfig(level=getattr(logging, options.log_level))
-        _logger.info("persistent worker: impl=%s", options.worker_impl)
-        if options.worker_impl == "serial":
-            _SerialPersistentWorker(sys.stdin, sys.stdout).run()
-        elif options.worker_impl == "async":
-            asyncio.run(_AsyncPersistentWorker.main(sys.stdin, sys.stdout))
-        else:
-            raise ValueError(f"Unknown worker impl: {options.worker_impl}")
+        _logger.info(
+            "persistent worker: impl=%s jobs=%s", options.worker_impl, options.jobs
+        )
+        # Bazel sends multiplexed requests concurrently, up to
+        # --worker_max_multiplex_instances, so the pool is shared by them
+        # rather than created per request.
+        pool = _CompilePool(options.jobs)
+        cache = _create_cache(options)
+        try:
+            if options.worker_impl == "serial":
+                _SerialPersistentWorker(sys.stdin, sys.stdout, pool, cache).run()
+            elif options.worker_impl == "async":
+                asyncio.run(
+                    _AsyncPersistentWorker.main(sys.stdin, sys.stdout, pool, cache)
+                )
+            else:
+                raise ValueError(f"Unknown worker impl: {options.worker_impl}")
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+    elif options.jobs > 1 and options.srcs and len(options.srcs) > 1:
+        pool = _CompilePool(options.jobs)
+        try:
+            _compile(options, pool, _create_cache(options))
+        finally:
+            pool.shutdown()
     else:
-        _compile(options)
+        _compile(options, cache=_create_cache(options))
     return 0
 
 
@@ -1,14 +1,64 @@
 import argparse
+import collections
+import concurrent.futures
+import hashlib
 import os
+import posixpath
 import shutil
+import struct
 import sys
+import tempfile
 import zipfile
+import zlib
 from os.path import dirname
 
 # Unix permission bit for symlink (S_IFLNK)
 # S_IFLNK is usually 0o120000
 S_IFLNK = 0o120000
 
+# Size of the blocks files are read and compressed in.
+_CHUNK_SIZE = 2**20
+
+# Compressed data of a single file is kept in memory up to this size, and
+# spilled to a temporary file beyond that.
+_SPOOL_MAX_SIZE = 16 * 2**20
+
+# Size of the fixed part of a zip local file header.
+_LOCAL_HEADER_SIZE = 30
+
+# Extensions of files whose content is typically compressed already. They are
+# stored instead of deflated with `--store-compressed`.
+_COMPRESSED_EXTENSIONS = frozenset(
+    [
+        ".7z",
+        ".bz2",
+        ".gif",
+        ".gz",
+        ".jar",
+        ".jpeg",
+        ".jpg",
+        ".npz",
+        ".png",
+        ".tgz",
+        ".whl",
+        ".xz",
+        ".zip",
+        ".zst",
+    ]
+)
+
+# With `--store-compressed`, other files are stored if deflating their first
+# `_SAMPLE_SIZE` bytes doesn't shrink them below `_STORE_RATIO` of the size.
+_SAMPLE_SIZE = 64 * 2**10
+_STORE_RATIO = 0.9
+
+# Files smaller than this aren't deduplicated; a symlink to them wouldn't be
+# meaningfully smaller.
+_DEDUP_MIN_SIZE = 4096
+
+# Name of the member that `--main-template` is expanded into.
+_MAIN_PY = "__main__.py"
+
 
 def unix_join(*parts):
     return "/".join(parts)
@@ -118,7 +168,24 @@ def normalize_zip_path(path):
     return path.replace("\\", "/")
 
 
-def _write_entry(zf, entry, compress_type, seen, platform_pathsep):
+def _zip_info(zip_path, compress_type, external_attr):
+    zi = zipfile.ZipInfo(zip_path)
+    zi.date_time = (1980, 1, 1, 0, 0, 0)
+    zi.create_system = 3  # Unix
+    zi.compress_type = compress_type
+    zi.external_attr = external_attr
+    return zi
+
+
+def _resolve_entry(entry, compress_type, seen, platform_pathsep):
+    """Computes how a manifest entry is stored in the zip.
+
+    Returns:
+        None if the entry should be skipped, otherwise a tuple of
+        `(zip_info, data, content_path)`. Exactly one of `data` (the bytes
+        to store) and `content_path` (the file to read the bytes from) is
+        not None.
+    """
     type_, is_symlink_str, zip_path, content_path = entry
     # Normalize slashes, otherwise the `seen` logic doesn't
     # work correctly.
@@ -126,28 +193,18 @@ def _write_entry(zf, entry, compress_type, seen, platform_pathsep):
     if zip_path in seen:
         # This can occur because symlink entries have precedence
         # over non-symlink entries.
-        return
+        return None
     seen.add(zip_path)
 
     if type_ == "rf-empty":
-        zi = zipfile.ZipInfo(zip_path)
-        zi.date_time = (1980, 1, 1, 0, 0, 0)
-        zi.create_system = 3  # Unix
-        zi.compress_type = compress_type
         # Create empty file
-        zi.external_attr = (0o644 & 0xFFFF) << 16
-        zf.writestr(zi, "")
-        return
+        zi = _zip_info(zip_path, compress_type, (0o644 & 0xFFFF) << 16)
+        return zi, b"", None
     if type_ == "symlink":
-        zi = zipfile.ZipInfo(zip_path)
-        zi.date_time = (1980, 1, 1, 0, 0, 0)
-        zi.create_system = 3  # Unix
-        zi.compress_type = compress_type
         target = convert_symlink_target(content_path, platform_pathsep)
         # Set permissions to 777 for symlink (standard)
-        zi.external_attr = (S_IFLNK | 0o777) << 16
-        zf.writestr(zi, target)
-        return
+        zi = _zip_info(zip_path, compress_type, (S_IFLNK | 0o777) << 16)
+        return zi, target.encode("utf-8"), None
 
     if is_symlink_str == "-1":
         if not os.path.exists(content_path):
@@ -158,24 +215,367 @@ def _write_entry(zf, entry, compress_type, seen, platform_pathsep):
     is_symlink = is_symlink_str == "1"
 
     if is_symlink:
-        zi = zipfile.ZipInfo(zip_path)
-        zi.date_time = (1980, 1, 1, 0, 0, 0)
-        zi.create_system = 3  # Unix
-        zi.compress_type = compress_type
         target = convert_symlink_target(os.readlink(content_path), platform_pathsep)
         # Set permissions to 777 for symlink (standard)
-        zi.external_attr = (S_IFLNK | 0o777) << 16
-        zf.writestr(zi, target)
+        zi = _zip_info(zip_path, compress_type, (S_IFLNK | 0o777) << 16)
+        return zi, target.encode("utf-8"), None
     else:
         st = os.stat(content_path)
-        zi = zipfile.ZipInfo(zip_path)
-        zi.date_time = (1980, 1, 1, 0, 0, 0)
-        zi.create_system = 3  # Unix
-        zi.compress_type = compress_type
         # Preserve permissions, otherwise execute is dropped.
-        zi.external_attr = (st.st_mode & 0xFFFF) << 16
-        with open(content_path, "rb") as src, zf.open(zi, "w") as dst:
+        zi = _zip_info(zip_path, compress_type, (st.st_mode & 0xFFFF) << 16)
+        return zi, None, content_path
+
+
+def _compress_level(zi):
+    # NOTE: zipfile ignores the archive's compression level for members added
+    # with an explicit ZipInfo, so the ZipInfo's level is what determines the
+    # output.
+    compress_level = getattr(zi, "compress_level", getattr(zi, "_compresslevel", None))
+    if compress_level is None:
+        return zlib.Z_DEFAULT_COMPRESSION
+    return compress_level
+
+
+def _has_compressed_extension(zi):
+    return os.path.splitext(zi.filename)[1].lower() in _COMPRESSED_EXTENSIONS
+
+
+def _should_store(zi, content_path):
+    """Tells if deflating a file is unlikely to make it smaller."""
+    if _has_compressed_extension(zi):
+        return True
+    with open(content_path, "rb") as src:
+        sample = src.read(_SAMPLE_SIZE)
+    if not sample:
+        return False
+    compressor = zlib.compressobj(_compress_level(zi), zlib.DEFLATED, -15)
+    compressed_size = len(compressor.compress(sample)) + len(compressor.flush())
+    return compressed_size >= len(sample) * _STORE_RATIO
+
+
+class _HashingReader:
+    """Wraps a binary file to compute the sha256 of the data read from it."""
+
+    def __init__(self, src):
+        self._src = src
+        self.digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        chunk = self._src.read(size)
+        self.digest.update(chunk)
+        return chunk
+
+
+def _write_entry(zf, zi, data, content_path, store_compressed, digests=None):
+    """Writes a resolved entry to the zip.
+
+    If `digests` is not None and doesn't have the sha256 digest of
+    `content_path` yet, it's computed while the file is read and stored in it.
+    """
+    if content_path is None:
+        zf.writestr(zi, data)
+        return
+    if (
+        store_compressed
+        and zi.compress_type == zipfile.ZIP_DEFLATED
+        and _should_store(zi, content_path)
+    ):
+        zi.compress_type = zipfile.ZIP_STORED
+    with open(content_path, "rb") as src, zf.open(zi, "w") as dst:
+        if digests is None or content_path in digests:
             shutil.copyfileobj(src, dst)
+        else:
+            reader = _HashingReader(src)
+            shutil.copyfileobj(reader, dst)
+            digests[content_path] = reader.digest.digest()
+
+
+def _hash_file(content_path):
+    """Returns the size and sha256 digest of a file."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(content_path, "rb") as src:
+        while chunk := src.read(_CHUNK_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+    return size, digest.digest()
+
+
+def _find_duplicates(members, dedup, jobs, store_compressed=False, digests=None):
+    """Finds files whose content is identical to that of an earlier file.
+
+    With `dedup="copy"`, a duplicate reuses the stored data of the original, so
+    they must also be stored the same way: with the same compression type and
+    level, and the same decision of `store_compressed` to store them
+    uncompressed. For identical content, that decision only differs by the
+    file extension.
+
+    The sha256 digests of the files are stored in `digests` if it's not None.
+
+    Returns:
+        A dict mapping the index of a duplicate in `members` to the index of
+        the first member with the same content.
+    """
+    file_indexes = [i for i, (_, _, path) in enumerate(members) if path is not None]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        hashes = executor.map(_hash_file, [members[i][2] for i in file_indexes])
+        first = {}
+        duplicates = {}
+        for i, (size, digest) in zip(file_indexes, hashes):
+            if digests is not None:
+                digests[members[i][2]] = digest
+            if size < _DEDUP_MIN_SIZE:
+                continue
+            zi = members[i][0]
+            if dedup == "symlink":
+                # A symlink would change the permissions of the duplicate to
+                # those of the original.
+                key = (digest, zi.external_attr)
+            else:
+                key = (
+                    digest,
+                    zi.compress_type,
+                    _compress_level(zi),
+                    store_compressed and _has_compressed_extension(zi),
+                )
+            if key in first:
+                duplicates[i] = first[key]
+            else:
+                first[key] = i
+    return duplicates
+
+
+def _write_duplicate(zf, zi, original, dedup, platform_pathsep):
+    """Writes a member with the same content as the already written `original`."""
+    if dedup == "symlink":
+        target = posixpath.relpath(original.filename, posixpath.dirname(zi.filename))
+        target = convert_symlink_target(target, platform_pathsep)
+        link = _zip_info(zi.filename, zi.compress_type, (S_IFLNK | 0o777) << 16)
+        zf.writestr(link, target)
+        return
+
+    # Copy the original's compressed data instead of compressing it again.
+    fp = zf.fp
+    fp.seek(original.header_offset)
+    header = fp.read(_LOCAL_HEADER_SIZE)
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    read_pos = original.header_offset + _LOCAL_HEADER_SIZE + name_length + extra_length
+
+    zi.compress_type = original.compress_type
+    _begin_member(zf, zi, original.CRC, original.file_size, original.compress_size)
+    write_pos = fp.tell()
+    remaining = original.compress_size
+    while remaining:
+        fp.seek(read_pos)
+        chunk = fp.read(min(remaining, _CHUNK_SIZE))
+        read_pos += len(chunk)
+        remaining -= len(chunk)
+        fp.seek(write_pos)
+        fp.write(chunk)
+        write_pos += len(chunk)
+    _end_member(zf, zi)
+
+
+def _compress_file(
+    content_path, compress_level, store_if_incompressible, compute_digest=False
+):
+    """Compresses a file the same way `zipfile` does.
+
+    Args:
+        content_path: The file to compress.
+        compress_level: The deflate compression level, or None to store the
+            file uncompressed.
+        store_if_incompressible: Whether to store the file uncompressed if
+            deflating a sample of it doesn't make it smaller.
+        compute_digest: Whether to also compute the sha256 digest of the file.
+
+    Returns:
+        A tuple of `(compress_type, crc, file_size, compressed, digest)`, where
+        `compressed` is a file object holding the member's raw data and
+        `digest` is None unless `compute_digest` is set.
+    """
+    if compress_level is not None and store_if_incompressible:
+        with open(content_path, "rb") as src:
+            sample = src.read(_SAMPLE_SIZE)
+        if sample:
+            compressor = zlib.compressobj(compress_level, zlib.DEFLATED, -15)
+            sample_size = len(compressor.compress(sample)) + len(compressor.flush())
+            if sample_size >= len(sample) * _STORE_RATIO:
+                compress_level = None
+
+    compressor = None
+    compress_type = zipfile.ZIP_STORED
+    if compress_level is not None:
+        compressor = zlib.compressobj(compress_level, zlib.DEFLATED, -15)
+        compress_type = zipfile.ZIP_DEFLATED
+    digest = hashlib.sha256() if compute_digest else None
+    crc = 0
+    file_size = 0
+    compressed = tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX_SIZE)
+    with open(content_path, "rb") as src:
+        while chunk := src.read(_CHUNK_SIZE):
+            crc = zlib.crc32(chunk, crc)
+            file_size += len(chunk)
+            if digest:
+                digest.update(chunk)
+            compressed.write(compressor.compress(chunk) if compressor else chunk)
+    if compressor:
+        compressed.write(compressor.flush())
+    return (
+        compress_type,
+        crc,
+        file_size,
+        compressed,
+        digest.digest() if digest else None,
+    )
+
+
+def _begin_member(zf, zi, crc, file_size, compress_size):
+    """Writes the local header of a member whose data is written by the caller.
+
+    Together with `_end_member`, this produces the same bytes as writing
+    the uncompressed data with `zf.open(zi, "w")` on a seekable file would.
+    """
+    # Like ZipFile.open(), which never uses zip64 extensions for a ZipInfo
+    # whose size isn't known upfront.
+    if file_size > zipfile.ZIP64_LIMIT or compress_size > zipfile.ZIP64_LIMIT:
+        raise RuntimeError(f"File too large for zip without zip64: {zi.filename}")
+    zi.flag_bits = 0
+    zi.CRC = crc
+    zi.file_size = file_size
+    zi.compress_size = compress_size
+
+    zf.fp.seek(zf.start_dir)
+    zi.header_offset = zf.fp.tell()
+    zf.fp.write(zi.FileHeader(False))
+
+
+def _end_member(zf, zi):
+    zf.start_dir = zf.fp.tell()
+    zf.filelist.append(zi)
+    zf.NameToInfo[zi.filename] = zi
+
+
+def _write_precompressed(zf, zi, crc, file_size, compressed):
+    """Appends a member whose data was already compressed to the zip."""
+    compress_size = compressed.seek(0, os.SEEK_END)
+    _begin_member(zf, zi, crc, file_size, compress_size)
+    compressed.seek(0)
+    shutil.copyfileobj(compressed, zf.fp)
+    _end_member(zf, zi)
+
+
+def _write_entries_parallel(
+    zf,
+    members,
+    duplicates,
+    dedup,
+    store_compressed,
+    platform_pathsep,
+    jobs,
+    digests=None,
+):
+    """Writes members to the zip, compressing files on a thread pool.
+
+    zlib releases the GIL while compressing, so threads are sufficient to use
+    multiple cores. Members are written in the order of `members` as soon as
+    their data is ready, and the number of files being compressed at the same
+    time is bounded to limit memory usage.
+
+    If `digests` is not None, the sha256 digests of the files that aren't in
+    it yet are computed while compressing them and stored in it.
+    """
+    pending = collections.deque()
+
+    def write_next():
+        i, future = pending.popleft()
+        zi, data, content_path = members[i]
+        if i in duplicates:
+            original = members[duplicates[i]][0]
+            _write_duplicate(zf, zi, original, dedup, platform_pathsep)
+        elif future is None:
+            zf.writestr(zi, data)
+        else:
+            zi.compress_type, crc, file_size, compressed, digest = future.result()
+            if digest is not None:
+                digests[content_path] = digest
+            with compressed:
+                _write_precompressed(zf, zi, crc, file_size, compressed)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        for i, (zi, data, content_path) in enumerate(members):
+            future = None
+            if content_path is not None and i not in duplicates:
+                compress_level = _compress_level(zi)
+                if store_compressed and _has_compressed_extension(zi):
+                    compress_level = None
+                future = executor.submit(
+                    _compress_file,
+                    content_path,
+                    compress_level,
+                    store_compressed,
+                    digests is not None and content_path not in digests,
+                )
+            pending.append((i, future))
+            if len(pending) > jobs * 2:
+                write_next()
+        while pending:
+            write_next()
+
+
+def compute_app_hash(manifest_path, digests):
+    """Computes the hash of the application files that `__main__.py` embeds.
+
+    The hash covers the runfiles entries of the manifest (all but `regular`
+    entries) and the content of the files they refer to.
+
+    Args:
+        manifest_path: The manifest the zip is created from.
+        digests: dict of content path to the sha256 digest of files that
+            were already read while writing the zip. Other files are read
+            and added to it.
+
+    Returns:
+        The hex digest identifying the application files.
+    """
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest_lines = [
+            line
+            for line in f.read().splitlines()
+            if line.strip() and not line.startswith("regular|")
+        ]
+
+    h = hashlib.sha256()
+    for line in sorted(manifest_lines):
+        type_, _, rest = line.partition("|")
+        h.update(rest.encode("utf-8"))
+        if type_ == "rf-empty" or type_ == "symlink":
+            continue
+
+        parts = rest.split("|")
+        is_symlink_str = parts[0]
+        path = parts[-1]
+        if is_symlink_str == "-1":
+            is_symlink = not os.path.exists(path)
+        else:
+            is_symlink = is_symlink_str == "1"
+
+        if is_symlink:
+            h.update(os.readlink(path).encode("utf-8"))
+        else:
+            if path not in digests:
+                digests[path] = _hash_file(path)[1]
+            h.update(digests[path])
+    return h.hexdigest()
+
+
+def _write_main_py(zf, compress_type, template_path, substitutions):
+    with open(template_path, "r", encoding="utf-8") as f:
+        content = f.read()
+    for key, val in substitutions.items():
+        content = content.replace(key, val)
+    zi = _zip_info(_MAIN_PY, compress_type, 0o100644 << 16)
+    zf.writestr(zi, content.encode("utf-8"))
 
 
 def create_zip(
@@ -187,20 +587,77 @@ def create_zip(
     legacy_external_runfiles,
     runfiles_dir,
     platform_pathsep,
+    jobs=1,
+    store_compressed=False,
+    dedup="none",
+    main_template=None,
+    main_substitutions=None,
 ):
+    """Creates a zip from a manifest.
+
+    If `main_template` is set, `__main__.py` is created by expanding it with
+    `main_substitutions` and `%APP_HASH%`. The hash is computed from the same
+    reads of the files that store them in the zip, so that each file is only
+    read once.
+    """
     compress_type = zipfile.ZIP_STORED if compress_level == 0 else zipfile.ZIP_DEFLATED
     zf_level = compress_level if compress_level != 0 else None
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    # Storing is only a choice when compressing.
+    store_compressed = store_compressed and compress_type == zipfile.ZIP_DEFLATED
 
     entries = read_manifest(
         manifest_path, workspace_name, legacy_external_runfiles, runfiles_dir
     )
 
     seen = set()
+    members = []
+    for entry in entries:
+        resolved = _resolve_entry(entry, compress_type, seen, platform_pathsep)
+        if resolved is not None:
+            members.append(resolved)
+
+    digests = None
+    if main_template:
+        if any(zi.filename == _MAIN_PY for zi, _, _ in members):
+            raise ValueError(
+                f"{_MAIN_PY} is both in the manifest and created from --main-template"
+            )
+        digests = {}
+
+    duplicates = {}
+    if dedup != "none":
+        duplicates = _find_duplicates(members, dedup, jobs, store_compressed, digests)
+
     with zipfile.ZipFile(
         output_zip, "w", compress_type, allowZip64=True, compresslevel=zf_level
     ) as zf:
-        for entry in entries:
-            _write_entry(zf, entry, compress_type, seen, platform_pathsep)
+        # Stored entries need no compression, so there's nothing to
+        # parallelize for them.
+        if jobs > 1 and compress_type == zipfile.ZIP_DEFLATED:
+            _write_entries_parallel(
+                zf,
+                members,
+                duplicates,
+                dedup,
+                store_compressed,
+                platform_pathsep,
+                jobs,
+                digests,
+            )
+        else:
+            for i, (zi, data, content_path) in enumerate(members):
+                if i in duplicates:
+                    original = members[duplicates[i]][0]
+                    _write_duplicate(zf, zi, original, dedup, platform_pathsep)
+                else:
+                    _write_entry(zf, zi, data, content_path, store_compressed, digests)
+
+        if main_template:
+            substitutions = dict(main_substitutions or {})
+            substitutions["%APP_HASH%"] = compute_app_hash(manifest_path, digests)
+            _write_main_py(zf, compress_type, main_template, substitutions)
 
 
 def main():
@@ -265,6 +722,40 @@ into account.
     parser.add_argument(
         "--target-platform-pathsep", help="The path separator for the target platform"
     )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of threads to compress files with (0 for one per CPU). "
+        + "The output is identical regardless of the value.",
+    )
+    parser.add_argument(
+        "--store-compressed",
+        action="store_true",
+        help="Store files uncompressed if deflating them is unlikely to make "
+        + "them smaller, based on their extension or on trial-compressing the "
+        + "start of the file.",
+    )
+    parser.add_argument(
+        "--dedup",
+        default="none",
+        choices=["none", "copy", "symlink"],
+        help="How to store files whose content is identical to an earlier file: "
+        + "`copy` reuses the compressed data of the earlier file, `symlink` stores "
+        + "a relative symlink to the earlier file.",
+    )
+    parser.add_argument(
+        "--main-template",
+        help="Template to create `__main__.py` from. `%%APP_HASH%%` in it is "
+        + "replaced with a hash of the files in the manifest, which is computed "
+        + "while they are added to the zip.",
+    )
+    parser.add_argument(
+        "--main-substitution",
+        action="append",
+        default=[],
+        help="A `KEY=VALUE` substitution to apply to `--main-template`.",
+    )
     args = parser.parse_args()
 
     try:
@@ -276,6 +767,11 @@ into account.
             legacy_external_runfiles=args.legacy_external_runfiles == "1",
             runfiles_dir=args.runfiles_dir,
             platform_pathsep=args.target_platform_pathsep,
+            jobs=args.jobs,
+            store_compressed=args.store_compressed,
+            dedup=args.dedup,
+            main_template=args.main_template,
+            main_substitutions=dict(s.split("=", 1) for s in args.main_substitution),
         )
     except Exception as e:
         e.add_note(f"Error creating zip {args.output}")
@@ -16,18 +16,35 @@ from __future__ import annotations
 
 import argparse
 import base64
+import collections
+import concurrent.futures
 import csv
 import hashlib
 import io
+import itertools
 import os
 import re
+import shutil
 import stat
+import struct
 import sys
+import tempfile
 import zipfile
+import zlib
 from collections.abc import Sequence
 from pathlib import Path
 
 _ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+_BLOCK_SIZE = 2**20
+# Compressed data up to this size is kept in memory until it's written.
+_SPOOL_MAX_SIZE = 16 * 2**20
+# Filenames with these need quoting (or, for surrounding whitespace,
+# stripping) in the RECORD file.
+_RECORD_SPECIAL_CHARS = re.compile(r'[,"\r\n]|^\s|\s$')
+# Number of RECORD rows to format before writing them to the archive.
+_RECORD_ROWS_PER_BLOCK = 1024
+# A directory to keep the previous build of each wheel in, for reuse.
+_INCREMENTAL_DIR_ENV = "RULES_PYTHON_WHEEL_INCREMENTAL_DIR"
 
 
 def commonpath(path1, path2):
@@ -127,6 +144,98 @@ def arcname_from(
     return add_path_prefix + normalized_arcname
 
 
+def _hash_file(real_filename):
+    """Returns the `(crc, size, hash)` of a file, where hash is its sha256."""
+    hash = hashlib.sha256()
+    crc = 0
+    size = 0
+    with open(real_filename, "rb") as fsrc:
+        while block := fsrc.read(_BLOCK_SIZE):
+            hash.update(block)
+            crc = zlib.crc32(block, crc)
+            size += len(block)
+    return crc, size, hash
+
+
+def _prepare_file(real_filename, compress_type, previous):
+    """Compresses a file, unless the previous wheel's member can be reused.
+
+    Args:
+        real_filename: The file to add.
+        compress_type: The compression of the wheel.
+        previous: None, or a `(zinfo, digest)` tuple of the member for the
+            same name in the previous wheel, where `digest` is the member's
+            sha256 digest from its RECORD.
+
+    Returns:
+        A tuple of `(crc, size, compressed, hash)`, like `_compress_file()`,
+        except that `compressed` is None if the previous member has the same
+        content and can be copied as-is.
+    """
+    if previous is not None:
+        zinfo, digest = previous
+        crc, size, hash = _hash_file(real_filename)
+        if crc == zinfo.CRC and size == zinfo.file_size and hash.digest() == digest:
+            return crc, size, None, hash
+    return _compress_file(real_filename, compress_type)
+
+
+def _compress_file(real_filename, compress_type):
+    """Compresses a file the same way zipfile does, and hashes it.
+
+    Returns:
+        A tuple of `(crc, size, compressed, hash)`, where `compressed` is a
+        file object holding the member's data and `hash` is its sha256.
+    """
+    compressor = None
+    if compress_type == zipfile.ZIP_DEFLATED:
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    hash = hashlib.sha256()
+    crc = 0
+    size = 0
+    compressed = tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX_SIZE)
+    with open(real_filename, "rb") as fsrc:
+        while block := fsrc.read(_BLOCK_SIZE):
+            hash.update(block)
+            crc = zlib.crc32(block, crc)
+            size += len(block)
+            compressed.write(compressor.compress(block) if compressor else block)
+    if compressor:
+        compressed.write(compressor.flush())
+    return crc, size, compressed, hash
+
+
+class _RecordQuoter:
+    """Quotes filenames for the RECORD file.
+
+    Filenames that need no quoting are returned as-is. Others go through a
+    single csv writer, which is reused for all of them.
+    """
+
+    def __init__(self, quote_all: bool):
+        # Some RECORDs like torch have *all* filenames quoted and we must
+        # minimize diff. Otherwise, we quote only when necessary (e.g. for
+        # filenames with commas).
+        self._quote_all = quote_all
+        self._buf = io.StringIO()
+        self._writer = csv.writer(
+            self._buf, quoting=csv.QUOTE_ALL if quote_all else csv.QUOTE_MINIMAL
+        )
+
+    def quote(self, filename: str) -> str:
+        filename = filename.lstrip("/")
+        if (
+            filename
+            and not self._quote_all
+            and not _RECORD_SPECIAL_CHARS.search(filename)
+        ):
+            return filename
+        self._buf.seek(0)
+        self._buf.truncate()
+        self._writer.writerow([filename])
+        return self._buf.getvalue().strip()
+
+
 class _WhlFile(zipfile.ZipFile):
     def __init__(
         self,
@@ -138,9 +247,17 @@ class _WhlFile(zipfile.ZipFile):
         add_path_prefix=None,
         compression=zipfile.ZIP_DEFLATED,
         quote_all_filenames: bool = False,
+        jobs: int = 1,
+        previous_wheel=None,
         **kwargs,
     ):
         self._distribution_prefix = distribution_prefix
+        # Number of threads to hash and compress files on in add_files().
+        self._jobs = jobs
+        # The previous wheel whose unchanged members add_files() copies, and
+        # its members as {arcname: (zinfo, sha256 digest)}.
+        self._previous_zip = None
+        self._previous_members = {}
 
         self._strip_path_prefixes = strip_path_prefixes or []
         self._add_path_prefix = add_path_prefix or ""
@@ -150,8 +267,65 @@ class _WhlFile(zipfile.ZipFile):
         # some wheels like torch that have quoted filenames in their RECORD).
         self.quote_all_filenames = quote_all_filenames
 
+        if previous_wheel is not None:
+            self._load_previous_wheel(previous_wheel, compression)
+            if (
+                self._previous_zip is not None
+                and isinstance(filename, (str, os.PathLike))
+                and os.path.exists(filename)
+                and os.path.samefile(previous_wheel, filename)
+            ):
+                # Writing the wheel truncates the file, which is (or is a hard
+                # link to) the previous wheel, so replace it instead.
+                try:
+                    os.unlink(filename)
+                except OSError:
+                    self._previous_zip.close()
+                    self._previous_zip = None
+                    self._previous_members = {}
         super().__init__(filename, mode=mode, compression=compression, **kwargs)
 
+    def _load_previous_wheel(self, previous_wheel, compression):
+        """Indexes the members of a previous build of the wheel for reuse.
+
+        Members are matched by name, and their RECORD digest and CRC are
+        compared with the new file's before reusing them. An unreadable
+        previous wheel is ignored.
+        """
+        try:
+            previous_zip = zipfile.ZipFile(previous_wheel)
+        except (OSError, zipfile.BadZipFile):
+            return
+        records = [
+            name
+            for name in previous_zip.namelist()
+            if name.endswith(".dist-info/RECORD") and name.count("/") == 1
+        ]
+        if len(records) != 1:
+            previous_zip.close()
+            return
+        self._previous_zip = previous_zip
+        with previous_zip.open(records[0]) as f:
+            rows = csv.reader(io.TextIOWrapper(f, encoding="utf-8", newline=""))
+            for row in rows:
+                if len(row) != 3 or not row[1].startswith("sha256="):
+                    continue
+                name, digest, _ = row
+                digest = digest.removeprefix("sha256=")
+                digest = base64.urlsafe_b64decode(digest + "=" * (-len(digest) % 4))
+                try:
+                    zinfo = previous_zip.getinfo(name)
+                except KeyError:
+                    continue
+                if zinfo.compress_type == compression:
+                    self._previous_members[name] = (zinfo, digest)
+
+    def close(self):
+        if self._previous_zip is not None:
+            self._previous_zip.close()
+            self._previous_zip = None
+        super().close()
+
     def distinfo_path(self, basename):
         return f"{self._distribution_prefix}.dist-info/{basename}"
 
@@ -170,12 +344,7 @@ class _WhlFile(zipfile.ZipFile):
                 )
             return
 
-        arcname = arcname_from(
-            package_filename,
-            distribution_prefix=self._distribution_prefix,
-            strip_path_prefixes=self._strip_path_prefixes,
-            add_path_prefix=self._add_path_prefix,
-        )
+        arcname = self._arcname(package_filename)
         zinfo = self._zipinfo(arcname)
 
         # Write file to the zip archive while computing the hash and length
@@ -184,7 +353,7 @@ class _WhlFile(zipfile.ZipFile):
         with open(real_filename, "rb") as fsrc:
             with self.open(zinfo, "w", force_zip64=True) as fdst:
                 while True:
-                    block = fsrc.read(2**20)
+                    block = fsrc.read(_BLOCK_SIZE)
                     if not block:
                         break
                     fdst.write(block)
@@ -193,6 +362,128 @@ class _WhlFile(zipfile.ZipFile):
 
         self._add_to_record(arcname, self._serialize_digest(hash), size)
 
+    def add_files(self, files):
+        """Add (package_filename, real_filename) pairs to the distribution.
+
+        The files are added in the given order. With more than one job, they
+        are hashed and compressed on a thread pool (zlib and hashlib release
+        the GIL), and the compressed data is written in order. The result is
+        byte-identical to adding them one by one with add_file().
+
+        With a previous wheel, files whose content is unchanged are only
+        hashed, and the previous wheel's compressed data is copied as-is.
+        """
+        if self._jobs <= 1 and not self._previous_members:
+            for package_filename, real_filename in files:
+                self.add_file(package_filename, real_filename)
+            return
+
+        pending = collections.deque()
+
+        def write_next():
+            arcname, future = pending.popleft()
+            crc, size, compressed, hash = future.result()
+            zinfo = self._zipinfo(arcname)
+            if compressed is None:
+                previous_zinfo = self._previous_members[arcname][0]
+                self._write_member(
+                    zinfo,
+                    crc,
+                    size,
+                    previous_zinfo.compress_size,
+                    self._open_previous_data(previous_zinfo),
+                )
+            else:
+                with compressed:
+                    compress_size = compressed.seek(0, os.SEEK_END)
+                    compressed.seek(0)
+                    self._write_member(zinfo, crc, size, compress_size, compressed)
+            self._add_to_record(arcname, self._serialize_digest(hash), size)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self._jobs) as executor:
+            for package_filename, real_filename in self._expand_dirs(files):
+                arcname = self._arcname(package_filename)
+                future = executor.submit(
+                    _prepare_file,
+                    real_filename,
+                    self.compression,
+                    self._previous_members.get(arcname),
+                )
+                pending.append((arcname, future))
+                # Bound the number of compressed files held at the same time.
+                if len(pending) > self._jobs * 2:
+                    write_next()
+            while pending:
+                write_next()
+
+    def _expand_dirs(self, files):
+        """Yields the files in files, replacing directories with their files.
+
+        The order matches the order add_file() adds them in.
+        """
+        for package_filename, real_filename in files:
+            if os.path.isdir(real_filename):
+                yield from self._expand_dirs(
+                    (f"{package_filename}/{name}", f"{real_filename}/{name}")
+                    for name in sorted(os.listdir(real_filename))
+                )
+            else:
+                yield package_filename, real_filename
+
+    def _open_previous_data(self, zinfo):
+        """Returns the previous wheel's file, positioned at a member's data."""
+        fp = self._previous_zip.fp
+        fp.seek(zinfo.header_offset)
+        header = fp.read(zipfile.sizeFileHeader)
+        if header[:4] != zipfile.stringFileHeader:
+            raise zipfile.BadZipFile(f"Bad local header for {zinfo.filename}")
+        # The file name and extra field lengths are the last fields of the
+        # local header.
+        name_length, extra_length = struct.unpack("<HH", header[-4:])
+        fp.seek(zinfo.header_offset + len(header) + name_length + extra_length)
+        return fp
+
+    def _write_member(self, zinfo, crc, file_size, compress_size, data):
+        """Appends a member whose data is already compressed.
+
+        This produces the same bytes as writing the uncompressed data with
+        `self.open(zinfo, "w", force_zip64=True)` does.
+
+        Args:
+            zinfo: The member's ZipInfo.
+            crc: The CRC-32 of the uncompressed data.
+            file_size: The size of the uncompressed data.
+            compress_size: The size of the compressed data.
+            data: A file object to copy `compress_size` bytes of compressed
+                data from.
+        """
+        zinfo.flag_bits = 0
+        zinfo.CRC = crc
+        zinfo.file_size = file_size
+        zinfo.compress_size = compress_size
+
+        self.fp.seek(self.start_dir)
+        zinfo.header_offset = self.fp.tell()
+        self.fp.write(zinfo.FileHeader(True))
+        remaining = compress_size
+        while remaining:
+            block = data.read(min(remaining, _BLOCK_SIZE))
+            if not block:
+                raise zipfile.BadZipFile(f"Truncated data for {zinfo.filename}")
+            self.fp.write(block)
+            remaining -= len(block)
+        self.start_dir = self.fp.tell()
+        self.filelist.append(zinfo)
+        self.NameToInfo[zinfo.filename] = zinfo
+
+    def _arcname(self, package_filename):
+        return arcname_from(
+            package_filename,
+            distribution_prefix=self._distribution_prefix,
+            strip_path_prefixes=self._strip_path_prefixes,
+            add_path_prefix=self._add_path_prefix,
+        )
+
     def add_string(self, filename, contents):
         """Add given 'contents' as filename to the distribution."""
         if isinstance(contents, str):
@@ -235,25 +526,31 @@ class _WhlFile(zipfile.ZipFile):
 
     def _quote_filename(self, filename: str) -> str:
         """Return a possibly quoted filename for RECORD file."""
-        filename = filename.lstrip("/")
-        # Some RECORDs like torch have *all* filenames quoted and we must minimize diff.
-        # Otherwise, we quote only when necessary (e.g. for filenames with commas).
-        quoting = csv.QUOTE_ALL if self.quote_all_filenames else csv.QUOTE_MINIMAL
-        with io.StringIO() as buf:
-            csv.writer(buf, quoting=quoting).writerow([filename])
-            return buf.getvalue().strip()
-
-    def add_recordfile(self) -> str:
-        """Write RECORD file to the distribution."""
+        return _RecordQuoter(self.quote_all_filenames).quote(filename)
+
+    def add_recordfile(self) -> None:
+        """Write RECORD file to the distribution.
+
+        The rows are formatted and written to the archive in blocks, rather
+        than building the whole file in memory first.
+        """
         record_path = self.distinfo_path("RECORD")
-        entries = self._record + [(record_path, "", "")]
-        entries = [
-            (self._quote_filename(fname), digest, size)
-            for fname, digest, size in entries
-        ]
-        contents = "\n".join(",".join(entry) for entry in entries) + "\n"
-        self.add_string(record_path, contents)
-        return contents
+        quoter = _RecordQuoter(self.quote_all_filenames)
+        rows = itertools.chain(self._record, [(record_path, "", "")])
+        hash = hashlib.sha256()
+        size = 0
+        with self.open(self._zipinfo(record_path), "w") as dest:
+            while lines := [
+                f"{quoter.quote(filename)},{digest},{file_size}\n"
+                for filename, digest, file_size in itertools.islice(
+                    rows, _RECORD_ROWS_PER_BLOCK
+                )
+            ]:
+                block = "".join(lines).encode("utf-8", "surrogateescape")
+                hash.update(block)
+                dest.write(block)
+                size += len(block)
+        self._add_to_record(record_path, self._serialize_digest(hash), size)
 
 
 class WheelMaker(object):
@@ -269,6 +566,8 @@ class WheelMaker(object):
         outfile=None,
         strip_path_prefixes=None,
         add_path_prefix=None,
+        jobs=1,
+        previous_wheel=None,
     ):
         self._name = name
         self._version = normalize_pep440(version)
@@ -280,6 +579,8 @@ class WheelMaker(object):
         self._strip_path_prefixes = strip_path_prefixes
         self._add_path_prefix = add_path_prefix
         self._compress = compress
+        self._jobs = jobs
+        self._previous_wheel = previous_wheel
         self._wheelname_fragment_distribution_name = escape_filename_distribution_name(
             self._name
         )
@@ -305,6 +606,8 @@ class WheelMaker(object):
             compression=(
                 zipfile.ZIP_DEFLATED if self._compress else zipfile.ZIP_STORED
             ),
+            jobs=self._jobs,
+            previous_wheel=self._previous_wheel,
         )
         return self
 
@@ -341,6 +644,10 @@ class WheelMaker(object):
         """Add given file to the distribution."""
         self.whlfile.add_file(package_filename, real_filename)
 
+    def add_files(self, files):
+        """Add (package_filename, real_filename) pairs to the distribution."""
+        self.whlfile.add_files(files)
+
     def add_wheelfile(self):
         """Write WHEEL file to the distribution"""
         # TODO(pstradomski): Support non-purelib wheels.
@@ -472,6 +779,21 @@ def parse_args() -> argparse.Namespace:
         action="store_true",
         help="Disable compression of the final archive",
     )
+    output_group.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of threads to hash and compress files on. 0 means the "
+        "number of CPUs. The output is identical regardless of the value.",
+    )
+    output_group.add_argument(
+        "--previous_wheel",
+        type=str,
+        default=None,
+        help="A previous build of the wheel. The compressed data of files "
+        "whose content is unchanged is copied from it instead of compressing "
+        "them again. The output is identical regardless of this flag.",
+    )
     output_group.add_argument(
         "--name_file",
         type=Path,
@@ -562,6 +884,48 @@ def _parse_file_pairs(content: list[str]) -> list[list[str]]:
     return [i.split(";", maxsplit=1) for i in content or []]
 
 
+def _incremental_wheel_path(out: str) -> str | None:
+    """Returns where the previous build of a wheel is kept, if enabled.
+
+    Bazel deletes the outputs of an action before running it, so a copy of
+    each wheel is kept in the directory named by `_INCREMENTAL_DIR_ENV` to
+    reuse as the previous wheel of the next build.
+
+    The copy is keyed by the exec-root-relative `out` path. It isn't made
+    absolute because, when sandboxed, the absolute path contains the
+    per-action sandbox directory, which changes between builds.
+    """
+    incremental_dir = os.environ.get(_INCREMENTAL_DIR_ENV)
+    if not incremental_dir:
+        return None
+    key = hashlib.sha256(out.encode("utf-8")).hexdigest()
+    return os.path.join(incremental_dir, key[:32] + ".whl")
+
+
+def _save_incremental_wheel(wheel: str, path: str) -> None:
+    """Atomically stores a copy of the wheel as the next previous wheel."""
+    # The copy is only an optimization for the next build, so a failure to
+    # write it must not fail the build.
+    tmp_path = None
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        os.close(fd)
+        os.unlink(tmp_path)
+        try:
+            os.link(wheel, tmp_path)
+        except OSError:
+            shutil.copyfile(wheel, tmp_path)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(
+            f"WARNING: could not save the wheel for incremental builds in {path}: {e}",
+            file=sys.stderr,
+        )
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
 def main() -> None:
     arguments = parse_args()
 
@@ -599,6 +963,13 @@ def main() -> None:
     else:
         version = arguments.version
 
+    previous_wheel = arguments.previous_wheel
+    incremental_path = _incremental_wheel_path(arguments.out) if arguments.out else None
+    if previous_wheel is None and incremental_path:
+        previous_wheel = incremental_path
+    if previous_wheel and not os.path.exists(previous_wheel):
+        previous_wheel = None
+
     with WheelMaker(
         name=name,
         version=version,
@@ -610,9 +981,10 @@ def main() -> None:
         strip_path_prefixes=strip_prefixes,
         add_path_prefix=arguments.path_prefix,
         compress=not arguments.no_compress,
+        jobs=arguments.jobs or os.cpu_count() or 1,
+        previous_wheel=previous_wheel,
     ) as maker:
-        for package_filename, real_filename in all_files:
-            maker.add_file(package_filename, real_filename)
+        maker.add_files(all_files)
         maker.add_wheelfile()
 
         description = None
@@ -693,6 +1065,9 @@ def main() -> None:
         # the correct name.
         arguments.name_file.write_text(maker.wheelname())
 
+    if incremental_path:
+        _save_incremental_wheel(arguments.out, incremental_path)
+
 
 if __name__ == "__main__":
     main()